@@ -0,0 +1,5 @@
+"""
+Offline benchmarks for the SocratIQ Streamlit client
+
+Run with `python -m benchmarks.run_benchmarks`; see README_STREAMLIT.md.
+"""
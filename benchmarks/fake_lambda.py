@@ -0,0 +1,183 @@
+"""
+Local stand-in for the AWS Lambda client used by streamlit_app.py
+
+Serves recorded or synthetic VERA/FINN/NORA/CLIA/Sophie payloads in the same
+{"statusCode": ..., "body": "<json>"} envelope the agent Lambdas return, after a
+configurable simulated latency. The app picks it up through
+SOCRATIQ_LAMBDA_CLIENT_FACTORY=benchmarks.fake_lambda:create_client.
+"""
+
+import io
+import json
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, Optional
+
+from botocore.exceptions import ClientError
+
+AGENT_KEYS = ("VERA", "FINN", "NORA", "CLIA", "Sophie")
+
+
+@dataclass
+class LatencyModel:
+    """Log-normal service latency with optional error, throttle and cold start injection"""
+    median_ms: float = 50.0
+    sigma: float = 0.5
+    error_rate: float = 0.0
+    throttle_rate: float = 0.0
+    cold_start_ms: float = 0.0  # Added to the first call and to calls after cold_after_s idle
+
+    def sample_ms(self, rng: random.Random) -> float:
+        return self.median_ms * rng.lognormvariate(0.0, self.sigma)
+
+
+def agent_for(function_name: str) -> str:
+    """Agent key served by a SocratIQ function name"""
+    for agent in AGENT_KEYS:
+        if agent.lower() in function_name.lower():
+            return agent
+    return "VERA"
+
+
+def synthetic_payload(agent: str, query: str, rng: random.Random) -> Dict[str, Any]:
+    """A response body shaped like the real agent (or Sophie) output"""
+    paragraph = (
+        f"{agent} analysis of '{query[:60]}': evidence from regulatory filings, trial registries "
+        "and peer-reviewed literature supports a staged development plan with explicit risk gates. "
+    )
+    sources = [
+        {
+            "title": f"{agent} corpus document {i}",
+            "url": f"s3://socratiq-{agent.lower()}-corpus-prod/documents/doc-{i}.md",
+            "excerpt": paragraph * 2,
+            "relevanceScore": round(rng.uniform(0.2, 1.0), 3)
+        }
+        for i in range(rng.randint(3, 8))
+    ]
+    timestamp = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+    if agent == "Sophie":
+        return {
+            "recommendation": paragraph * 6,
+            "mechanisticAnalysis": paragraph * 8,
+            "deterministicScoring": paragraph * 8,
+            "probabilisticRisk": paragraph * 8,
+            "agentContributions": {name: paragraph * 5 for name in AGENT_KEYS[:4]},
+            "confidence": round(rng.uniform(0.6, 0.95), 3),
+            "sources": sources * 3,
+            "conflicts": [f"Conflict {i} between agent recommendations" for i in range(rng.randint(0, 3))],
+            "timestamp": timestamp
+        }
+
+    return {
+        "response": paragraph * 8,
+        "confidence": round(rng.uniform(0.5, 0.95), 3),
+        "sources": sources,
+        "timestamp": timestamp
+    }
+
+
+class FakeLambdaClient:
+    """Thread-safe fake of the boto3 Lambda client's invoke APIs"""
+
+    def __init__(
+        self,
+        latency: Optional[Dict[str, LatencyModel]] = None,
+        payload_dir: Optional[str] = None,
+        streaming: bool = False,
+        seed: int = 0,
+        cold_after_s: float = 600.0
+    ):
+        self.latency = latency or {}
+        self.streaming = streaming
+        self.cold_after_s = cold_after_s
+        self.calls = 0
+        self.warmup_pings = 0
+        self._last_call: Dict[str, float] = {}
+        self._recorded: Dict[str, Dict[str, Any]] = {}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+        if payload_dir:
+            for agent in AGENT_KEYS:
+                path = os.path.join(payload_dir, f"{agent}.json")
+                if os.path.exists(path):
+                    with open(path) as f:
+                        self._recorded[agent] = json.load(f)
+
+    def invoke(self, FunctionName: str, Payload: str, InvocationType: str = "RequestResponse", **kwargs: Any) -> Dict[str, Any]:
+        envelope = self._serve(FunctionName, Payload)
+        return {"StatusCode": 200, "Payload": io.BytesIO(json.dumps(envelope).encode("utf-8"))}
+
+    def invoke_with_response_stream(self, FunctionName: str, Payload: str, **kwargs: Any) -> Dict[str, Any]:
+        if not self.streaming:
+            raise ClientError(
+                {"Error": {"Code": "InvalidRequestContentException", "Message": "Streaming disabled in fake"}},
+                "InvokeWithResponseStream"
+            )
+        envelope = self._serve(FunctionName, Payload)
+        return {"EventStream": self._stream(envelope)}
+
+    def _serve(self, function_name: str, payload: str) -> Dict[str, Any]:
+        agent = agent_for(function_name)
+        model = self.latency.get(agent) or self.latency.get("*") or LatencyModel()
+        request = json.loads(payload)
+        query = request.get("query", "")
+
+        with self._lock:
+            now = time.monotonic()
+            last_call = self._last_call.get(function_name)
+            self._last_call[function_name] = now
+            cold_ms = model.cold_start_ms if last_call is None or now - last_call > self.cold_after_s else 0.0
+
+            warmup = bool(request.get("warmup"))
+            if warmup:
+                self.warmup_pings += 1
+            else:
+                self.calls += 1
+                latency_ms = model.sample_ms(self._rng) + cold_ms
+                roll = self._rng.random()
+                body = self._recorded.get(agent) or synthetic_payload(agent, query, self._rng)
+
+        # Keep-warm pings skip the agent's work, as the real handlers do
+        if warmup:
+            time.sleep(cold_ms / 1000)
+            return {"statusCode": 200, "body": json.dumps({"warm": True})}
+
+        time.sleep(latency_ms / 1000)
+
+        if roll < model.throttle_rate:
+            raise ClientError(
+                {"Error": {"Code": "TooManyRequestsException", "Message": "Rate exceeded"}},
+                "Invoke"
+            )
+        if roll < model.throttle_rate + model.error_rate:
+            return {"statusCode": 500, "body": json.dumps({"error": "Injected failure"})}
+
+        return {"statusCode": 200, "body": json.dumps({**body, "benchmarkLatencyMs": latency_ms})}
+
+    @staticmethod
+    def _stream(envelope: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        if envelope["statusCode"] != 200:
+            yield {"PayloadChunk": {"Payload": json.dumps(envelope).encode("utf-8")}}
+        else:
+            for section, value in json.loads(envelope["body"]).items():
+                yield {"PayloadChunk": {"Payload": (json.dumps({"section": section, "value": value}) + "\n").encode("utf-8")}}
+        yield {"InvokeComplete": {}}
+
+
+_settings: Dict[str, Any] = {}
+
+
+def configure(**settings: Any) -> None:
+    """Set the FakeLambdaClient arguments used by create_client()"""
+    _settings.clear()
+    _settings.update(settings)
+
+
+def create_client() -> FakeLambdaClient:
+    """Factory referenced by SOCRATIQ_LAMBDA_CLIENT_FACTORY"""
+    return FakeLambdaClient(**_settings)
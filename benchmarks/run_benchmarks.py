@@ -0,0 +1,400 @@
+"""
+Offline benchmark harness for the SocratIQ Streamlit client
+
+Swaps the app's Lambda client for benchmarks.fake_lambda and measures:
+
+- invoke: the app's invoke layer (AgentClient.call) driven from a thread pool
+  at a range of concurrency levels; throughput, latency percentiles and client
+  overhead (observed latency minus the fake's simulated service time)
+- client: the same measurements through AsyncAgentClient.gather, plus the
+  import time of socratiq.client in a fresh interpreter
+- sessions: headless Streamlit sessions driven through AppTest (agent chat,
+  TPP generation, history); rerun time per interaction and memory per session
+- reruns: a session whose history already holds 100 entries; full rerun time
+  per page, and p95 run time of the fragment panels (Sophie, Agent Chat)
+  excluding agent calls, which is what a widget interaction inside a panel
+  costs the app itself in a browser session. The fragment p95 must stay under
+  streamlit_app.PANEL_RERUN_TARGET_MS; p95 with the calls is reported next to it
+- startup: fresh interpreters running benchmarks/startup.py; streamlit import
+  time, time to first paint of the Home page and the following rerun, next to
+  the boto3 import and client build time that the app defers
+
+Usage:
+    python -m benchmarks.run_benchmarks                    # run and print results
+    python -m benchmarks.run_benchmarks --check            # fail on regression vs benchmarks/baseline.json
+    python -m benchmarks.run_benchmarks --update-baseline  # rewrite the checked-in baseline
+"""
+
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(ROOT, "streamlit_app.py")
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# Metrics compared by --check: (dotted path, True if higher is better, absolute slack)
+REGRESSION_METRICS = (
+    ("invoke.*.throughput_rps", True, 0.0),
+    ("invoke.*.overhead_p95_ms", False, 2.0),
+    ("client.c*.throughput_rps", True, 0.0),
+    ("client.c*.overhead_p95_ms", False, 2.0),
+    ("client.import_ms", False, 20.0),
+    ("sessions.rerun_p95_ms", False, 20.0),
+    ("sessions.memory_per_session_kb", False, 256.0),
+    ("reruns.*_p95_ms", False, 20.0),
+    ("startup.first_paint_ms", False, 150.0),
+    ("startup.rerun_ms", False, 30.0)
+)
+
+
+def percentile(values: List[float], q: float) -> float:
+    from socratiq.metrics import percentile as nearest_rank
+    return nearest_rank(values, q)
+
+
+def timed(fn: Callable[[], Any]) -> float:
+    started = time.perf_counter()
+    fn()
+    return (time.perf_counter() - started) * 1000
+
+
+def bench_invoke(app: Any, concurrency: int, requests: int) -> Dict[str, Any]:
+    """Drive AgentClient.call with unique queries (no cache hits or coalescing) from concurrency threads"""
+    targets = [(agent["function"], "Agent") for agent in app.AGENTS.values()]
+    targets.append((app.SOPHIE_CONFIG["function"], "Sophie"))
+
+    def one(i: int) -> Tuple[float, float, bool]:
+        function_name, caller = targets[i % len(targets)]
+        started = time.perf_counter()
+        response = app.agent_client.call(function_name, f"benchmark query c{concurrency} #{i}", "bench", caller, use_cache=False)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        return elapsed_ms, elapsed_ms - response.get("benchmarkLatencyMs", 0.0), "error" in response
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(requests)))
+    wall_s = time.perf_counter() - started
+
+    latencies = [r[0] for r in results]
+    overheads = [r[1] for r in results]
+    return {
+        "requests": requests,
+        "throughput_rps": round(requests / wall_s, 2),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "overhead_p50_ms": round(percentile(overheads, 50), 3),
+        "overhead_p95_ms": round(percentile(overheads, 95), 3),
+        "error_rate": sum(r[2] for r in results) / requests
+    }
+
+
+def bench_client(concurrency: int, requests: int) -> Dict[str, Any]:
+    """Drive AsyncAgentClient.gather with unique queries over its own client and connection pool"""
+    import asyncio
+    from socratiq.agents import AGENTS, SOPHIE
+    from socratiq.client import AgentClient, AsyncAgentClient
+
+    agents = [*AGENTS, SOPHIE]
+    queries = [(agents[i % len(agents)], f"client benchmark query c{concurrency} #{i}") for i in range(requests)]
+
+    async def run() -> Tuple[List[Any], float]:
+        async with AsyncAgentClient(AgentClient.create(max_connections=concurrency), concurrency) as client:
+            started = time.perf_counter()
+            responses = await client.gather(queries, use_cache=False)
+            return responses, time.perf_counter() - started
+
+    responses, wall_s = asyncio.run(run())
+    latencies = [response.latency_ms for response in responses]
+    overheads = [response.latency_ms - response.body.get("benchmarkLatencyMs", 0.0) for response in responses]
+    return {
+        "requests": requests,
+        "throughput_rps": round(requests / wall_s, 2),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "overhead_p50_ms": round(percentile(overheads, 50), 3),
+        "overhead_p95_ms": round(percentile(overheads, 95), 3),
+        "error_rate": sum(not response.ok for response in responses) / requests
+    }
+
+
+def run_session(session_id: int, queries: int) -> Tuple[Any, List[float]]:
+    """One headless user session: agent chat, a TPP and the History page"""
+    from streamlit.testing.v1 import AppTest
+
+    def button(at: Any, label: str) -> Any:
+        return next(b for b in at.button if label in b.label)
+
+    at = AppTest.from_file(APP_PATH, default_timeout=120)
+    timings = [timed(at.run)]
+
+    timings.append(timed(lambda: at.sidebar.radio[0].set_value("💬 Agent Chat").run()))
+    for i in range(queries):
+        at.text_area[0].input(f"session {session_id} question {i}")
+        timings.append(timed(lambda: button(at, "Ask Agent").click().run()))
+
+    timings.append(timed(lambda: at.sidebar.radio[0].set_value("🎯 Generate TPP").run()))
+    at.text_input[0].input(f"Benchmarkumab {session_id}")
+    timings.append(timed(lambda: button(at, "Generate TPP").click().run()))
+
+    timings.append(timed(lambda: at.sidebar.radio[0].set_value("📊 History").run()))
+
+    if at.exception:
+        raise RuntimeError(f"Session {session_id} raised: {at.exception[0].value}")
+    return at, timings
+
+
+def bench_sessions(sessions: int, queries: int) -> Dict[str, Any]:
+    """Rerun time per interaction (untraced pass) and retained memory per session (tracemalloc pass)"""
+    timings: List[float] = []
+    for session_id in range(sessions):
+        _, session_timings = run_session(session_id, queries)
+        timings.extend(session_timings)
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = [run_session(sessions + session_id, queries)[0] for session_id in range(sessions)]
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del kept
+
+    return {
+        "sessions": sessions,
+        "interactions": len(timings),
+        "rerun_p50_ms": round(percentile(timings, 50), 2),
+        "rerun_p95_ms": round(percentile(timings, 95), 2),
+        "rerun_max_ms": round(max(timings), 2),
+        "memory_per_session_kb": round(retained / sessions / 1024, 1)
+    }
+
+
+def seed_history(app: Any, owner: str, entries: int) -> None:
+    """Fill owner's history with entries responses from the fake Lambda, one in five of them TPPs"""
+    from benchmarks import fake_lambda
+
+    rng = fake_lambda.random.Random(entries)
+    for i in range(entries):
+        timestamp = f"2025-01-01T00:{i // 60:02d}:{i % 60:02d}"
+        if i % 5 == 4:
+            query = f"Seeded TPP {i}"
+            app.history_store.add_tpp(owner, query, fake_lambda.synthetic_payload("Sophie", query, rng), timestamp)
+        else:
+            agent = list(app.AGENTS)[i % len(app.AGENTS)]
+            query = f"Seeded question {i}"
+            app.history_store.add_chat(owner, agent, query, fake_lambda.synthetic_payload(agent, query, rng), timestamp)
+
+
+def bench_reruns(app: Any, entries: int, interactions: int) -> Dict[str, Any]:
+    """Full page reruns and fragment panel run times for a session with entries history items
+
+    AppTest always reruns the whole script, so fragment cost is read from the
+    panel timings the app records for each fragment run (call_metrics.panel_summary),
+    as shown on the Performance page.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    owner = "bench-history"
+    seed_history(app, owner, entries)
+
+    def button(at: Any, label: str) -> Any:
+        return next(b for b in at.button if label in b.label)
+
+    at = AppTest.from_file(APP_PATH, default_timeout=120)
+    at.query_params["cid"] = owner
+    at.run()
+
+    pages: Dict[str, List[float]] = {"agent_chat": [], "home": [], "history": []}
+    at.sidebar.radio[0].set_value("💬 Agent Chat").run()
+    for i in range(interactions):
+        at.text_area[0].input(f"rerun question {i}")
+        pages["agent_chat"].append(timed(lambda: button(at, "Ask Agent").click().run()))
+
+    at.sidebar.radio[0].set_value("🏠 Home").run()
+    for i in range(interactions):
+        at.text_area(key="sophie_query").input(f"rerun strategy question {i}")
+        pages["home"].append(timed(lambda: button(at, "Ask Sophie").click().run()))
+
+    at.sidebar.radio[0].set_value("📊 History").run()
+    for _ in range(interactions):
+        pages["history"].append(timed(at.run))
+
+    # The app's panel timings live in the script's own cache_resource, so read them off the Performance page
+    at.sidebar.radio[0].set_value("📈 Performance").run()
+    if at.exception:
+        raise RuntimeError(f"Rerun session raised: {at.exception[0].value}")
+    table = next(frame.value for frame in at.dataframe if "Panel" in frame.value.columns)
+    rows = [row for _, row in table.iterrows() if not row["Panel"].startswith("Page: ")]
+    fragments = {row["Panel"]: row["p95 (ms)"] for row in rows}
+
+    results: Dict[str, Any] = {"history_entries": entries, "interactions": interactions}
+    for page, timings in pages.items():
+        results[f"{page}_full_p95_ms"] = round(percentile(timings, 95), 2)
+    results["fragment_p95_ms"] = float(max(fragments.values()))
+    results["fragments"] = {panel: float(p95) for panel, p95 in fragments.items()}
+    results["fragments_with_calls"] = {row["Panel"]: float(row["p95 with Calls (ms)"]) for row in rows}
+    return results
+
+
+def probe(*args: str) -> Dict[str, float]:
+    """Run benchmarks/startup.py in a fresh interpreter and return its JSON result"""
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.startup", *args],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def bench_startup(runs: int) -> Dict[str, Any]:
+    """Median startup timings over runs fresh interpreters, after one discarded run that builds on-disk indexes"""
+    env_factory = os.environ.pop("SOCRATIQ_LAMBDA_CLIENT_FACTORY", None)
+    try:
+        probe()
+        samples = [probe() for _ in range(runs)]
+        sdk = [probe("--sdk")["sdk_ms"] for _ in range(runs)]
+    finally:
+        if env_factory is not None:
+            os.environ["SOCRATIQ_LAMBDA_CLIENT_FACTORY"] = env_factory
+
+    results: Dict[str, Any] = {"runs": runs}
+    for metric in ("import_ms", "first_paint_ms", "rerun_ms"):
+        results[metric] = round(statistics.median(sample[metric] for sample in samples), 1)
+    results["deferred_sdk_ms"] = round(statistics.median(sdk), 1)
+    return results
+
+
+def flatten(results: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{path}."))
+        elif isinstance(value, (int, float)):
+            flat[path] = value
+    return flat
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Regressions of current results against the baseline beyond tolerance"""
+    current, previous = flatten(results), flatten(baseline)
+    failures = []
+    for pattern, higher_is_better, slack in REGRESSION_METRICS:
+        prefix, _, suffix = pattern.partition("*")
+        for path, old in previous.items():
+            if not (path.startswith(prefix) and path.endswith(suffix)) or path not in current:
+                continue
+            new = current[path]
+            if higher_is_better and new < old * (1 - tolerance) - slack:
+                failures.append(f"{path}: {new} < baseline {old}")
+            elif not higher_is_better and new > old * (1 + tolerance) + slack:
+                failures.append(f"{path}: {new} > baseline {old}")
+    return failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated concurrency levels for the invoke benchmark")
+    parser.add_argument("--requests", type=int, default=80, help="Invocations per concurrency level")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Median simulated Lambda latency for the invoke benchmark")
+    parser.add_argument("--sigma", type=float, default=0.5, help="Log-normal spread of the simulated latency")
+    parser.add_argument("--sessions", type=int, default=5, help="Headless Streamlit sessions to drive")
+    parser.add_argument("--queries", type=int, default=3, help="Agent chat queries per session")
+    parser.add_argument("--startup-runs", type=int, default=3, help="Fresh interpreters for the startup benchmark")
+    parser.add_argument("--history-entries", type=int, default=100, help="History entries seeded for the rerun benchmark")
+    parser.add_argument("--payload-dir", help="Directory of recorded <AGENT>.json response bodies (default: synthetic)")
+    parser.add_argument("--output", help="Write results JSON to this path")
+    parser.add_argument("--check", action="store_true", help="Exit non-zero if results regress against the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="Allowed relative regression for --check")
+    parser.add_argument("--update-baseline", action="store_true", help="Overwrite benchmarks/baseline.json")
+    args = parser.parse_args()
+
+    # Point the app at the fake Lambda client and throwaway state before it is imported
+    os.environ["SOCRATIQ_LAMBDA_CLIENT_FACTORY"] = "benchmarks.fake_lambda:create_client"
+    os.environ["SOCRATIQ_DATA_DIR"] = tempfile.mkdtemp(prefix="socratiq-bench-")
+    os.environ.pop("SOCRATIQ_CACHE_DB", None)
+    # One simulated user makes every call, so per-user budgets would only measure the token bucket
+    os.environ["SOCRATIQ_USER_RATE"] = "0"
+    sys.path.insert(0, ROOT)
+
+    from benchmarks import fake_lambda
+
+    latency = {"*": fake_lambda.LatencyModel(median_ms=args.latency_ms, sigma=args.sigma)}
+    fake_lambda.configure(latency=latency, payload_dir=args.payload_dir)
+
+    import streamlit  # noqa: F401 - configure its loggers before silencing bare-mode warnings
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+    for name in list(logging.root.manager.loggerDict):
+        if name.startswith("streamlit"):
+            logging.getLogger(name).setLevel(logging.ERROR)
+
+    import streamlit_app as app
+
+    results: Dict[str, Any] = {
+        "environment": {
+            "python": platform.python_version(),
+            "streamlit": streamlit.__version__,
+            "platform": platform.platform()
+        },
+        "config": {
+            "latency_ms": args.latency_ms,
+            "sigma": args.sigma,
+            "requests": args.requests,
+            "sessions": args.sessions,
+            "queries": args.queries
+        },
+        "invoke": {}
+    }
+
+    # Fresh interpreters, so nothing this process has imported or cached affects the timings
+    results["startup"] = bench_startup(args.startup_runs)
+
+    results["client"] = {"import_ms": round(statistics.median(probe("--client")["client_import_ms"] for _ in range(args.startup_runs)), 1)}
+    for level in (int(c) for c in args.concurrency.split(",")):
+        results["invoke"][f"c{level}"] = bench_invoke(app, level, args.requests)
+        results["client"][f"c{level}"] = bench_client(level, args.requests)
+
+    # Near-zero service time so session timings reflect client-side work
+    latency["*"] = fake_lambda.LatencyModel(median_ms=1.0, sigma=0.1)
+    results["reruns"] = bench_reruns(app, args.history_entries, args.queries * 3)
+    results["sessions"] = bench_sessions(args.sessions, args.queries)
+
+    print(json.dumps(results, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.update_baseline:
+        with open(BASELINE_PATH, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+        print(f"Baseline written to {BASELINE_PATH}")
+
+    if args.check:
+        with open(BASELINE_PATH) as f:
+            failures = compare(results, json.load(f), args.tolerance)
+        if results["reruns"]["fragment_p95_ms"] > app.PANEL_RERUN_TARGET_MS:
+            failures.append(f"reruns.fragment_p95_ms: {results['reruns']['fragment_p95_ms']} > target {app.PANEL_RERUN_TARGET_MS}")
+        if failures:
+            print("Performance regressions:\n  " + "\n  ".join(failures))
+            return 1
+        print("No regressions against baseline")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""
+Startup probe for the SocratIQ Streamlit client
+
+Run in a fresh interpreter by run_benchmarks.bench_startup, and prints one
+JSON object:
+
+- import_ms: importing streamlit and its testing harness (the framework floor)
+- first_paint_ms: the first full script run of the Home page, including the
+  app's own imports and cached resource construction (time to first paint)
+- rerun_ms: a second run of the same page, one second later as after a user
+  interaction (background work started by the first run has finished by then)
+
+With --sdk it instead times importing boto3 and building a Lambda client
+(sdk_ms), the work the app keeps off the first-paint path. With --client it
+times importing the agent client library, socratiq.client (client_import_ms),
+which batch jobs and the socratiq command line pay instead of Streamlit's.
+
+Keep-warm pings are disabled so the probe never needs AWS access.
+"""
+
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(ROOT, "streamlit_app.py")
+
+
+def probe_sdk() -> None:
+    started = time.perf_counter()
+    import boto3
+    boto3.client("lambda", region_name="us-east-1")
+    print(json.dumps({"sdk_ms": (time.perf_counter() - started) * 1000}))
+
+
+def probe_client() -> None:
+    started = time.perf_counter()
+    import socratiq.client  # noqa: F401
+    print(json.dumps({"client_import_ms": (time.perf_counter() - started) * 1000}))
+
+
+def main() -> None:
+    if "--sdk" in sys.argv[1:]:
+        probe_sdk()
+        return
+    if "--client" in sys.argv[1:]:
+        probe_client()
+        return
+
+    os.environ["SOCRATIQ_KEEP_WARM_INTERVAL"] = "0"
+
+    started = time.perf_counter()
+    import streamlit  # noqa: F401
+    from streamlit.testing.v1 import AppTest
+    import_ms = (time.perf_counter() - started) * 1000
+
+    at = AppTest.from_file(APP_PATH, default_timeout=120)
+    started = time.perf_counter()
+    at.run()
+    first_paint_ms = (time.perf_counter() - started) * 1000
+
+    time.sleep(1.0)
+    started = time.perf_counter()
+    at.run()
+    rerun_ms = (time.perf_counter() - started) * 1000
+
+    if at.exception:
+        raise RuntimeError(f"Startup probe raised: {at.exception[0].value}")
+
+    print(json.dumps({
+        "import_ms": import_ms,
+        "first_paint_ms": first_paint_ms,
+        "rerun_ms": rerun_ms
+    }))
+
+
+if __name__ == "__main__":
+    main()
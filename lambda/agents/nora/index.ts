@@ -15,6 +15,7 @@ import {
 import {
   generateTraceId,
   parseLambdaEvent,
+  isWarmupEvent,
   buildLambdaResponse,
   formatErrorResponse,
   logInfo,
@@ -28,6 +29,11 @@ export async function handler(event: any): Promise<any> {
   const startTime = Date.now();
   const traceId = generateTraceId();
 
+  // Keep-warm ping: the container is now initialized, nothing else to do
+  if (isWarmupEvent(event)) {
+    return buildLambdaResponse(200, { warm: true, traceId });
+  }
+
   try {
     checkRequiredEnvVars(['NORA_CORPUS_BUCKET']);
     logInfo('NORA agent invoked', { traceId });
@@ -16,6 +16,7 @@ import {
 import {
   generateTraceId,
   parseLambdaEvent,
+  isWarmupEvent,
   buildLambdaResponse,
   formatErrorResponse,
   extractConfidenceFromText,
@@ -43,6 +44,11 @@ export async function handler(event: any): Promise<any> {
   const startTime = Date.now();
   const traceId = generateTraceId();
 
+  // Keep-warm ping: the container is now initialized, nothing else to do
+  if (isWarmupEvent(event)) {
+    return buildLambdaResponse(200, { warm: true, traceId });
+  }
+
   try {
     checkRequiredEnvVars([
       'VERA_LAMBDA_ARN',
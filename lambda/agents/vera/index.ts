@@ -15,6 +15,7 @@ import {
 import {
   generateTraceId,
   parseLambdaEvent,
+  isWarmupEvent,
   buildLambdaResponse,
   formatErrorResponse,
   logInfo,
@@ -34,6 +35,11 @@ export async function handler(event: any): Promise<any> {
   const startTime = Date.now();
   const traceId = generateTraceId();
 
+  // Keep-warm ping: the container is now initialized, nothing else to do
+  if (isWarmupEvent(event)) {
+    return buildLambdaResponse(200, { warm: true, traceId });
+  }
+
   try {
     // Check required environment variables
     checkRequiredEnvVars(['VERA_CORPUS_BUCKET']);
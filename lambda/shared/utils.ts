@@ -69,6 +69,13 @@ export function buildLambdaResponse(statusCode: number, body: any): any {
   };
 }
 
+/**
+ * Keep-warm ping from the SocratIQ client ({"warmup": true}), answered without corpus or Bedrock work
+ */
+export function isWarmupEvent(event: any): boolean {
+  return Boolean(event && event.warmup === true);
+}
+
 /**
  * Parse Lambda event body (handles both direct invocation and API Gateway)
  */
@@ -0,0 +1,7 @@
+"""
+SocratIQ client-side support modules
+
+Non-UI building blocks used by the Streamlit application (streamlit_app.py),
+including the agent client library (socratiq.client) that batch jobs,
+notebooks and the ``socratiq`` command line (socratiq.cli) use directly.
+"""
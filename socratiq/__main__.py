@@ -0,0 +1,5 @@
+import sys
+
+from socratiq.cli import main
+
+sys.exit(main())
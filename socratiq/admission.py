@@ -0,0 +1,333 @@
+"""
+Admission control for Lambda invocations
+
+Every session of the app shares one Lambda account concurrency budget. When
+many users arrive at once, calls that go straight to invoke run into the
+functions' reserved concurrency and fail with throttling errors. Then retries
+add more load. AdmissionController queues invocations in the client instead:
+
+- a concurrency cap per function (agent label), so no more calls are in
+  flight than the function can serve
+- a token bucket per user for TPP and batch calls, so one user's batch
+  cannot take every slot. Chat calls are made by a person waiting at the page
+  and are only subject to the caps
+- priority order within each function's queue: interactive chat before TPP
+  generation before batch items, then first come first served. A waiter whose
+  user is out of tokens does not hold up the waiters behind it
+
+Waiters can be told their queue position and an estimated wait while they
+wait. The estimate is based on the function's mean service time. Queue depth,
+in-flight calls and wait times are reported by stats() and to_prometheus().
+"""
+
+import bisect
+import itertools
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from socratiq.metrics import QUANTILES, percentile
+
+PRIORITY_CHAT = 0
+PRIORITY_TPP = 1
+PRIORITY_BATCH = 2
+
+PRIORITY_NAMES = {PRIORITY_CHAT: "chat", PRIORITY_TPP: "tpp", PRIORITY_BATCH: "batch"}
+
+# Wait-time samples kept per priority class
+WAIT_WINDOW = 500
+
+# Weight of the newest call in a function's moving-average service time
+SERVICE_TIME_ALPHA = 0.2
+
+# Seconds between sweeps that drop refilled (and so indistinguishable from new) user buckets
+BUCKET_PRUNE_INTERVAL = 60.0
+
+
+class AdmissionTimeout(Exception):
+    """A call waited longer than the controller's max_wait for a slot"""
+
+    def __init__(self, label: str, waited_s: float):
+        super().__init__(f"{label} is busy: no capacity after waiting {waited_s:.0f}s in the queue, try again shortly")
+        self.label = label
+        self.waited_s = waited_s
+
+
+class TokenBucket:
+    """Token bucket refilled at `rate` tokens per second, holding at most `burst`; not thread-safe"""
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = now
+
+    def available(self, now: float) -> bool:
+        self._refill(now)
+        return self._tokens >= 1
+
+    def take(self, now: float) -> None:
+        self._refill(now)
+        self._tokens -= 1
+
+    def full(self, now: float) -> bool:
+        self._refill(now)
+        return self._tokens >= self.burst
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until a token is available"""
+        self._refill(now)
+        return 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+@dataclass(order=True)
+class Ticket:
+    """A call's place in a function's queue; ordered by priority, then arrival"""
+    priority: int
+    seq: int
+    label: str = field(compare=False)
+    user: Optional[str] = field(compare=False)
+    enqueued_at: float = field(compare=False)
+    admitted_at: Optional[float] = field(default=None, compare=False)
+
+    @property
+    def waited_ms(self) -> float:
+        return ((self.admitted_at or self.enqueued_at) - self.enqueued_at) * 1000
+
+
+class AdmissionController:
+    """Process-wide queue in front of the agent Lambdas, keyed by agent label
+
+    limits maps labels to concurrency caps (default_limit for the rest). A
+    user_rate of 0 disables the per-user token buckets. Chat calls, and calls
+    without a user (e.g. from the command line), are only subject to the caps.
+    """
+
+    def __init__(
+        self,
+        limits: Optional[Dict[str, int]] = None,
+        default_limit: int = 10,
+        user_rate: float = 2.0,
+        user_burst: float = 12,
+        max_wait: float = 120.0,
+        service_estimate_s: float = 10.0,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.limits = dict(limits or {})
+        self.default_limit = default_limit
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.max_wait = max_wait
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._queues: Dict[str, List[Ticket]] = defaultdict(list)
+        self._in_flight: Counter = Counter()
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._buckets_pruned = clock()
+        self.service_estimate_s = service_estimate_s
+        self._service_s: Dict[str, float] = {}
+        self._counters: Dict[str, Counter] = defaultdict(Counter)
+        self._waits: Dict[int, Deque[float]] = {priority: deque(maxlen=WAIT_WINDOW) for priority in PRIORITY_NAMES}
+
+    def limit(self, label: str) -> int:
+        return self.limits.get(label, self.default_limit)
+
+    def acquire(
+        self,
+        label: str,
+        user: Optional[str] = None,
+        priority: int = PRIORITY_CHAT,
+        on_wait: Optional[Callable[[int, float], None]] = None,
+        poll_interval: float = 0.5
+    ) -> Ticket:
+        """Wait for a slot on label's function and return the admitted ticket
+
+        on_wait(position, eta_s) is called from the waiting thread each time the
+        call is found still queued, then with (0, 0.0) once it is admitted. It
+        is never called for calls admitted straight away. Raises
+        AdmissionTimeout after max_wait seconds.
+        Every admitted ticket must be passed to release().
+        """
+        with self._cond:
+            ticket = Ticket(priority, next(self._seq), label, user, self._clock())
+            bisect.insort(self._queues[label], ticket)
+
+        queued = False
+        try:
+            while True:
+                with self._cond:
+                    now = self._clock()
+                    admitted = self._admissible(ticket, now)
+                    if admitted:
+                        self._admit(ticket, now, queued)
+                    else:
+                        waited = now - ticket.enqueued_at
+                        if waited >= self.max_wait:
+                            self._counters[label]["timed_out"] += 1
+                            raise AdmissionTimeout(label, waited)
+                        position, eta = self._estimate(ticket, now)
+                if admitted:
+                    if queued and on_wait is not None:
+                        on_wait(0, 0.0)
+                    return ticket
+                queued = True
+                if on_wait is not None:
+                    on_wait(position, eta)
+                with self._cond:
+                    if not self._admissible(ticket, self._clock()):
+                        self._cond.wait(min(poll_interval, max(0.0, self.max_wait - waited)))
+        except BaseException:
+            # Also reached when on_wait raises, e.g. when a Streamlit session reruns mid-wait
+            if ticket.admitted_at is not None:
+                self.release(ticket)
+            else:
+                with self._cond:
+                    self._queues[label].remove(ticket)
+                    self._cond.notify_all()
+            raise
+
+    def try_acquire(self, label: str, priority: int = PRIORITY_CHAT) -> Optional[Ticket]:
+        """An admitted ticket if label has a free slot and nobody waiting for it, else None; never waits"""
+        with self._cond:
+            now = self._clock()
+            if self._queues[label] or self._in_flight[label] >= self.limit(label):
+                return None
+            ticket = Ticket(priority, next(self._seq), label, None, now, admitted_at=now)
+            self._in_flight[label] += 1
+            return ticket
+
+    def release(self, ticket: Ticket) -> None:
+        """Free an admitted ticket's slot and fold its duration into the service-time estimate"""
+        with self._cond:
+            held_s = self._clock() - ticket.admitted_at
+            self._in_flight[ticket.label] -= 1
+            previous = self._service_s.get(ticket.label)
+            self._service_s[ticket.label] = held_s if previous is None else previous + SERVICE_TIME_ALPHA * (held_s - previous)
+            self._cond.notify_all()
+
+    def estimate(self, label: str, priority: int = PRIORITY_CHAT) -> Tuple[int, float]:
+        """(calls ahead, estimated wait in seconds) for a call to label arriving now at priority, ignoring user limits"""
+        with self._cond:
+            ahead = sum(1 for ticket in self._queues[label] if ticket.priority <= priority)
+            return ahead, self._eta(label, ahead)
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-function limits, in-flight calls, queue depth and counters; wait percentiles per priority class"""
+        with self._cond:
+            labels = sorted(set(self._queues) | set(self._in_flight) | set(self._counters) | set(self.limits))
+            functions = {
+                label: {
+                    "limit": self.limit(label),
+                    "in_flight": self._in_flight[label],
+                    "queued": len(self._queues[label]),
+                    "admitted": self._counters[label]["admitted"],
+                    "queued_calls": self._counters[label]["queued"],
+                    "timed_out": self._counters[label]["timed_out"],
+                    "service_s": self._service(label)
+                } for label in labels
+            }
+            queued_by_priority = Counter(ticket.priority for queue in self._queues.values() for ticket in queue)
+            waits = {priority: list(values) for priority, values in self._waits.items()}
+        return {
+            "functions": functions,
+            "priorities": {
+                PRIORITY_NAMES[priority]: {
+                    "queued": queued_by_priority[priority],
+                    "calls": len(values),
+                    **{f"wait_p{q}_ms": percentile(values, q) for q in QUANTILES}
+                } for priority, values in waits.items()
+            }
+        }
+
+    def to_prometheus(self) -> str:
+        """Queue depth, in-flight calls and wait times in the Prometheus text exposition format"""
+        stats = self.stats()
+        lines = []
+        for metric, key, help_text in (
+            ("socratiq_admission_queue_depth", "queued", "Calls waiting for a slot on each function"),
+            ("socratiq_admission_in_flight", "in_flight", "Calls admitted and in flight on each function"),
+            ("socratiq_admission_limit", "limit", "Concurrency cap for each function")
+        ):
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} gauge")
+            for label, function in stats["functions"].items():
+                lines.append(f'{metric}{{agent="{label}"}} {function[key]}')
+        for counter, help_text in (
+            ("admitted", "Calls admitted to a function"),
+            ("queued_calls", "Calls that had to wait for a slot or a user token"),
+            ("timed_out", "Calls that gave up waiting for a slot")
+        ):
+            lines.append(f"# HELP socratiq_admission_{counter}_total {help_text}")
+            lines.append(f"# TYPE socratiq_admission_{counter}_total counter")
+            for label, function in stats["functions"].items():
+                lines.append(f'socratiq_admission_{counter}_total{{agent="{label}"}} {function[counter]}')
+        lines.extend([
+            "# HELP socratiq_admission_wait_seconds Time calls spent queued, by priority class, over the recent window",
+            "# TYPE socratiq_admission_wait_seconds gauge"
+        ])
+        for name, priority in stats["priorities"].items():
+            for q in QUANTILES:
+                lines.append(f'socratiq_admission_wait_seconds{{priority="{name}",quantile="{q / 100}"}} {priority[f"wait_p{q}_ms"] / 1000:.6f}')
+        return "\n".join(lines) + "\n"
+
+    def _bucket(self, ticket: Ticket, now: float) -> Optional[TokenBucket]:
+        if ticket.user is None or ticket.priority == PRIORITY_CHAT or self.user_rate <= 0:
+            return None
+        if now - self._buckets_pruned >= BUCKET_PRUNE_INTERVAL:
+            self._buckets_pruned = now
+            for user in [user for user, bucket in self._buckets.items() if bucket.full(now)]:
+                del self._buckets[user]
+        if ticket.user not in self._buckets:
+            self._buckets[ticket.user] = TokenBucket(self.user_rate, self.user_burst, now)
+        return self._buckets[ticket.user]
+
+    def _has_token(self, ticket: Ticket, now: float) -> bool:
+        bucket = self._bucket(ticket, now)
+        return bucket is None or bucket.available(now)
+
+    def _admissible(self, ticket: Ticket, now: float) -> bool:
+        """Whether ticket is the first waiter with a user token, and its function has a free slot"""
+        if self._in_flight[ticket.label] >= self.limit(ticket.label):
+            return False
+        for waiter in self._queues[ticket.label]:
+            if self._has_token(waiter, now):
+                return waiter is ticket
+        return False
+
+    def _admit(self, ticket: Ticket, now: float, queued: bool) -> None:
+        self._queues[ticket.label].remove(ticket)
+        bucket = self._bucket(ticket, now)
+        if bucket is not None:
+            bucket.take(now)
+        ticket.admitted_at = now
+        self._in_flight[ticket.label] += 1
+        counters = self._counters[ticket.label]
+        counters["admitted"] += 1
+        if queued:
+            counters["queued"] += 1
+        self._waits[ticket.priority].append(ticket.waited_ms)
+        # The next waiter may be admissible too, e.g. when several slots are free
+        self._cond.notify_all()
+
+    def _eta(self, label: str, ahead: int) -> float:
+        # Completions needed before a slot frees for this call, at one per service_s / limit seconds on average
+        needed = ahead + 1 + self._in_flight[label] - self.limit(label)
+        return max(0, needed) * self._service(label) / self.limit(label)
+
+    def _service(self, label: str) -> float:
+        """Mean call duration for label: the first observed call, then a moving average; a default until then"""
+        return self._service_s.get(label, self.service_estimate_s)
+
+    def _estimate(self, ticket: Ticket, now: float) -> Tuple[int, float]:
+        queue = self._queues[ticket.label]
+        ahead = queue.index(ticket)
+        bucket = self._bucket(ticket, now)
+        token_wait = bucket.wait_time(now) if bucket is not None else 0.0
+        return ahead + 1, max(self._eta(ticket.label, ahead), token_wait)
@@ -0,0 +1,73 @@
+"""
+Registry of the SocratIQ agent Lambdas
+
+The four specialist agents and the Sophie orchestrator, with the Lambda
+function each one is deployed as. Shared by the Streamlit app, the async
+client (socratiq.client) and the ``socratiq`` command line.
+"""
+
+from typing import Any, Dict
+
+AGENTS = {
+    "VERA": {
+        "name": "VERA",
+        "full_name": "Product & Clinical Intelligence",
+        "function": "SocratIQ-VERA-Agent-prod",
+        "icon": "🔬",
+        "description": "Expert in product architecture, formulation, manufacturing, stability, packaging, and quality systems",
+        "color": "vera-card"
+    },
+    "FINN": {
+        "name": "FINN",
+        "full_name": "Financial & Investment Intelligence",
+        "function": "SocratIQ-FINN-Agent-prod",
+        "icon": "💰",
+        "description": "Specialist in valuation, deal structure, due diligence, portfolio strategy, and risk assessment",
+        "color": "finn-card"
+    },
+    "NORA": {
+        "name": "NORA",
+        "full_name": "Legal, Regulatory & IP Intelligence",
+        "function": "SocratIQ-NORA-Agent-prod",
+        "icon": "⚖️",
+        "description": "Authority on regulatory pathways, FDA strategy, CRADAs, patent landscape, and compliance",
+        "color": "nora-card"
+    },
+    "CLIA": {
+        "name": "CLIA",
+        "full_name": "Clinical Trials & Market Intelligence",
+        "function": "SocratIQ-CLIA-Agent-prod",
+        "icon": "📊",
+        "description": "Expert in protocol design, clinical operations, market access, competitive intelligence, and evidence generation",
+        "color": "clia-card"
+    }
+}
+
+SOPHIE_CONFIG = {
+    "name": "Sophie",
+    "full_name": "Strategic Orchestration Engine",
+    "function": "SocratIQ-Sophie-Orchestrator-prod",
+    "icon": "🧠",
+    "description": "Multi-agent coordinator using Tri-Paradigm Reasoning (Mechanistic, Deterministic, Probabilistic)",
+    "color": "sophie-card"
+}
+
+SOPHIE = SOPHIE_CONFIG["name"]
+
+
+def get_agent(name: str) -> Dict[str, Any]:
+    """Configuration for an agent name ("VERA", "sophie", ...), case-insensitively"""
+    if name.casefold() == SOPHIE.casefold():
+        return SOPHIE_CONFIG
+    for agent_name, agent in AGENTS.items():
+        if agent_name.casefold() == name.casefold():
+            return agent
+    raise KeyError(f"Unknown agent {name!r}; expected one of {', '.join([*AGENTS, SOPHIE])}")
+
+
+def agent_label(function_name: str) -> str:
+    """Agent key (or "Sophie") used to tag metrics for a Lambda function"""
+    for agent_name, agent in AGENTS.items():
+        if agent["function"] == function_name:
+            return agent_name
+    return SOPHIE if function_name == SOPHIE_CONFIG["function"] else function_name
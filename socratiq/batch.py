@@ -0,0 +1,401 @@
+"""
+Batch TPP generation for SocratIQ
+
+A batch is a list of (drug, therapeutic area) items, usually uploaded as CSV,
+that share one set of TPP components. Items run through a worker pool capped at
+a configurable concurrency and paced by a token-bucket rate limit. Together
+these keep a batch of 50-200 drugs within the Sophie function's reserved
+concurrency instead of firing every invocation at once.
+
+Batch and item state is kept in SQLite, so progress survives a page refresh.
+A batch that was paused, or interrupted by an application restart, can be
+resumed: only items that have not yet succeeded run again. Items keep only
+the ID of the history entry holding their response; exports read the responses
+back from the HistoryStore, as a single JSONL file or zip archive.
+"""
+
+import csv
+import io
+import json
+import sqlite3
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from socratiq.history import HistoryStore
+
+ITEM_QUEUED = "queued"
+ITEM_RUNNING = "running"
+ITEM_SUCCEEDED = "succeeded"
+ITEM_FAILED = "failed"
+
+BATCH_RUNNING = "running"
+BATCH_PAUSED = "paused"
+BATCH_INTERRUPTED = "interrupted"
+BATCH_COMPLETED = "completed"
+
+# Header names accepted for each CSV column (compared case-insensitively, ignoring spaces and underscores)
+DRUG_COLUMNS = ("drug", "drugname", "name", "compound", "candidate")
+AREA_COLUMNS = ("area", "therapeuticarea", "indication", "ta")
+
+
+def parse_batch_csv(data: bytes) -> List[Tuple[str, str]]:
+    """(drug, therapeutic area) rows from CSV bytes
+
+    Uses a header row when it names a drug column (e.g. "Drug Name",
+    "therapeutic_area"); otherwise the first two columns are read as drug and
+    area. Blank and duplicate rows are dropped.
+    """
+    text = data.decode("utf-8-sig")
+    rows = [row for row in csv.reader(io.StringIO(text)) if any(cell.strip() for cell in row)]
+    if not rows:
+        raise ValueError("The CSV file is empty")
+
+    header = [cell.strip().lower().replace(" ", "").replace("_", "") for cell in rows[0]]
+    drug_col = next((i for i, name in enumerate(header) if name in DRUG_COLUMNS), None)
+    if drug_col is not None:
+        area_col = next((i for i, name in enumerate(header) if name in AREA_COLUMNS), None)
+        rows = rows[1:]
+    else:
+        drug_col, area_col = 0, 1
+
+    items, seen = [], set()
+    for row in rows:
+        drug = row[drug_col].strip() if drug_col < len(row) else ""
+        area = row[area_col].strip() if area_col is not None and area_col < len(row) else ""
+        if drug and (drug.lower(), area.lower()) not in seen:
+            seen.add((drug.lower(), area.lower()))
+            items.append((drug, area))
+    if not items:
+        raise ValueError("No drug names found in the CSV file")
+    return items
+
+
+class RateLimiter:
+    """Token bucket: at most `rate` acquisitions per second, with bursts up to `burst`"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class BatchStore:
+    """Thread-safe SQLite store of batches, their items and item results"""
+
+    def __init__(self, db_path: str = ":memory:"):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS batches (
+                id TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                label TEXT NOT NULL,
+                params TEXT NOT NULL,
+                status TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                finished_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_batches_owner_created ON batches(owner, created_at);
+            CREATE TABLE IF NOT EXISTS batch_items (
+                batch_id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                drug_name TEXT NOT NULL,
+                therapeutic_area TEXT NOT NULL,
+                status TEXT NOT NULL,
+                history_id INTEGER,
+                error TEXT,
+                started_at REAL,
+                finished_at REAL,
+                PRIMARY KEY (batch_id, position)
+            );
+        """)
+
+        # Workers from a previous process are gone; their batches can be resumed
+        self._db.execute(
+            "UPDATE batch_items SET status = ? WHERE status = ?",
+            (ITEM_QUEUED, ITEM_RUNNING)
+        )
+        self._db.execute(
+            "UPDATE batches SET status = ? WHERE status = ?",
+            (BATCH_INTERRUPTED, BATCH_RUNNING)
+        )
+        self._db.commit()
+
+    def create(self, owner: str, label: str, params: Dict[str, Any], items: List[Tuple[str, str]]) -> str:
+        """Record a new batch with its queued items and return its ID"""
+        batch_id = uuid.uuid4().hex
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO batches (id, owner, label, params, status, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (batch_id, owner, label, json.dumps(params), BATCH_RUNNING, time.time())
+            )
+            self._db.executemany(
+                "INSERT INTO batch_items (batch_id, position, drug_name, therapeutic_area, status) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(batch_id, i, drug, area, ITEM_QUEUED) for i, (drug, area) in enumerate(items)]
+            )
+            self._db.commit()
+        return batch_id
+
+    def get(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute("SELECT * FROM batches WHERE id = ?", (batch_id,)).fetchone()
+        if not row:
+            return None
+        batch = dict(row)
+        batch["params"] = json.loads(batch["params"])
+        return batch
+
+    def list_for_owner(self, owner: str, limit: int = 5) -> List[Dict[str, Any]]:
+        """An owner's most recent batches, newest first, with item counts by status"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT * FROM batches WHERE owner = ? ORDER BY created_at DESC LIMIT ?",
+                (owner, limit)
+            ).fetchall()
+        batches = []
+        for row in rows:
+            batch = dict(row)
+            batch["params"] = json.loads(batch["params"])
+            batch["counts"] = self.counts(batch["id"])
+            batches.append(batch)
+        return batches
+
+    def counts(self, batch_id: str) -> Dict[str, int]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT status, COUNT(*) FROM batch_items WHERE batch_id = ? GROUP BY status",
+                (batch_id,)
+            ).fetchall()
+        counts = {ITEM_QUEUED: 0, ITEM_RUNNING: 0, ITEM_SUCCEEDED: 0, ITEM_FAILED: 0}
+        counts.update({status: count for status, count in rows})
+        counts["total"] = sum(counts.values())
+        return counts
+
+    def items(self, batch_id: str) -> List[Dict[str, Any]]:
+        """A batch's items in upload order"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT batch_id, position, drug_name, therapeutic_area, status, history_id, error, started_at, finished_at "
+                "FROM batch_items WHERE batch_id = ? ORDER BY position",
+                (batch_id,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def claim_pending(self, batch_id: str, retry_failed: bool) -> List[Dict[str, Any]]:
+        """Items still to run: queued ones, plus failed ones (requeued) when retrying"""
+        with self._lock:
+            if retry_failed:
+                self._db.execute(
+                    "UPDATE batch_items SET status = ?, error = NULL WHERE batch_id = ? AND status = ?",
+                    (ITEM_QUEUED, batch_id, ITEM_FAILED)
+                )
+                self._db.commit()
+            rows = self._db.execute(
+                "SELECT position, drug_name, therapeutic_area FROM batch_items "
+                "WHERE batch_id = ? AND status = ? ORDER BY position",
+                (batch_id, ITEM_QUEUED)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def mark_item_running(self, batch_id: str, position: int) -> None:
+        self._update_item(batch_id, position, status=ITEM_RUNNING, started_at=time.time())
+
+    def complete_item(self, batch_id: str, position: int, result: Dict[str, Any], history_id: Optional[int]) -> None:
+        """Record an item's outcome; results carrying an "error" key mark the item failed
+
+        The response itself lives in the history entry history_id and is not copied here.
+        """
+        self._update_item(
+            batch_id, position,
+            status=ITEM_FAILED if "error" in result else ITEM_SUCCEEDED,
+            error=result.get("error"),
+            history_id=history_id,
+            finished_at=time.time()
+        )
+
+    def fail_item(self, batch_id: str, position: int, error: str) -> None:
+        self._update_item(batch_id, position, status=ITEM_FAILED, error=error, finished_at=time.time())
+
+    def set_status(self, batch_id: str, status: str) -> None:
+        finished_at = time.time() if status == BATCH_COMPLETED else None
+        with self._lock:
+            self._db.execute(
+                "UPDATE batches SET status = ?, finished_at = ? WHERE id = ?",
+                (status, finished_at, batch_id)
+            )
+            self._db.commit()
+
+    def _update_item(self, batch_id: str, position: int, **fields: Any) -> None:
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._db.execute(
+                f"UPDATE batch_items SET {assignments} WHERE batch_id = ? AND position = ?",
+                (*fields.values(), batch_id, position)
+            )
+            self._db.commit()
+
+    # -- export ----------------------------------------------------------
+
+    def export_jsonl(self, batch_id: str, history: HistoryStore) -> bytes:
+        """One JSON object per item: drug, area, status, error, history ID and response (from history)"""
+        lines = []
+        for item, response in self._with_responses(batch_id, history):
+            lines.append(json.dumps({
+                "drug_name": item["drug_name"],
+                "therapeutic_area": item["therapeutic_area"],
+                "status": item["status"],
+                "error": item["error"],
+                "history_id": item["history_id"],
+                "response": response
+            }))
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+    def export_zip(self, batch_id: str, history: HistoryStore) -> bytes:
+        """A zip with one TPP JSON file per succeeded item (from history) and a summary.csv of every item"""
+        buffer = io.BytesIO()
+        summary = io.StringIO()
+        writer = csv.writer(summary)
+        writer.writerow(["drug_name", "therapeutic_area", "status", "confidence", "file", "error"])
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+            for item, response in self._with_responses(batch_id, history):
+                filename = ""
+                result = response or {}
+                if item["status"] == ITEM_SUCCEEDED and response is not None:
+                    safe_name = "".join(c if c.isalnum() or c in "-_" else "_" for c in item["drug_name"])
+                    filename = f"TPP_{item['position'] + 1:03d}_{safe_name}.json"
+                    archive.writestr(filename, json.dumps(result, indent=2))
+                writer.writerow([
+                    item["drug_name"], item["therapeutic_area"], item["status"],
+                    result.get("confidence", ""), filename, item["error"] or ""
+                ])
+            archive.writestr("summary.csv", summary.getvalue())
+        return buffer.getvalue()
+
+    def _with_responses(self, batch_id: str, history: HistoryStore) -> Iterator[Tuple[Dict[str, Any], Optional[Dict[str, Any]]]]:
+        """(item, response) pairs; the response is None when the item has no history entry (any more)"""
+        batch = self.get(batch_id)
+        for item in self.items(batch_id):
+            entry = history.get(batch["owner"], item["history_id"]) if batch and item["history_id"] is not None else None
+            yield item, entry["response"] if entry else None
+
+
+class BatchRunner:
+    """Runs batch items on a capped, rate-limited worker pool and records their outcome in a BatchStore"""
+
+    def __init__(self, store: BatchStore, max_concurrency: int = 4, rate_per_second: float = 2.0):
+        self.store = store
+        self.max_concurrency = max_concurrency
+        self.rate_per_second = rate_per_second
+        self._stop_flags: Dict[str, threading.Event] = {}
+        self._dispatchers: Dict[str, threading.Thread] = {}
+        self._lock = threading.Lock()
+
+    def submit(
+        self,
+        owner: str,
+        label: str,
+        params: Dict[str, Any],
+        items: List[Tuple[str, str]],
+        fn: Callable[[Dict[str, Any]], Tuple[Dict[str, Any], Optional[int]]],
+        concurrency: Optional[int] = None
+    ) -> str:
+        """Create a batch and start it; fn(item) returns (response, history entry ID)"""
+        batch_id = self.store.create(owner, label, params, items)
+        self.resume(batch_id, fn, concurrency)
+        return batch_id
+
+    def resume(
+        self,
+        batch_id: str,
+        fn: Callable[[Dict[str, Any]], Tuple[Dict[str, Any], Optional[int]]],
+        concurrency: Optional[int] = None,
+        retry_failed: bool = True
+    ) -> None:
+        """(Re)start a batch's unfinished items in a background dispatcher thread
+
+        When the batch was paused with items still running, the new dispatcher
+        waits for the previous one to drain before claiming items, so the batch
+        never runs more than its concurrency at once.
+        """
+        workers = min(concurrency or self.max_concurrency, self.max_concurrency)
+        with self._lock:
+            if self.is_active(batch_id):
+                return
+            stop = threading.Event()
+            self._stop_flags[batch_id] = stop
+            previous = self._dispatchers.get(batch_id)
+            thread = threading.Thread(
+                target=self._dispatch,
+                args=(batch_id, fn, workers, stop, retry_failed, previous),
+                name=f"socratiq-batch-{batch_id[:8]}",
+                daemon=True
+            )
+            self._dispatchers[batch_id] = thread
+
+        self.store.set_status(batch_id, BATCH_RUNNING)
+        thread.start()
+
+    def pause(self, batch_id: str) -> None:
+        """Stop dispatching new items; items already running finish normally"""
+        with self._lock:
+            stop = self._stop_flags.get(batch_id)
+        if stop:
+            stop.set()
+
+    def is_active(self, batch_id: str) -> bool:
+        stop = self._stop_flags.get(batch_id)
+        return stop is not None and not stop.is_set()
+
+    def _dispatch(self, batch_id, fn, workers, stop, retry_failed, previous) -> None:
+        if previous is not None:
+            previous.join()
+        items = self.store.claim_pending(batch_id, retry_failed)
+        limiter = RateLimiter(self.rate_per_second, burst=workers)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="socratiq-batch") as executor:
+            # Bound the queue to the worker count so pausing takes effect promptly
+            slots = threading.Semaphore(workers)
+            for item in items:
+                slots.acquire()
+                if stop.is_set():
+                    slots.release()
+                    break
+                limiter.acquire()
+                future = executor.submit(self._run_item, batch_id, item, fn)
+                future.add_done_callback(lambda _: slots.release())
+
+        with self._lock:
+            # A later resume() may have started a new run; it owns the flag and the status
+            if self._stop_flags.get(batch_id) is not stop:
+                return
+            del self._stop_flags[batch_id]
+            del self._dispatchers[batch_id]
+            counts = self.store.counts(batch_id)
+            self.store.set_status(batch_id, BATCH_PAUSED if counts[ITEM_QUEUED] else BATCH_COMPLETED)
+
+    def _run_item(self, batch_id: str, item: Dict[str, Any], fn) -> None:
+        self.store.mark_item_running(batch_id, item["position"])
+        try:
+            result, history_id = fn(item)
+            self.store.complete_item(batch_id, item["position"], result, history_id)
+        except Exception as e:
+            self.store.fail_item(batch_id, item["position"], str(e))
@@ -0,0 +1,143 @@
+"""
+Response cache for SocratIQ agent invocations
+
+An in-memory LRU cache with a TTL, optionally backed by a local SQLite file so
+cached responses survive application restarts. Entries are keyed on the Lambda
+function name and the normalized query text. Responses are held in compact
+form (see socratiq.payload) and decoded into a fresh dict on each hit.
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from socratiq.payload import CompactResponse, pack_json, unpack_json
+
+
+def normalize_query(query: str) -> str:
+    """Normalize query text so trivially different queries share a cache entry"""
+    return " ".join(query.lower().split())
+
+
+def make_cache_key(function_name: str, query: str) -> str:
+    """Build a stable cache key from a function name and a query"""
+    raw = f"{function_name}\x00{normalize_query(query)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Thread-safe LRU + TTL cache for agent responses"""
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 3600, db_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+        self.hits = 0
+        self.misses = 0
+
+        self._entries: "OrderedDict[str, Tuple[float, CompactResponse]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    function_name TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+            self._db.commit()
+
+    def get(self, function_name: str, query: str) -> Optional[Dict[str, Any]]:
+        """Return a cached response, or None if missing or expired"""
+        key = make_cache_key(function_name, query)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and self._db is not None:
+                entry = self._load(key)
+                if entry is not None:
+                    self._entries[key] = entry
+
+            if entry is None or now - entry[0] > self.ttl_seconds:
+                if entry is not None:
+                    self._delete(key)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._trim()
+            if self._db is not None:
+                self._db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+                self._db.commit()
+
+            self.hits += 1
+            return entry[1].to_dict()
+
+    def set(self, function_name: str, query: str, response: Dict[str, Any]) -> None:
+        """Store a response, evicting the least recently used entries beyond max_entries"""
+        key = make_cache_key(function_name, query)
+        now = time.time()
+
+        with self._lock:
+            self._entries[key] = (now, CompactResponse.from_dict(response))
+            self._entries.move_to_end(key)
+            self._trim()
+
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, function_name, response, created_at, last_access) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, function_name, pack_json(response), now, now)
+                )
+                self._db.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+                self._db.execute(
+                    "DELETE FROM responses WHERE key NOT IN "
+                    "(SELECT key FROM responses ORDER BY last_access DESC LIMIT ?)",
+                    (self.max_entries,)
+                )
+                self._db.commit()
+
+    def clear(self) -> None:
+        """Remove every cached response"""
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return entry count and hit/miss counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+    def _trim(self) -> None:
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _load(self, key: str) -> Optional[Tuple[float, CompactResponse]]:
+        row = self._db.execute("SELECT created_at, response FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return row[0], CompactResponse.from_dict(unpack_json(row[1]))
+
+    def _delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+        if self._db is not None:
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._db.commit()
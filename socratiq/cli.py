@@ -0,0 +1,141 @@
+"""
+``socratiq`` command line
+
+Queries the agent Lambdas without the Streamlit app and writes one JSON object
+per line to stdout, each as soon as its call completes:
+
+    socratiq ask VERA "What are the stability risks of a lyophilized mAb?"
+    socratiq fanout "Is a 505(b)(2) pathway viable for this reformulation?"
+    socratiq batch questions.jsonl > answers.jsonl
+    socratiq agents
+
+batch reads JSONL lines of {"agent": ..., "query": ...} (or plain-text lines,
+sent to --agent) from a file or stdin. An invalid line is reported as an
+{"ok": false, "line": ..., "error": ...} record and the rest still run. The
+exit status is 1 if any line or call failed. AWS credentials come from the
+usual boto3 sources; SOCRATIQ_LAMBDA_CLIENT_FACTORY swaps in a stand-in client.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import os
+import sys
+from typing import Callable, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from socratiq.agents import AGENTS, SOPHIE, SOPHIE_CONFIG, get_agent
+from socratiq.client import DEFAULT_MAX_CONNECTIONS, AgentClient, AsyncAgentClient
+from socratiq.payload import json_dumps, json_loads
+
+
+def read_requests(
+    lines: Iterable[str],
+    default_agent: str,
+    on_error: Optional[Callable[[int, str], None]] = None
+) -> Iterator[Tuple[str, str]]:
+    """(agent, query) pairs from JSONL or plain-text lines; blank lines are skipped
+
+    Invalid lines raise ValueError, or with on_error are passed to
+    on_error(line number, message) and skipped.
+    """
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        if not line.startswith("{"):
+            yield get_agent(default_agent)["name"], line
+            continue
+        try:
+            record = json_loads(line)
+            if not isinstance(record, dict) or not record.get("query"):
+                raise ValueError("no query")
+            agent = get_agent(record.get("agent") or default_agent)["name"]
+        except (ValueError, KeyError) as e:
+            message = f"Line {number}: {e.args[0] if isinstance(e, KeyError) else e}"
+            if on_error is None:
+                raise ValueError(message) from None
+            on_error(number, message)
+            continue
+        yield agent, record["query"]
+
+
+def _write(out: TextIO, record: dict) -> None:
+    out.buffer.write(json_dumps(record) + b"\n")
+    out.buffer.flush()
+
+
+async def _run(client: AsyncAgentClient, requests: Iterable[Tuple[str, str]], use_cache: bool, out: TextIO) -> int:
+    failed = 0
+    async with client:
+        async for response in client.stream(requests, use_cache):
+            failed += not response.ok
+            _write(out, response.to_dict())
+    return 1 if failed else 0
+
+
+class _LineErrors:
+    """on_error for read_requests: writes an error record per invalid line and remembers there was one"""
+
+    def __init__(self, out: TextIO):
+        self.out = out
+        self.count = 0
+
+    def __call__(self, number: int, message: str) -> None:
+        self.count += 1
+        _write(self.out, {"line": number, "ok": False, "error": message})
+
+
+def main(argv: Optional[List[str]] = None, out: TextIO = sys.stdout) -> int:
+    parser = argparse.ArgumentParser(prog="socratiq", description="Query the SocratIQ agents, streaming JSONL results")
+    parser.add_argument("--no-cache", action="store_true", help="Skip cached responses (fresh ones are still cached)")
+    parser.add_argument("--cache-db", default=os.environ.get("SOCRATIQ_CACHE_DB"), help="SQLite file persisting the response cache")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_MAX_CONNECTIONS, help="Maximum concurrent invocations")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ask = commands.add_parser("ask", help="Ask one agent a question")
+    ask.add_argument("agent", help=f"One of {', '.join([*AGENTS, SOPHIE])}")
+    ask.add_argument("query", nargs="+")
+
+    fanout = commands.add_parser("fanout", help="Ask several agents the same question concurrently")
+    fanout.add_argument("query", nargs="+")
+    fanout.add_argument("--agents", default=",".join(AGENTS), help="Comma-separated agents (default: every specialist)")
+
+    batch = commands.add_parser("batch", help="Answer questions from a JSONL or text file")
+    batch.add_argument("file", nargs="?", default="-", help="Input file, or - for stdin")
+    batch.add_argument("--agent", default=SOPHIE, help="Agent for lines that do not name one")
+
+    commands.add_parser("agents", help="List the agents and their Lambda functions")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "agents":
+        for agent in [*AGENTS.values(), SOPHIE_CONFIG]:
+            _write(out, {key: agent[key] for key in ("name", "full_name", "function", "description")})
+        return 0
+
+    # The input file is read lazily while the requests run, so it stays open until they finish
+    with contextlib.ExitStack() as stack:
+        line_errors = _LineErrors(out)
+        try:
+            if args.command == "ask":
+                requests: Iterable[Tuple[str, str]] = [(get_agent(args.agent)["name"], " ".join(args.query))]
+            elif args.command == "fanout":
+                query = " ".join(args.query)
+                requests = [(get_agent(name.strip())["name"], query) for name in args.agents.split(",") if name.strip()]
+            else:
+                get_agent(args.agent)
+                source = sys.stdin if args.file == "-" else stack.enter_context(open(args.file, encoding="utf-8"))
+                requests = read_requests(source, args.agent, line_errors)
+        except (KeyError, OSError) as e:
+            parser.error(str(e.args[0]) if isinstance(e, KeyError) else str(e))
+
+        client = AsyncAgentClient(
+            AgentClient.create(max_connections=args.concurrency, cache_db=args.cache_db),
+            max_concurrency=args.concurrency
+        )
+        status = asyncio.run(_run(client, requests, not args.no_cache, out))
+    return 1 if line_errors.count else status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
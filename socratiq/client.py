@@ -0,0 +1,610 @@
+"""
+SocratIQ agent client
+
+The invocation pipeline used by the Streamlit app, usable without Streamlit
+from batch jobs, notebooks and the ``socratiq`` command line:
+
+- AgentClient: synchronous and thread-safe. Serves a call from the response
+  cache, or coalesces it with an identical call already in flight, or invokes
+  the Lambda through the resilience layer (retries, hedging, circuit
+  breakers), after an optional admission queue (socratiq.admission). Streaming mode (InvokeWithResponseStream) reports partial
+  responses. The statusCode/body envelope is unwrapped and every call is
+  traced in a MetricsRegistry
+- AsyncAgentClient: asyncio front end. Calls run on a worker pool the same
+  size as the Lambda client's HTTP connection pool, so concurrent calls reuse
+  pooled connections and never queue for one. gather() and fan_out() await
+  many calls at once; stream() yields results as they complete
+- AgentResponse: typed view of a response for library callers
+
+boto3 is imported only when a Lambda client is built, so importing this
+module stays cheap.
+"""
+
+import asyncio
+import functools
+import importlib
+import json
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+
+from socratiq.admission import PRIORITY_CHAT, AdmissionController, AdmissionTimeout
+from socratiq.agents import AGENTS, SOPHIE_CONFIG, agent_label, get_agent
+from socratiq.cache import ResponseCache, make_cache_key
+from socratiq.clients import LazyClient
+from socratiq.metrics import CallTrace, MetricsRegistry, new_trace_id
+from socratiq.payload import json_loads, parse_lambda_result
+from socratiq.resilience import (
+    CIRCUIT_CLOSED,
+    RETRYABLE_STATUS_CODES,
+    CircuitOpenError,
+    InvocationError,
+    ResilientInvoker,
+    RetryPolicy,
+    is_client_error
+)
+from socratiq.singleflight import SingleFlight
+from socratiq.streaming import StreamAssembler
+
+DEFAULT_REGION = "us-east-1"
+
+# Concurrent invocations per client, and HTTP connections in the Lambda client's pool
+DEFAULT_MAX_CONNECTIONS = 16
+
+# Minimum seconds between partial re-renders of a streaming response, unless a new section arrived
+DEFAULT_RENDER_INTERVAL = 0.25
+
+# Optional "module:callable" that returns a stand-in Lambda client (e.g. benchmarks.fake_lambda:create_client)
+LAMBDA_CLIENT_FACTORY_ENV = "SOCRATIQ_LAMBDA_CLIENT_FACTORY"
+
+
+def create_lambda_client(max_connections: int = DEFAULT_MAX_CONNECTIONS, factory: Optional[str] = None, region: str = DEFAULT_REGION):
+    """Build a Lambda client with one pooled connection per concurrent invocation
+
+    factory ("module:callable", default $SOCRATIQ_LAMBDA_CLIENT_FACTORY) replaces
+    the boto3 client with a stand-in. boto3 is imported here, not at module level.
+    """
+    factory = factory or os.environ.get(LAMBDA_CLIENT_FACTORY_ENV)
+    if factory:
+        module_name, _, factory_name = factory.partition(":")
+        return getattr(importlib.import_module(module_name), factory_name)()
+
+    import boto3
+    from botocore.config import Config
+    config = Config(
+        read_timeout=300,  # 5 minutes to match Lambda timeout
+        connect_timeout=10,
+        retries={'max_attempts': 0},  # Retries are handled by the resilience layer (ResilientInvoker)
+        max_pool_connections=max_connections
+    )
+    return boto3.client('lambda', region_name=region, config=config)
+
+
+def create_invoker(max_workers: int = DEFAULT_MAX_CONNECTIONS) -> ResilientInvoker:
+    """Retries, hedging and per-agent circuit breakers with the app's settings"""
+    return ResilientInvoker(
+        retry_policy=RetryPolicy(max_attempts=3, base_delay=0.5, max_delay=8.0),
+        failure_threshold=5,
+        reset_timeout=30.0,
+        max_workers=max_workers
+    )
+
+
+def ping_function(lambda_client: Any, function_name: str) -> None:
+    """Keep-warm invocation; the handlers answer {"warmup": true} without corpus or Bedrock work"""
+    response = lambda_client.invoke(
+        FunctionName=function_name,
+        InvocationType='RequestResponse',
+        Payload=json.dumps({"warmup": True})
+    )
+    response['Payload'].read()
+    if response.get('FunctionError'):
+        raise InvocationError(f"Keep-warm ping to {function_name} failed")
+
+
+@dataclass
+class AgentResponse:
+    """One agent's answer to one query
+
+    body is the unwrapped Lambda response; meta holds the client's annotations
+    (trace_id, cache_hit, coalesced, retries, hedged, ...). latency_ms runs from
+    when a worker picked the call up; queued_ms is the wait for that worker.
+    """
+    agent: str
+    query: str
+    body: Dict[str, Any]
+    meta: Dict[str, Any] = field(default_factory=dict)
+    latency_ms: float = 0.0
+    queued_ms: float = 0.0
+
+    @classmethod
+    def from_result(
+        cls, agent: str, query: str, result: Dict[str, Any], latency_ms: float = 0.0, queued_ms: float = 0.0
+    ) -> "AgentResponse":
+        body = {k: v for k, v in result.items() if k != "_meta"}
+        return cls(agent, query, body, dict(result.get("_meta") or {}), latency_ms, queued_ms)
+
+    @property
+    def ok(self) -> bool:
+        return "error" not in self.body
+
+    @property
+    def error(self) -> Optional[str]:
+        return self.body.get("error")
+
+    @property
+    def text(self) -> Optional[str]:
+        """Agent answer, or Sophie's recommendation"""
+        return self.body.get("response") or self.body.get("recommendation")
+
+    @property
+    def confidence(self) -> Optional[float]:
+        return self.body.get("confidence")
+
+    @property
+    def sources(self) -> List[Dict[str, Any]]:
+        return self.body.get("sources") or []
+
+    @property
+    def conflicts(self) -> List[str]:
+        return self.body.get("conflicts") or []
+
+    @property
+    def agent_contributions(self) -> Dict[str, str]:
+        return self.body.get("agentContributions") or {}
+
+    @property
+    def trace_id(self) -> Optional[str]:
+        return self.meta.get("trace_id")
+
+    @property
+    def cache_hit(self) -> bool:
+        return bool(self.meta.get("cache_hit"))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Flat record, e.g. one JSONL line of ``socratiq`` output"""
+        return {
+            "agent": self.agent,
+            "query": self.query,
+            "ok": self.ok,
+            "error": self.error,
+            "latency_ms": round(self.latency_ms, 1),
+            "queued_ms": round(self.queued_ms, 1),
+            "trace_id": self.trace_id,
+            "cache_hit": self.cache_hit,
+            "coalesced": bool(self.meta.get("coalesced")),
+            "response": self.body
+        }
+
+
+class _AdmissionSlot:
+    """An admitted call's ticket, released once the call and any attempt it left running have finished"""
+
+    def __init__(self, admission: AdmissionController, ticket: Any):
+        self.admission = admission
+        self.ticket = ticket
+        self._pending: Optional[Future] = None
+
+    def hold_until(self, pending: Future) -> None:
+        """Keep the slot until pending, an attempt still invoking the function, is done"""
+        self._pending = pending
+
+    def release(self) -> None:
+        if self._pending is None:
+            self.admission.release(self.ticket)
+        else:
+            self._pending.add_done_callback(lambda _: self.admission.release(self.ticket))
+
+
+class AgentClient:
+    """Thread-safe synchronous client for the agent Lambdas
+
+    Components default to private instances; the Streamlit app passes its
+    process-wide ones so every session shares them. on_round_trip(agent,
+    latency_ms) is told about each completed invocation (e.g.
+    WarmupScheduler.record_call). With an admission controller, invocations
+    (not cache hits or coalesced calls) wait for a slot on their function first.
+    """
+
+    def __init__(
+        self,
+        lambda_client: Any,
+        invoker: Optional[ResilientInvoker] = None,
+        cache: Optional[ResponseCache] = None,
+        inflight: Optional[SingleFlight] = None,
+        metrics: Optional[MetricsRegistry] = None,
+        on_round_trip: Optional[Callable[[str, float], None]] = None,
+        render_interval: float = DEFAULT_RENDER_INTERVAL,
+        admission: Optional[AdmissionController] = None
+    ):
+        self.lambda_client = lambda_client
+        self.admission = admission
+        self.invoker = invoker or create_invoker()
+        self.cache = cache or ResponseCache()
+        self.inflight = inflight or SingleFlight()
+        self.metrics = metrics or MetricsRegistry()
+        self.on_round_trip = on_round_trip
+        self.render_interval = render_interval
+
+    @classmethod
+    def create(
+        cls,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        cache_db: Optional[str] = None,
+        cache_size: int = 256,
+        cache_ttl: float = 3600,
+        factory: Optional[str] = None,
+        region: str = DEFAULT_REGION
+    ) -> "AgentClient":
+        """Client with its own Lambda client (built in the background), invoker, cache and metrics"""
+        return cls(
+            LazyClient(functools.partial(create_lambda_client, max_connections, factory, region)),
+            invoker=create_invoker(max_connections),
+            cache=ResponseCache(max_entries=cache_size, ttl_seconds=cache_ttl, db_path=cache_db)
+        )
+
+    def ask(
+        self,
+        agent: str,
+        query: str,
+        use_cache: bool = True,
+        on_update: Optional[Callable[[Dict[str, Any]], None]] = None,
+        trace_prefix: str = "socratiq"
+    ) -> Dict[str, Any]:
+        """Ask an agent ("VERA", ..., "Sophie") a question; see call()"""
+        config = get_agent(agent)
+        if config is SOPHIE_CONFIG:
+            return self.call(config["function"], query, f"{trace_prefix}-sophie", "Sophie", use_cache, on_update)
+        return self.call(config["function"], query, trace_prefix, "Agent", use_cache, on_update)
+
+    def call(
+        self,
+        function_name: str,
+        query: str,
+        trace_prefix: str,
+        caller: str,
+        use_cache: bool = True,
+        on_update: Optional[Callable[[Dict[str, Any]], None]] = None,
+        user: Optional[str] = None,
+        priority: int = PRIORITY_CHAT,
+        on_wait: Optional[Callable[[int, float], None]] = None
+    ) -> Dict[str, Any]:
+        """Serve a response from the response cache, falling back to invoking the function.
+
+        With use_cache=False the cache lookup is skipped but the fresh response still
+        replaces any cached entry. Errors are never cached and are returned as
+        {"error": ...} dicts rather than raised. When on_update is given the
+        function is invoked in streaming mode.
+
+        user, priority and on_wait(position, eta_s) are passed to the admission
+        controller, if any; its queue wait is the trace's "queue" phase.
+
+        Concurrent identical calls (same function, same normalized query) share a
+        single in-flight invocation, streamed if its first caller streams. Queue
+        position and partial responses are relayed to every caller, and each
+        caller's on_wait and on_update run on that caller's own thread. Every
+        call is traced in metrics; the trace ID and the call's total latency_ms
+        are returned in the response's _meta.
+        """
+        trace = CallTrace(agent_label(function_name), new_trace_id(trace_prefix))
+
+        if use_cache:
+            cached = self.cache.get(function_name, query)
+            if cached is not None:
+                trace.cache_hit = True
+                trace.finish()
+                self.metrics.record(trace)
+                cached["_meta"] = {"cache_hit": True, "trace_id": trace.trace_id, "latency_ms": trace.total_ms}
+                return cached
+
+        stream = on_update is not None
+
+        # Shared by every caller of the invocation, so it only reports progress; see on_progress
+        def invoke(report: Callable[[Tuple[str, Any]], None]) -> Dict[str, Any]:
+            ticket = None
+            if self.admission is not None:
+                try:
+                    with trace.span("queue"):
+                        ticket = self.admission.acquire(
+                            trace.agent, user, priority, lambda position, eta_s: report(("wait", (position, eta_s)))
+                        )
+                except AdmissionTimeout as e:
+                    return {"error": str(e)}
+            slot = _AdmissionSlot(self.admission, ticket) if ticket is not None else None
+            try:
+                if stream:
+                    # Callers render a snapshot on their own threads while the stream keeps assembling
+                    result = self._stream_function(
+                        function_name, query, caller, trace, lambda partial: report(("update", dict(partial))), slot
+                    )
+                else:
+                    result = self._call_function(function_name, query, caller, trace, slot)
+            finally:
+                if slot is not None:
+                    slot.release()
+            if ticket is not None and ticket.waited_ms >= 1:
+                result.setdefault("_meta", {})["queued_ms"] = ticket.waited_ms
+
+            if "error" not in result:
+                self.cache.set(function_name, query, {k: v for k, v in result.items() if k != "_meta"})
+            # Handed to coalesced callers, whose own traces would otherwise have no phases
+            result.setdefault("_meta", {})["spans"] = dict(trace.spans)
+            return result
+
+        def on_progress(progress: Tuple[str, Any]) -> None:
+            kind, value = progress
+            if kind == "wait" and on_wait is not None:
+                on_wait(*value)
+            elif kind == "update" and on_update is not None:
+                on_update(value)
+
+        shared_response, coalesced = self.inflight.do(make_cache_key(function_name, query), invoke, on_progress)
+
+        # The result may be shared with other callers, so annotate a copy
+        response = dict(shared_response)
+        meta = dict(response.pop("_meta", {}))
+        spans = meta.pop("spans", {})
+        if coalesced:
+            # A follower waited on the leader's invocation, so its phases are the leader's
+            trace.spans.update(spans)
+        trace.coalesced = coalesced
+        trace.error = "error" in response
+        trace.finish()
+        self.metrics.record(trace)
+        response["_meta"] = {
+            **meta, "cache_hit": False, "coalesced": coalesced, "trace_id": trace.trace_id, "latency_ms": trace.total_ms
+        }
+        return response
+
+    def _reserve_hedge_for(self, label: str) -> Callable[[], Optional[Callable[[], None]]]:
+        """reserve_hedge for ResilientInvoker.call: an admission slot for label's hedge, released when it finishes"""
+        def reserve_hedge() -> Optional[Callable[[], None]]:
+            ticket = self.admission.try_acquire(label)
+            return None if ticket is None else functools.partial(self.admission.release, ticket)
+
+        return reserve_hedge
+
+    def ping(self, function_name: str) -> None:
+        ping_function(self.lambda_client, function_name)
+
+    def _round_trip(self, label: str, latency_ms: float) -> None:
+        if self.on_round_trip is not None:
+            self.on_round_trip(label, latency_ms)
+
+    def _invoke_once(self, function_name: str, query: str, caller: str, trace: CallTrace) -> Dict[str, Any]:
+        """Make one synchronous invocation attempt, raising on any failure.
+
+        Function errors and non-200 envelopes raise InvocationError, classified as
+        retryable for timeouts and RETRYABLE_STATUS_CODES, and as client errors for
+        other function errors and 4xx statuses. Phase timings are recorded on trace.
+        """
+        with trace.span("serialize"):
+            payload = json.dumps({
+                "query": query,
+                "traceId": trace.trace_id
+            })
+
+        started = time.perf_counter()
+        with trace.span("round_trip"):
+            response = self.lambda_client.invoke(
+                FunctionName=function_name,
+                InvocationType='RequestResponse',
+                Payload=payload
+            )
+            raw = response['Payload'].read()
+        self._round_trip(trace.agent, (time.perf_counter() - started) * 1000)
+
+        # Includes the second json.loads of API Gateway style string bodies
+        with trace.span("parse"):
+            result = json_loads(raw)
+            if response.get('FunctionError'):
+                message = result.get('errorMessage', response['FunctionError']) if isinstance(result, dict) else str(result)
+                timed_out = "timed out" in message.lower()
+                raise InvocationError(f"{caller} failed: {message}", retryable=timed_out, client_error=not timed_out)
+
+            parsed = parse_lambda_result(result, caller)
+            if 'statusCode' in result and result['statusCode'] != 200:
+                status = result['statusCode']
+                retryable = status in RETRYABLE_STATUS_CODES
+                raise InvocationError(parsed['error'], retryable=retryable, client_error=400 <= status < 500 and not retryable)
+            return parsed
+
+    def _call_function(
+        self,
+        function_name: str,
+        query: str,
+        caller: str,
+        trace: CallTrace,
+        slot: Optional[_AdmissionSlot] = None
+    ) -> Dict[str, Any]:
+        """Invoke a Lambda function synchronously through the resilience layer.
+
+        Retries on retryable errors, sends a hedged duplicate for slow single-agent
+        calls, and fails fast while the agent's circuit breaker is open. Errors are
+        returned as {"error": ...} dicts rather than raised. When a hedge wins while
+        the primary is still invoking, slot is held until the primary finishes.
+        """
+        hedge = function_name != SOPHIE_CONFIG["function"]
+
+        def attempt(is_hedge: bool) -> Dict[str, Any]:
+            # Hedges run concurrently with the primary, so they get their own (unrecorded) trace
+            attempt_trace = CallTrace(trace.agent, f"{trace.trace_id}-hedge") if is_hedge else trace
+            return self._invoke_once(function_name, query, caller, attempt_trace)
+
+        # A hedge is a second invocation in flight, so it needs a free slot of its own
+        reserve_hedge = self._reserve_hedge_for(trace.agent) if self.admission is not None else None
+
+        try:
+            result, outcome = self.invoker.call(trace.agent, attempt, hedge=hedge, reserve_hedge=reserve_hedge)
+        except CircuitOpenError as e:
+            trace.circuit_open = True
+            return {"error": str(e)}
+        except Exception as e:
+            return {"error": str(e)}
+
+        if outcome.pending is not None and slot is not None:
+            slot.hold_until(outcome.pending)
+        trace.retries = outcome.retries
+        trace.hedged = outcome.hedged
+        result.setdefault("_meta", {}).update({"retries": outcome.retries, "hedged": outcome.hedged})
+        return result
+
+    def _stream_function(
+        self,
+        function_name: str,
+        query: str,
+        caller: str,
+        trace: CallTrace,
+        on_update: Callable[[Dict[str, Any]], None],
+        slot: Optional[_AdmissionSlot] = None
+    ) -> Dict[str, Any]:
+        """Invoke a Lambda function with InvokeWithResponseStream, reporting partial responses.
+
+        on_update receives the partially assembled response whenever a section arrives
+        (throttled to render_interval). Falls back to a buffered RequestResponse
+        invocation when the stream cannot be opened, which holds slot as _call_function does.
+        """
+        # Degraded agents go through the buffered path, where the circuit breaker decides
+        breaker = self.invoker.breaker(trace.agent)
+        if breaker.snapshot()["state"] != CIRCUIT_CLOSED:
+            return self._call_function(function_name, query, caller, trace, slot)
+
+        with trace.span("serialize"):
+            payload = json.dumps({
+                "query": query,
+                "traceId": trace.trace_id
+            })
+
+        started = time.perf_counter()
+        try:
+            response = self.lambda_client.invoke_with_response_stream(
+                FunctionName=function_name,
+                InvocationType='RequestResponse',
+                Payload=payload
+            )
+        except Exception:
+            result = self._call_function(function_name, query, caller, trace, slot)
+            result.setdefault("_meta", {})["streamed"] = False
+            return result
+
+        try:
+            assembler = StreamAssembler(caller)
+            first_byte_ms = None
+            last_render = 0.0
+            seen_sections = set()
+            in_loop_ms = 0.0  # Parse and partial-render time spent while the stream is open
+
+            for event in response['EventStream']:
+                if 'PayloadChunk' in event:
+                    if first_byte_ms is None:
+                        first_byte_ms = (time.perf_counter() - started) * 1000
+                        trace.add("first_byte", first_byte_ms)
+
+                    step_started = time.perf_counter()
+                    with trace.span("parse"):
+                        updated = assembler.feed(event['PayloadChunk']['Payload'])
+                    new_section = not seen_sections.issuperset(updated)
+                    seen_sections.update(updated)
+                    if updated and (new_section or time.perf_counter() - last_render >= self.render_interval):
+                        with trace.span("render"):
+                            on_update(assembler.response)
+                        last_render = time.perf_counter()
+                    in_loop_ms += (time.perf_counter() - step_started) * 1000
+
+                elif 'InvokeComplete' in event and event['InvokeComplete'].get('ErrorCode'):
+                    complete = event['InvokeComplete']
+                    # As in _invoke_once, only timeouts count against the agent; other function errors are the query's
+                    if "timed" in f"{complete['ErrorCode']} {complete.get('ErrorDetails', '')}".lower():
+                        breaker.record_failure()
+                    return {"error": f"{caller} failed: {complete['ErrorCode']} {complete.get('ErrorDetails', '')}".strip()}
+
+            round_trip_ms = (time.perf_counter() - started) * 1000 - in_loop_ms
+            trace.add("round_trip", round_trip_ms)
+            self._round_trip(trace.agent, round_trip_ms)
+            with trace.span("parse"):
+                result = assembler.finish()
+            status = assembler.status_code
+            if "error" in result and status is not None and (status >= 500 or status in RETRYABLE_STATUS_CODES):
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            result.setdefault("_meta", {}).update({"streamed": assembler.incremental, "ttfb_ms": first_byte_ms})
+            return result
+
+        except Exception as e:
+            if not is_client_error(e):
+                breaker.record_failure()
+            return {"error": str(e)}
+
+
+class AsyncAgentClient:
+    """asyncio client for the agent Lambdas, backed by an AgentClient
+
+    At most max_concurrency invocations run at once, one per pooled HTTP
+    connection; further calls wait for a free worker. Use as an async context
+    manager, or call close() when done.
+    """
+
+    def __init__(self, client: Optional[AgentClient] = None, max_concurrency: int = DEFAULT_MAX_CONNECTIONS):
+        self.client = client or AgentClient.create(max_connections=max_concurrency)
+        self.max_concurrency = max_concurrency
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="socratiq-async")
+
+    async def __aenter__(self) -> "AsyncAgentClient":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+
+    async def ask(self, agent: str, query: str, use_cache: bool = True) -> AgentResponse:
+        """Ask one agent ("VERA", ..., "Sophie") one question"""
+        name = get_agent(agent)["name"]
+
+        def run() -> Tuple[Dict[str, Any], float]:
+            started = time.perf_counter()
+            return self.client.ask(name, query, use_cache, trace_prefix="socratiq-async"), started
+
+        submitted = time.perf_counter()
+        result, started = await asyncio.get_running_loop().run_in_executor(self._executor, run)
+        finished = time.perf_counter()
+        return AgentResponse.from_result(name, query, result, (finished - started) * 1000, (started - submitted) * 1000)
+
+    async def gather(self, requests: Iterable[Tuple[str, str]], use_cache: bool = True) -> List[AgentResponse]:
+        """Run (agent, query) requests concurrently; responses in request order"""
+        return list(await asyncio.gather(*(self.ask(agent, query, use_cache) for agent, query in requests)))
+
+    async def fan_out(self, query: str, agents: Optional[Iterable[str]] = None, use_cache: bool = True) -> Dict[str, AgentResponse]:
+        """Ask several agents (default: every specialist) the same question at once"""
+        names = list(agents) if agents is not None else list(AGENTS)
+        responses = await self.gather(((agent, query) for agent in names), use_cache)
+        return {response.agent: response for response in responses}
+
+    async def stream(self, requests: Iterable[Tuple[str, str]], use_cache: bool = True) -> AsyncIterator[AgentResponse]:
+        """Yield responses to (agent, query) requests as they complete
+
+        requests is consumed lazily, keeping about twice max_concurrency calls
+        pending, so arbitrarily long inputs run in bounded memory.
+        """
+        pending = set()
+        window = self.max_concurrency * 2
+        try:
+            for agent, query in requests:
+                pending.add(asyncio.ensure_future(self.ask(agent, query, use_cache)))
+                if len(pending) >= window:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        yield task.result()
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            # Reached early when requests raises or the consumer stops iterating
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
@@ -0,0 +1,76 @@
+"""
+Deferred construction of AWS SDK clients
+
+Importing boto3/botocore and building a client takes a few hundred
+milliseconds, which the app should not spend before its first page render:
+most pages never invoke a Lambda. LazyClient builds the client on a
+background thread as soon as it is created and proxies attribute access to
+it, so only a caller that needs the client before it is ready waits for it.
+"""
+
+import threading
+import time
+from typing import Any, Callable, Optional
+
+
+class LazyClient:
+    """Proxy for a client built by factory() on a background thread
+
+    A failed build is re-raised to the callers waiting for it. The next call
+    after that starts a fresh attempt.
+    """
+
+    def __init__(self, factory: Callable[[], Any], preload: bool = True):
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._started = False
+        self._client: Any = None
+        self._error: Optional[BaseException] = None
+        self.build_ms: Optional[float] = None
+        if preload:
+            self.preload()
+
+    @property
+    def ready(self) -> bool:
+        return self._client is not None
+
+    def preload(self) -> None:
+        """Start building the client in the background if no build has started yet"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            self._ready.clear()
+        threading.Thread(target=self._build, name="lazy-client", daemon=True).start()
+
+    def get(self) -> Any:
+        """The client, waiting for the background build if it has not finished"""
+        if self._client is not None:
+            return self._client
+        self.preload()
+        self._ready.wait()
+        with self._lock:
+            if self._client is not None:
+                return self._client
+            error = self._error
+            self._started = False
+        raise error
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.get(), name)
+
+    def _build(self) -> None:
+        started = time.perf_counter()
+        try:
+            client = self._factory()
+        except BaseException as e:
+            with self._lock:
+                self._error = e
+        else:
+            with self._lock:
+                self._client = client
+                self._error = None
+                self.build_ms = (time.perf_counter() - started) * 1000
+        finally:
+            self._ready.set()
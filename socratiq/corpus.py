@@ -0,0 +1,462 @@
+"""
+Local BM25 index over the agent corpora in corpus-downloads
+
+The Lambda retrieval path (lambda/shared/corpus-retrieval.ts) lists and
+downloads every corpus document from S3 on each query and regex-scans it once
+per query term. This module indexes the same documents locally, from
+``corpus-downloads/<agent>/documents/**`` plus CORPUS_ATTRIBUTION_METADATA.json,
+so the app can preview which sources an agent would cite in milliseconds.
+
+The index is persisted in a directory:
+
+- ``lexicon.json``: document table (path, agent, title, attribution, length,
+  file size/mtime) and term -> (offset, document frequency)
+- ``postings-<generation>.bin``: (document, term frequency) uint32 pairs
+  grouped by term, memory-mapped at load time so a query only touches the
+  postings of its terms. Each build writes a new generation, named in the
+  lexicon, because a file that is still mapped cannot be replaced on Windows
+- ``forward.json``: per-document term frequencies, read only when re-indexing
+
+refresh() stats the corpus and re-tokenizes only files that were added or
+modified since the last build; unchanged documents reuse their stored term
+frequencies. Files are written to temporary paths and swapped in atomically,
+and searches run against an immutable snapshot, so a refresh never disturbs a
+concurrent query. Postings generations no longer in use are deleted once
+nothing maps them.
+"""
+
+import argparse
+import heapq
+import json
+import math
+import mmap
+import os
+import re
+import sys
+import threading
+import time
+from array import array
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+INDEX_VERSION = 2
+
+METADATA_FILENAME = "CORPUS_ATTRIBUTION_METADATA.json"
+
+# File types indexed under <agent>/documents
+DOCUMENT_EXTENSIONS = (".md", ".txt")
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_LEXICON_FILE = "lexicon.json"
+_POSTINGS_PREFIX = "postings"
+_FORWARD_FILE = "forward.json"
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+
+STOPWORDS = frozenset("""
+a an and are as at be been but by can do does for from had has have how i if in
+into is it its may more most not of on or our should so such than that the their
+them then there these they this to was we were what when where which while who
+why will with would you your
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased alphanumeric terms, with stopwords and single characters dropped"""
+    return [
+        term for term in _TOKEN_RE.findall(text.lower())
+        if len(term) > 1 and term not in STOPWORDS
+    ]
+
+
+def _markdown_field(content: str, label: str) -> Optional[str]:
+    """Value of a ``**Label**: value`` header line"""
+    match = re.search(r"^\*\*" + re.escape(label) + r"\*\*:\s*(.+)$", content, re.MULTILINE)
+    return match.group(1).strip() if match else None
+
+
+def _markdown_title(content: str) -> Optional[str]:
+    match = re.search(r"^#\s+(.+)$", content, re.MULTILINE)
+    return match.group(1).strip() if match else None
+
+
+def load_attribution(root: str) -> Dict[Tuple[str, str], Dict[str, Any]]:
+    """Attribution records keyed by (agent, path relative to the agent directory)"""
+    try:
+        with open(os.path.join(root, METADATA_FILENAME), "r", encoding="utf-8") as f:
+            documents = json.load(f).get("documents", [])
+    except (OSError, ValueError):
+        return {}
+    return {
+        (str(doc.get("agent", "")).upper(), doc.get("file_path", "")): doc
+        for doc in documents
+    }
+
+
+def attribution_stamp(root: str) -> Optional[List[int]]:
+    """(mtime_ns, size) of the attribution metadata file, or None if it is missing"""
+    try:
+        stat = os.stat(os.path.join(root, METADATA_FILENAME))
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def scan_corpus(root: str) -> Dict[str, os.stat_result]:
+    """Corpus documents (path relative to root -> stat) under <agent>/documents"""
+    found = {}
+    if not os.path.isdir(root):
+        return found
+    for agent_dir in sorted(os.listdir(root)):
+        documents_dir = os.path.join(root, agent_dir, "documents")
+        if not os.path.isdir(documents_dir):
+            continue
+        for dirpath, _, filenames in os.walk(documents_dir):
+            for filename in filenames:
+                if filename.endswith(DOCUMENT_EXTENSIONS):
+                    full_path = os.path.join(dirpath, filename)
+                    rel_path = os.path.relpath(full_path, root).replace(os.sep, "/")
+                    found[rel_path] = os.stat(full_path)
+    return found
+
+
+def describe_document(
+    rel_path: str,
+    content: str,
+    metadata: Dict[Tuple[str, str], Dict[str, Any]]
+) -> Dict[str, Any]:
+    """Document fields: attribution from the metadata file, else the markdown header"""
+    agent_dir, _, agent_path = rel_path.partition("/")
+    agent = agent_dir.upper()
+    parts = agent_path.split("/")
+    meta = metadata.get((agent, agent_path), {})
+    legal = meta.get("legal_status") or {}
+    return {
+        "path": rel_path,
+        "agent": agent,
+        "category": parts[1] if len(parts) > 2 else "general",
+        "title": meta.get("title") or _markdown_title(content) or parts[-1],
+        "source": meta.get("source") or _markdown_field(content, "Source") or "Internal Corpus",
+        "url": meta.get("url") or _markdown_field(content, "URL") or _markdown_field(content, "Source URL") or "",
+        "legal_status": legal.get("copyright_status") or _markdown_field(content, "Legal Status") or "Unknown",
+        "attribution": meta.get("attribution_template", "")
+    }
+
+
+def excerpt(content: str, query: str, max_length: int = 500) -> str:
+    """Up to three sentences mentioning a query term (the opening sentences if none do)"""
+    terms = set(tokenize(query))
+    # Skip headings, "**Field**: value" header lines and rules; drop list markers and emphasis
+    sentences = [
+        sentence.strip().lstrip("-* ").replace("**", "")
+        for sentence in _SENTENCE_RE.split(content)
+        if sentence.strip() and not sentence.lstrip().startswith(("#", "**", "---"))
+    ]
+
+    relevant = [s for s in sentences if terms & set(tokenize(s))]
+    text = " ".join((relevant or sentences)[:3])
+    return text if len(text) <= max_length else text[:max_length].rstrip() + "..."
+
+
+@dataclass(frozen=True)
+class CorpusHit:
+    """A ranked corpus document, with the attribution an agent would cite"""
+    path: str
+    agent: str
+    category: str
+    title: str
+    source: str
+    url: str
+    legal_status: str
+    attribution: str
+    score: float
+    excerpt: str = ""
+
+
+class _Snapshot:
+    """Immutable view of one index generation; the postings stay mapped while referenced"""
+
+    def __init__(self, docs: List[Dict[str, Any]], terms: Dict[str, List[int]], postings):
+        self.docs = docs
+        self.terms = terms
+        self.postings = postings
+        self.avgdl = (sum(doc["length"] for doc in docs) / len(docs)) if docs else 0.0
+
+
+class CorpusIndex:
+    """Persisted inverted index with BM25 ranking over corpus-downloads"""
+
+    def __init__(self, root: str, index_dir: str, refresh_interval: float = 30.0):
+        self.root = os.path.abspath(root)
+        self.index_dir = index_dir
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._last_check = 0.0
+        self._metadata_stamp: Optional[List[int]] = None
+        self._snapshot = _Snapshot([], {}, memoryview(b"").cast("I"))
+        self._last_refresh: Dict[str, Any] = {}
+        os.makedirs(index_dir, exist_ok=True)
+        self._load()
+
+    # -- persistence -----------------------------------------------------
+
+    def _load(self) -> None:
+        lexicon_path = os.path.join(self.index_dir, _LEXICON_FILE)
+        try:
+            with open(lexicon_path, "r", encoding="utf-8") as f:
+                lexicon = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        if (lexicon.get("version") != INDEX_VERSION
+                or lexicon.get("byteorder") != sys.byteorder
+                or lexicon.get("root") != self.root):
+            return
+
+        postings = self._map_postings(lexicon.get("postings_file", ""))
+        if postings is None or len(postings) != lexicon.get("postings_length"):
+            return  # Interrupted build; the next refresh re-indexes everything
+
+        self._metadata_stamp = lexicon.get("metadata_stamp")
+        self._snapshot = _Snapshot(lexicon["docs"], lexicon["terms"], postings)
+
+    def _map_postings(self, filename: str):
+        """The postings file as uint32s, or None if it is missing"""
+        path = os.path.join(self.index_dir, filename)
+        if not filename or not os.path.exists(path):
+            return None
+        if os.path.getsize(path) == 0:
+            return memoryview(b"").cast("I")
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return memoryview(mapped).cast("I")
+
+    def _remove_stale_postings(self, current: str) -> None:
+        for filename in os.listdir(self.index_dir):
+            if filename.startswith(_POSTINGS_PREFIX) and filename != current:
+                try:
+                    os.remove(os.path.join(self.index_dir, filename))
+                except OSError:
+                    pass  # Still mapped by a snapshot (Windows); removed after a later build
+
+    def _load_forward(self) -> Dict[str, Dict[str, int]]:
+        try:
+            with open(os.path.join(self.index_dir, _FORWARD_FILE), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_atomic(self, filename: str, data: bytes) -> None:
+        path = os.path.join(self.index_dir, filename)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    # -- indexing --------------------------------------------------------
+
+    def refresh(self, force: bool = False) -> Dict[str, Any]:
+        """Re-index added, modified and removed documents; returns what changed"""
+        with self._lock:
+            started = time.perf_counter()
+            self._last_check = time.time()
+            snapshot = self._snapshot
+            previous = {doc["path"]: doc for doc in snapshot.docs}
+            files = scan_corpus(self.root)
+            metadata_stamp = attribution_stamp(self.root)
+            metadata_changed = metadata_stamp != self._metadata_stamp
+
+            changed = [
+                path for path, stat in files.items()
+                if force or path not in previous
+                or previous[path]["mtime_ns"] != stat.st_mtime_ns
+                or previous[path]["size"] != stat.st_size
+            ]
+            removed = [path for path in previous if path not in files]
+
+            stats = {"documents": len(files), "reindexed": len(changed), "removed": len(removed)}
+            if not changed and not removed and not metadata_changed:
+                stats["elapsed_ms"] = (time.perf_counter() - started) * 1000
+                self._last_refresh = stats
+                return stats
+
+            forward = {} if force else self._load_forward()
+            metadata = load_attribution(self.root)
+            docs = []
+            for path in sorted(files):
+                stat = files[path]
+                needs_read = path in changed or metadata_changed or path not in forward
+                if needs_read:
+                    with open(os.path.join(self.root, path), "r", encoding="utf-8", errors="replace") as f:
+                        content = f.read()
+                    doc = describe_document(path, content, metadata)
+                    if path in changed or path not in forward:
+                        counts: Dict[str, int] = {}
+                        for term in tokenize(content):
+                            counts[term] = counts.get(term, 0) + 1
+                        forward[path] = counts
+                else:
+                    doc = {key: value for key, value in previous[path].items()}
+                doc.update(length=sum(forward[path].values()), mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+                docs.append(doc)
+            forward = {path: forward[path] for path in files}
+
+            # Rebuild the postings from the forward index, grouped by term
+            postings_by_term: Dict[str, List[Tuple[int, int]]] = {}
+            for doc_id, doc in enumerate(docs):
+                for term, tf in forward[doc["path"]].items():
+                    postings_by_term.setdefault(term, []).append((doc_id, tf))
+
+            postings = array("I")
+            terms = {}
+            for term in sorted(postings_by_term):
+                entries = postings_by_term[term]
+                terms[term] = [len(postings) // 2, len(entries)]
+                for doc_id, tf in entries:
+                    postings.append(doc_id)
+                    postings.append(tf)
+
+            postings_file = f"{_POSTINGS_PREFIX}-{time.time_ns():x}.bin"
+            lexicon = {
+                "version": INDEX_VERSION,
+                "byteorder": sys.byteorder,
+                "root": self.root,
+                "metadata_stamp": metadata_stamp,
+                "built_at": time.time(),
+                "postings_file": postings_file,
+                "postings_length": len(postings),
+                "docs": docs,
+                "terms": terms
+            }
+            self._write_atomic(postings_file, postings.tobytes())
+            self._write_atomic(_FORWARD_FILE, json.dumps(forward).encode("utf-8"))
+            self._write_atomic(_LEXICON_FILE, json.dumps(lexicon).encode("utf-8"))
+
+            self._metadata_stamp = metadata_stamp
+            self._snapshot = _Snapshot(docs, terms, self._map_postings(postings_file))
+            self._remove_stale_postings(postings_file)
+            stats["elapsed_ms"] = (time.perf_counter() - started) * 1000
+            self._last_refresh = stats
+            return stats
+
+    def maybe_refresh(self) -> Optional[Dict[str, Any]]:
+        """Refresh if the corpus has not been checked for refresh_interval seconds"""
+        if time.time() - self._last_check < self.refresh_interval:
+            return None
+        return self.refresh()
+
+    # -- querying --------------------------------------------------------
+
+    def search(
+        self,
+        query: str,
+        agents: Optional[List[str]] = None,
+        limit: int = 5,
+        with_excerpts: bool = True
+    ) -> List[CorpusHit]:
+        """Top documents for a query by BM25, optionally restricted to some agents' corpora"""
+        snapshot = self._snapshot
+        n_docs = len(snapshot.docs)
+        if not n_docs:
+            return []
+        agents = {agent.upper() for agent in agents} if agents else None
+
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            entry = snapshot.terms.get(term)
+            if entry is None:
+                continue
+            offset, df = entry
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            pairs = snapshot.postings[offset * 2:(offset + df) * 2]
+            for i in range(0, len(pairs), 2):
+                doc_id, tf = pairs[i], pairs[i + 1]
+                doc = snapshot.docs[doc_id]
+                if agents and doc["agent"] not in agents:
+                    continue
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * doc["length"] / snapshot.avgdl)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        hits = []
+        for doc_id, score in heapq.nlargest(limit, scores.items(), key=lambda item: item[1]):
+            doc = snapshot.docs[doc_id]
+            text = ""
+            if with_excerpts:
+                try:
+                    with open(os.path.join(self.root, doc["path"]), "r", encoding="utf-8", errors="replace") as f:
+                        text = excerpt(f.read(), query)
+                except OSError:
+                    pass
+            hits.append(CorpusHit(
+                path=doc["path"],
+                agent=doc["agent"],
+                category=doc["category"],
+                title=doc["title"],
+                source=doc["source"],
+                url=doc["url"],
+                legal_status=doc["legal_status"],
+                attribution=doc["attribution"],
+                score=score,
+                excerpt=text
+            ))
+        return hits
+
+    def stats(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        agents: Dict[str, int] = {}
+        for doc in snapshot.docs:
+            agents[doc["agent"]] = agents.get(doc["agent"], 0) + 1
+        return {
+            "documents": len(snapshot.docs),
+            "terms": len(snapshot.terms),
+            "postings": len(snapshot.postings) // 2,
+            "agents": agents,
+            "last_refresh": dict(self._last_refresh)
+        }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Build or query the local corpus index")
+    parser.add_argument("query", nargs="*", help="Query to run after refreshing the index")
+    parser.add_argument("--root", default="corpus-downloads", help="corpus-downloads directory")
+    parser.add_argument(
+        "--index-dir",
+        default=os.path.join(
+            os.environ.get("SOCRATIQ_DATA_DIR", os.path.join(os.path.expanduser("~"), ".socratiq")),
+            "corpus-index"
+        ),
+        help="Directory holding the persisted index"
+    )
+    parser.add_argument("--agent", help="Restrict results to one agent's corpus (e.g. VERA)")
+    parser.add_argument("--limit", type=int, default=5)
+    parser.add_argument("--rebuild", action="store_true", help="Re-index every document")
+    args = parser.parse_args(argv)
+
+    index = CorpusIndex(args.root, args.index_dir)
+    refreshed = index.refresh(force=args.rebuild)
+    print(
+        f"Indexed {refreshed['documents']} documents "
+        f"({refreshed['reindexed']} re-indexed, {refreshed['removed']} removed) "
+        f"in {refreshed['elapsed_ms']:.1f} ms"
+    )
+
+    if args.query:
+        started = time.perf_counter()
+        hits = index.search(
+            " ".join(args.query),
+            agents=[args.agent] if args.agent else None,
+            limit=args.limit
+        )
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        for rank, hit in enumerate(hits, 1):
+            print(f"{rank}. [{hit.agent}] {hit.title} ({hit.score:.2f})")
+            print(f"   {hit.source} - {hit.url or hit.path}")
+        print(f"{len(hits)} results in {elapsed_ms:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
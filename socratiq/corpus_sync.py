@@ -0,0 +1,640 @@
+"""
+Content-addressed sync of corpus-downloads to the agent corpus buckets
+
+corpus-downloads/upload-to-s3.sh runs ``aws s3 sync`` for each agent. That
+compares sizes and timestamps, so a fresh checkout or a re-download pushes
+every document again. The Lambda retrieval code (lambda/shared/corpus-retrieval.ts)
+then lists the bucket and GETs each document separately. This module uploads
+by content instead:
+
+- build_manifest() hashes every ``<agent>/documents/**`` file (SHA-256) along
+  with CORPUS_ATTRIBUTION_METADATA.json. It reuses the previous manifest's
+  hash for files whose size and mtime have not changed
+- each bucket keeps the manifest of what it holds under ``sync/manifest.json``.
+  A sync uploads only documents whose hash differs, in parallel. Objects over
+  the multipart threshold have their parts uploaded in parallel too
+- each bucket also gets a packed snapshot, ``sync/corpus.pack``: an index plus
+  the concatenated zlib-compressed documents. A reader fetches it with one GET
+  and memory-maps it (CorpusPack). It is republished only when the bucket's
+  content digest changes
+
+The S3 calls are the subset of the boto3 client API listed in LocalS3Client,
+so moto works unchanged, and LocalS3Client stores the buckets in a local
+directory for offline runs. The manifest is written last, so an interrupted
+sync uploads whatever it missed on the next run.
+"""
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+from socratiq.agents import AGENTS, SOPHIE
+from socratiq.corpus import (
+    METADATA_FILENAME,
+    attribution_stamp,
+    describe_document,
+    load_attribution,
+    scan_corpus
+)
+
+MANIFEST_VERSION = 1
+PACK_VERSION = 1
+
+# Object keys, outside the documents/ prefix the Lambda retrieval code lists
+MANIFEST_KEY = "sync/manifest.json"
+SNAPSHOT_KEY = "sync/corpus.pack"
+
+BUCKET_TEMPLATE = "socratiq-{agent}-corpus-{environment}"
+
+# Objects larger than this are uploaded in parts of MULTIPART_PART_SIZE (S3's minimum part is 5 MiB)
+MULTIPART_THRESHOLD = 8 * 1024 * 1024
+MULTIPART_PART_SIZE = 8 * 1024 * 1024
+
+# Concurrent object uploads, and concurrent part uploads across all multipart objects
+DEFAULT_WORKERS = 8
+
+# Pack layout: magic, version, index length, then the JSON index and the document data
+PACK_MAGIC = b"SQCP"
+_PACK_HEADER = struct.Struct("<4sHxxQ")
+
+CONTENT_TYPES = {".md": "text/markdown; charset=utf-8", ".txt": "text/plain; charset=utf-8"}
+
+_MISSING_CODES = {"NoSuchKey", "NoSuchUpload", "404", "NotFound"}
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def bucket_name(agent: str, environment: str = "prod") -> str:
+    """Corpus bucket for an agent, as created by infrastructure/s3/deploy-buckets.sh"""
+    return BUCKET_TEMPLATE.format(agent=agent.lower(), environment=environment)
+
+
+def content_digest(documents: Dict[str, Dict[str, Any]], metadata_sha256: Optional[str]) -> str:
+    """Digest of a set of documents' paths and hashes plus the attribution metadata"""
+    listing = [[path, documents[path]["sha256"]] for path in sorted(documents)]
+    return hashlib.sha256(json.dumps([metadata_sha256, listing]).encode("utf-8")).hexdigest()
+
+
+def build_manifest(root: str, previous: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Hash and describe every corpus document under root
+
+    previous is an earlier manifest of the same tree: files with the same size
+    and mtime keep its hash and attribution unless the metadata file changed.
+    """
+    root = os.path.abspath(root)
+    files = scan_corpus(root)
+    metadata_stamp = attribution_stamp(root)
+    metadata_path = os.path.join(root, METADATA_FILENAME)
+    metadata_sha256 = file_sha256(metadata_path) if metadata_stamp is not None else None
+
+    reusable = {}
+    if previous and previous.get("version") == MANIFEST_VERSION and previous.get("metadata_sha256") == metadata_sha256:
+        reusable = previous.get("documents", {})
+
+    metadata = None
+    documents = {}
+    for path, stat in sorted(files.items()):
+        entry = reusable.get(path)
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            documents[path] = entry
+            continue
+        if metadata is None:
+            metadata = load_attribution(root)
+        with open(os.path.join(root, path), "rb") as f:
+            data = f.read()
+        entry = describe_document(path, data.decode("utf-8", errors="replace"), metadata)
+        entry.update(
+            key=path.partition("/")[2],
+            sha256=hashlib.sha256(data).hexdigest(),
+            size=stat.st_size,
+            mtime_ns=stat.st_mtime_ns
+        )
+        documents[path] = entry
+
+    return {
+        "version": MANIFEST_VERSION,
+        "root": root,
+        "metadata_sha256": metadata_sha256,
+        "digest": content_digest(documents, metadata_sha256),
+        "documents": documents
+    }
+
+
+def agent_documents(manifest: Dict[str, Any]) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """Manifest documents grouped by agent directory name (vera, finn, ...)"""
+    grouped: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    for path, entry in manifest["documents"].items():
+        grouped.setdefault(path.partition("/")[0], {})[path] = entry
+    return grouped
+
+
+def _is_missing(error: Exception) -> bool:
+    code = getattr(error, "response", {}).get("Error", {}).get("Code")
+    return code in _MISSING_CODES
+
+
+# -- packed snapshots ----------------------------------------------------
+
+def write_pack(root: str, documents: Dict[str, Dict[str, Any]], digest: str, dest: str) -> Dict[str, Any]:
+    """Write documents into a pack file at dest; returns its index
+
+    Documents are compressed with zlib, which every reader (including Node's
+    zlib module) can inflate, whatever codecs this machine has installed.
+    """
+    index_documents = []
+    offset = 0
+    tmp_data = dest + ".data"
+    with open(tmp_data, "wb") as data_file:
+        for path in sorted(documents):
+            with open(os.path.join(root, path), "rb") as f:
+                blob = zlib.compress(f.read(), 9)
+            data_file.write(blob)
+            entry = {k: v for k, v in documents[path].items() if k != "mtime_ns"}
+            entry.update(path=path, offset=offset, length=len(blob))
+            index_documents.append(entry)
+            offset += len(blob)
+
+    index = {"version": PACK_VERSION, "digest": digest, "created_at": time.time(), "documents": index_documents}
+    index_bytes = json.dumps(index, separators=(",", ":")).encode("utf-8")
+    tmp_path = dest + ".tmp"
+    try:
+        with open(tmp_path, "wb") as out:
+            out.write(_PACK_HEADER.pack(PACK_MAGIC, PACK_VERSION, len(index_bytes)))
+            out.write(index_bytes)
+            with open(tmp_data, "rb") as data_file:
+                shutil.copyfileobj(data_file, out)
+        os.replace(tmp_path, dest)
+    finally:
+        os.remove(tmp_data)
+    return index
+
+
+class CorpusPack:
+    """Read-only, memory-mapped view of a pack written by write_pack()"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < _PACK_HEADER.size:
+            raise ValueError(f"{path} is not a corpus pack")
+        magic, version, index_length = _PACK_HEADER.unpack_from(self._map, 0)
+        if magic != PACK_MAGIC or version != PACK_VERSION:
+            raise ValueError(f"{path} is not a version {PACK_VERSION} corpus pack")
+        self._data_start = _PACK_HEADER.size + index_length
+        index = json.loads(self._map[_PACK_HEADER.size:self._data_start])
+        self.digest: str = index["digest"]
+        self.created_at: float = index["created_at"]
+        self.documents: List[Dict[str, Any]] = index["documents"]
+        self._by_path = {doc["path"]: doc for doc in self.documents}
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def __contains__(self, path: str) -> bool:
+        return path in self._by_path
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._by_path)
+
+    def read_bytes(self, path: str) -> bytes:
+        """Decompressed content of one document; only its own slice of the pack is read"""
+        doc = self._by_path[path]
+        start = self._data_start + doc["offset"]
+        return zlib.decompress(self._map[start:start + doc["length"]])
+
+    def read(self, path: str) -> str:
+        return self.read_bytes(path).decode("utf-8", errors="replace")
+
+    def verify(self) -> List[str]:
+        """Paths whose content does not match the hash in the index"""
+        return [doc["path"] for doc in self.documents if hashlib.sha256(self.read_bytes(doc["path"])).hexdigest() != doc["sha256"]]
+
+    def close(self) -> None:
+        self._map.close()
+
+    def __enter__(self) -> "CorpusPack":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def fetch_pack(s3_client, bucket: str, dest: str) -> CorpusPack:
+    """Download a bucket's snapshot with a single GET and open it"""
+    response = s3_client.get_object(Bucket=bucket, Key=SNAPSHOT_KEY)
+    tmp_path = dest + ".tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            shutil.copyfileobj(response["Body"], f, 1024 * 1024)
+    finally:
+        response["Body"].close()
+    os.replace(tmp_path, dest)
+    return CorpusPack(dest)
+
+
+# -- uploads -------------------------------------------------------------
+
+def upload_file(
+    s3_client,
+    bucket: str,
+    key: str,
+    path: str,
+    metadata: Dict[str, str],
+    content_type: str,
+    part_pool: ThreadPoolExecutor,
+    threshold: int = MULTIPART_THRESHOLD,
+    part_size: int = MULTIPART_PART_SIZE
+) -> int:
+    """Upload one file, in parallel parts on part_pool if it is over threshold; returns the bytes sent"""
+    size = os.path.getsize(path)
+    if size <= threshold:
+        with open(path, "rb") as f:
+            s3_client.put_object(Bucket=bucket, Key=key, Body=f.read(), Metadata=metadata, ContentType=content_type)
+        return size
+
+    upload_id = s3_client.create_multipart_upload(Bucket=bucket, Key=key, Metadata=metadata, ContentType=content_type)["UploadId"]
+
+    def send_part(number: int, offset: int) -> Dict[str, Any]:
+        with open(path, "rb") as f:
+            f.seek(offset)
+            body = f.read(part_size)
+        response = s3_client.upload_part(Bucket=bucket, Key=key, UploadId=upload_id, PartNumber=number, Body=body)
+        return {"PartNumber": number, "ETag": response["ETag"]}
+
+    futures: List[Future] = [
+        part_pool.submit(send_part, number, offset)
+        for number, offset in enumerate(range(0, size, part_size), 1)
+    ]
+    try:
+        parts = [future.result() for future in futures]
+        s3_client.complete_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts})
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        s3_client.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        raise
+    return size
+
+
+def read_remote_manifest(s3_client, bucket: str) -> Optional[Dict[str, Any]]:
+    """The manifest a bucket was last synced with, or None if it has never been synced"""
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=MANIFEST_KEY)
+    except Exception as e:
+        if _is_missing(e):
+            return None
+        raise
+    try:
+        manifest = json.loads(response["Body"].read())
+    finally:
+        response["Body"].close()
+    return manifest if manifest.get("version") == MANIFEST_VERSION else None
+
+
+@dataclass
+class SyncReport:
+    """What one bucket's sync uploaded, deleted and left alone"""
+    agent: str
+    bucket: str
+    documents: int
+    uploaded: List[str] = field(default_factory=list)
+    deleted: List[str] = field(default_factory=list)
+    unchanged: int = 0
+    bytes_uploaded: int = 0
+    snapshot: str = "skipped"
+    elapsed_ms: float = 0.0
+
+
+def sync_agent(
+    s3_client,
+    manifest: Dict[str, Any],
+    agent: str,
+    documents: Dict[str, Dict[str, Any]],
+    bucket: str,
+    file_pool: ThreadPoolExecutor,
+    part_pool: ThreadPoolExecutor,
+    pack_dir: Optional[str] = None,
+    snapshot: bool = True,
+    prune: bool = False,
+    dry_run: bool = False,
+    threshold: int = MULTIPART_THRESHOLD,
+    part_size: int = MULTIPART_PART_SIZE
+) -> SyncReport:
+    """Bring one bucket in line with its agent's documents in manifest"""
+    started = time.perf_counter()
+    root = manifest["root"]
+    report = SyncReport(agent, bucket, len(documents))
+    remote = read_remote_manifest(s3_client, bucket)
+    if remote is None and not documents:
+        return report  # Nothing local and never synced
+    remote = remote or {"documents": {}}
+    remote_documents = remote["documents"]
+
+    by_key = {entry["key"]: (path, entry) for path, entry in documents.items()}
+    changed = [
+        (key, path, entry) for key, (path, entry) in sorted(by_key.items())
+        if remote_documents.get(key, {}).get("sha256") != entry["sha256"]
+    ]
+    report.unchanged = len(by_key) - len(changed)
+    stale = sorted(key for key in remote_documents if key not in by_key) if prune else []
+    digest = content_digest(documents, manifest["metadata_sha256"])
+    snapshot_current = remote.get("snapshot", {}).get("digest") == digest
+
+    if dry_run:
+        report.uploaded = [key for key, _, _ in changed]
+        report.deleted = stale
+        if snapshot:
+            report.snapshot = "unchanged" if snapshot_current else "would publish"
+        report.elapsed_ms = (time.perf_counter() - started) * 1000
+        return report
+
+    def upload(key: str, path: str, entry: Dict[str, Any]) -> int:
+        return upload_file(
+            s3_client, bucket, key, os.path.join(root, path),
+            {"sha256": entry["sha256"]},
+            CONTENT_TYPES.get(os.path.splitext(path)[1], "application/octet-stream"),
+            part_pool, threshold, part_size
+        )
+
+    futures = {key: file_pool.submit(upload, key, path, entry) for key, path, entry in changed}
+    for key, future in futures.items():
+        report.bytes_uploaded += future.result()
+        report.uploaded.append(key)
+    for key in stale:
+        s3_client.delete_object(Bucket=bucket, Key=key)
+        report.deleted.append(key)
+
+    # Documents the remote manifest listed and this sync did not prune stay in it
+    synced = {key: doc for key, doc in remote_documents.items() if key not in stale}
+    synced.update({key: {"sha256": entry["sha256"], "size": entry["size"]} for key, (_, entry) in by_key.items()})
+    remote_snapshot = remote.get("snapshot")
+
+    if snapshot and not snapshot_current:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            if pack_dir:
+                os.makedirs(pack_dir, exist_ok=True)
+            pack_path = os.path.join(pack_dir or tmp_dir, f"{agent}.pack")
+            write_pack(root, documents, digest, pack_path)
+            pack_sha256 = file_sha256(pack_path)
+            report.bytes_uploaded += upload_file(
+                s3_client, bucket, SNAPSHOT_KEY, pack_path,
+                {"sha256": pack_sha256, "digest": digest}, "application/octet-stream",
+                part_pool, threshold, part_size
+            )
+        remote_snapshot = {"key": SNAPSHOT_KEY, "digest": digest, "sha256": pack_sha256, "documents": len(documents)}
+        report.snapshot = "published"
+    elif snapshot:
+        report.snapshot = "unchanged"
+
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=MANIFEST_KEY,
+        Body=json.dumps({
+            "version": MANIFEST_VERSION,
+            "digest": digest,
+            "synced_at": time.time(),
+            "documents": synced,
+            "snapshot": remote_snapshot
+        }, indent=2).encode("utf-8"),
+        ContentType="application/json"
+    )
+    report.elapsed_ms = (time.perf_counter() - started) * 1000
+    return report
+
+
+def sync_corpus(
+    s3_client,
+    manifest: Dict[str, Any],
+    environment: str = "prod",
+    agents: Optional[List[str]] = None,
+    workers: int = DEFAULT_WORKERS,
+    **options: Any
+) -> List[SyncReport]:
+    """Sync every agent's bucket (or only agents') from manifest; options are passed to sync_agent()"""
+    grouped = agent_documents(manifest)
+    # Every registered agent by default, so a bucket whose local documents were all removed is still pruned
+    wanted = [agent.lower() for agent in agents] if agents else sorted(set(grouped) | {name.lower() for name in [*AGENTS, SOPHIE]})
+    reports = []
+    with ThreadPoolExecutor(max_workers=workers) as file_pool, ThreadPoolExecutor(max_workers=workers) as part_pool:
+        for agent in wanted:
+            bucket = bucket_name(agent, environment)
+            s3_client.head_bucket(Bucket=bucket)
+            reports.append(sync_agent(s3_client, manifest, agent, grouped.get(agent, {}), bucket, file_pool, part_pool, **options))
+    return reports
+
+
+# -- local S3 stand-in ---------------------------------------------------
+
+class LocalS3Error(Exception):
+    """Raised by LocalS3Client with the same error code structure as botocore's ClientError"""
+
+    def __init__(self, code: str, message: str):
+        super().__init__(message)
+        self.response = {"Error": {"Code": code, "Message": message}}
+
+
+class LocalS3Client:
+    """Directory stand-in for the boto3 S3 client calls made by this module
+
+    Objects are stored as <root>/<bucket>/<key>, with their metadata in
+    <root>/.metadata/<bucket>/<key>.json. Buckets are created on first write.
+    Writes are atomic, so concurrent uploads and readers are safe.
+    """
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        self._lock = threading.Lock()
+        self._uploads: Dict[str, Dict[str, Any]] = {}
+
+    def _path(self, bucket: str, key: str) -> str:
+        return os.path.join(self.root, bucket, *key.split("/"))
+
+    def _metadata_path(self, bucket: str, key: str) -> str:
+        return os.path.join(self.root, ".metadata", bucket, *key.split("/")) + ".json"
+
+    def _write(self, path: str, data: bytes) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _store(self, bucket: str, key: str, data: bytes, metadata: Dict[str, str], content_type: Optional[str]) -> Dict[str, Any]:
+        etag = f'"{hashlib.md5(data).hexdigest()}"'
+        self._write(self._path(bucket, key), data)
+        self._write(self._metadata_path(bucket, key), json.dumps(
+            {"Metadata": metadata, "ContentType": content_type or "binary/octet-stream", "ETag": etag}
+        ).encode("utf-8"))
+        return {"ETag": etag}
+
+    def head_bucket(self, Bucket: str) -> Dict[str, Any]:
+        return {}
+
+    def head_object(self, Bucket: str, Key: str) -> Dict[str, Any]:
+        try:
+            size = os.path.getsize(self._path(Bucket, Key))
+            with open(self._metadata_path(Bucket, Key), "rb") as f:
+                info = json.load(f)
+        except OSError:
+            raise LocalS3Error("404", f"s3://{Bucket}/{Key} not found") from None
+        return {"ContentLength": size, **info}
+
+    def get_object(self, Bucket: str, Key: str) -> Dict[str, Any]:
+        try:
+            head = self.head_object(Bucket=Bucket, Key=Key)
+            body = open(self._path(Bucket, Key), "rb")
+        except (LocalS3Error, OSError):
+            raise LocalS3Error("NoSuchKey", f"s3://{Bucket}/{Key} not found") from None
+        return {"Body": body, **head}
+
+    def put_object(self, Bucket: str, Key: str, Body: bytes, Metadata: Optional[Dict[str, str]] = None, ContentType: Optional[str] = None) -> Dict[str, Any]:
+        return self._store(Bucket, Key, Body, Metadata or {}, ContentType)
+
+    def delete_object(self, Bucket: str, Key: str) -> Dict[str, Any]:
+        for path in (self._path(Bucket, Key), self._metadata_path(Bucket, Key)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        return {}
+
+    def create_multipart_upload(self, Bucket: str, Key: str, Metadata: Optional[Dict[str, str]] = None, ContentType: Optional[str] = None) -> Dict[str, Any]:
+        upload_id = uuid.uuid4().hex
+        with self._lock:
+            self._uploads[upload_id] = {"Bucket": Bucket, "Key": Key, "Metadata": Metadata or {}, "ContentType": ContentType, "parts": {}}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket: str, Key: str, UploadId: str, PartNumber: int, Body: bytes) -> Dict[str, Any]:
+        with self._lock:
+            if UploadId not in self._uploads:
+                raise LocalS3Error("NoSuchUpload", f"No upload {UploadId}")
+            etag = f'"{hashlib.md5(Body).hexdigest()}"'
+            self._uploads[UploadId]["parts"][PartNumber] = (etag, Body)
+        return {"ETag": etag}
+
+    def complete_multipart_upload(self, Bucket: str, Key: str, UploadId: str, MultipartUpload: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            upload = self._uploads.pop(UploadId, None)
+        if upload is None:
+            raise LocalS3Error("NoSuchUpload", f"No upload {UploadId}")
+        data = []
+        for part in MultipartUpload["Parts"]:
+            etag, body = upload["parts"][part["PartNumber"]]
+            if etag != part["ETag"]:
+                raise LocalS3Error("InvalidPart", f"Part {part['PartNumber']} ETag mismatch")
+            data.append(body)
+        return self._store(Bucket, Key, b"".join(data), upload["Metadata"], upload["ContentType"])
+
+    def abort_multipart_upload(self, Bucket: str, Key: str, UploadId: str) -> Dict[str, Any]:
+        with self._lock:
+            self._uploads.pop(UploadId, None)
+        return {}
+
+
+def create_s3_client(local_dir: Optional[str] = None, max_connections: int = 2 * DEFAULT_WORKERS, region: str = "us-east-1"):
+    """LocalS3Client over local_dir if given, else a boto3 S3 client pooling one connection per upload thread"""
+    if local_dir:
+        return LocalS3Client(local_dir)
+    import boto3
+    from botocore.config import Config
+    return boto3.client("s3", region_name=region, config=Config(max_pool_connections=max_connections))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Upload changed corpus documents and a packed snapshot to the agent corpus buckets")
+    parser.add_argument("--local-dir", help="Use a directory as the S3 stand-in instead of AWS")
+    parser.add_argument("--environment", default="prod", help="Bucket environment suffix")
+    parser.add_argument("--region", default="us-east-1")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    push = commands.add_parser("push", help="Upload changed documents and republish snapshots")
+    push.add_argument("--root", default="corpus-downloads", help="corpus-downloads directory")
+    push.add_argument("--agent", action="append", help="Only sync this agent's bucket (repeatable)")
+    push.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Concurrent uploads")
+    push.add_argument("--delete", action="store_true", help="Delete documents no longer in the local corpus")
+    push.add_argument("--dry-run", action="store_true", help="Report what would be uploaded without uploading")
+    push.add_argument("--no-snapshot", action="store_true", help="Do not publish packed snapshots")
+    push.add_argument(
+        "--state",
+        default=os.path.join(
+            os.environ.get("SOCRATIQ_DATA_DIR", os.path.join(os.path.expanduser("~"), ".socratiq")),
+            "corpus-manifest.json"
+        ),
+        help="Local manifest reused to skip re-hashing unchanged files"
+    )
+
+    fetch = commands.add_parser("fetch", help="Download an agent's packed snapshot and list its documents")
+    fetch.add_argument("agent")
+    fetch.add_argument("dest", help="Where to write the pack")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "fetch":
+        s3_client = create_s3_client(args.local_dir, region=args.region)
+        started = time.perf_counter()
+        with fetch_pack(s3_client, bucket_name(args.agent, args.environment), args.dest) as pack:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            for doc in pack.documents:
+                print(f"{doc['path']}  {doc['size']:>9} B  {doc['title']}")
+            corrupt = pack.verify()
+            print(f"{len(pack)} documents ({os.path.getsize(args.dest)} B packed) fetched in {elapsed_ms:.1f} ms")
+        for path in corrupt:
+            print(f"Hash mismatch: {path}", file=sys.stderr)
+        return 1 if corrupt else 0
+
+    try:
+        with open(args.state, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+    except (OSError, ValueError):
+        previous = None
+    started = time.perf_counter()
+    manifest = build_manifest(args.root, previous)
+    hashed_ms = (time.perf_counter() - started) * 1000
+    print(f"Manifest: {len(manifest['documents'])} documents, digest {manifest['digest'][:12]} ({hashed_ms:.1f} ms)")
+
+    s3_client = create_s3_client(args.local_dir, 2 * args.workers, args.region)
+    reports = sync_corpus(
+        s3_client, manifest, args.environment, args.agent, args.workers,
+        snapshot=not args.no_snapshot, prune=args.delete, dry_run=args.dry_run
+    )
+    for report in reports:
+        verb = "would upload" if args.dry_run else "uploaded"
+        print(
+            f"{report.bucket}: {verb} {len(report.uploaded)}, unchanged {report.unchanged}, "
+            f"deleted {len(report.deleted)}, snapshot {report.snapshot}, "
+            f"{report.bytes_uploaded} B in {report.elapsed_ms:.1f} ms"
+        )
+        for key in report.uploaded:
+            print(f"  + {key}")
+        for key in report.deleted:
+            print(f"  - {key}")
+
+    if not args.dry_run:
+        os.makedirs(os.path.dirname(os.path.abspath(args.state)), exist_ok=True)
+        with open(args.state, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,433 @@
+"""
+Local embedding search over the agent corpora in corpus-downloads
+
+Complements the BM25 index in socratiq.corpus for questions whose wording does
+not match the documents ("rNPV" vs "risk-adjusted NPV"). Documents are split
+into chunks at markdown headings, embedded with a pluggable CPU-only embedder
+and stored as one contiguous L2-normalized matrix:
+
+- ``vectors-<generation>.npy``: float16 (default) or float32 matrix, one row
+  per chunk, opened with ``numpy.load(mmap_mode="r")``. Each build writes a new
+  generation, because a file that is still mapped cannot be replaced on Windows
+- ``chunks.json``: chunk table (document, heading path, text), document
+  attribution and file stamps, the embedder that produced the vectors and the
+  name of the current vectors file
+
+Chunks are ordered by document path, so each agent's chunks occupy one
+contiguous row range and an agent filter is a slice rather than a mask. Search
+is an exact cosine top-k: a blocked matrix-vector product followed by
+argpartition. At the size of these corpora this is faster than maintaining an
+approximate (IVF/HNSW) structure and never misses a result.
+
+refresh() re-embeds only files that were added or modified; rows for
+unchanged files are copied from the previous matrix. Changing the embedder
+rebuilds the index.
+"""
+
+import importlib
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from socratiq.corpus import (
+    attribution_stamp,
+    describe_document,
+    load_attribution,
+    scan_corpus,
+    tokenize
+)
+
+INDEX_VERSION = 2
+
+# Sections longer than this are split further at paragraph boundaries
+MAX_CHUNK_CHARS = 1500
+
+# Rows multiplied per block during search, bounding the float32 working set
+SEARCH_BLOCK_ROWS = 65536
+
+_VECTORS_PREFIX = "vectors"
+_CHUNKS_FILE = "chunks.json"
+
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.+?)\s*$")
+
+
+def chunk_markdown(content: str, max_chars: int = MAX_CHUNK_CHARS) -> List[Tuple[str, str]]:
+    """Split a markdown document into (heading path, text) chunks at headings"""
+    chunks = []
+    trail: List[Tuple[int, str]] = []
+    lines: List[str] = []
+
+    def flush():
+        text = "\n".join(lines).strip()
+        lines.clear()
+        if not text:
+            return
+        heading = " > ".join(title for _, title in trail)
+        # Split long sections at paragraph boundaries
+        piece = ""
+        for paragraph in text.split("\n\n"):
+            if piece and len(piece) + len(paragraph) > max_chars:
+                chunks.append((heading, piece.strip()))
+                piece = ""
+            piece += paragraph + "\n\n"
+        if piece.strip():
+            chunks.append((heading, piece.strip()))
+
+    for line in content.splitlines():
+        match = _HEADING_RE.match(line)
+        if match:
+            flush()
+            level = len(match.group(1))
+            while trail and trail[-1][0] >= level:
+                trail.pop()
+            trail.append((level, match.group(2)))
+        else:
+            lines.append(line)
+    flush()
+    return chunks
+
+
+class HashingEmbedder:
+    """Deterministic, dependency-free embedder: signed feature hashing of terms and character trigrams
+
+    Terms and the trigrams of terms of three or more characters share one
+    feature space, so abbreviations and morphological variants get partial
+    credit: "rnpv" contains the trigram "npv", which is also the term "npv".
+    Quality is below a trained model, but the vectors are reproducible across
+    machines and need no model download.
+    """
+
+    # Part of the name, so indexes built with other features are rebuilt
+    FEATURES_VERSION = 2
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+        self.name = f"hashing-v{self.FEATURES_VERSION}:{dim}"
+
+    def _features(self, text: str) -> Dict[int, float]:
+        features: Dict[int, float] = {}
+        for term in tokenize(text):
+            grams = [(term, 1.0)]
+            if len(term) >= 3:
+                grams.extend((term[i:i + 3], 0.5) for i in range(len(term) - 2))
+            for gram, weight in grams:
+                h = zlib.crc32(gram.encode("utf-8"))
+                index = h % self.dim
+                features[index] = features.get(index, 0.0) + (weight if h & 0x80000000 else -weight)
+        return features
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for index, value in self._features(text).items():
+                vectors[row, index] = value
+        return _normalize(vectors)
+
+
+class SentenceTransformerEmbedder:
+    """sentence-transformers model run on CPU (requires the sentence-transformers package)"""
+
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError(
+                "SentenceTransformerEmbedder requires sentence-transformers "
+                "(pip install sentence-transformers)"
+            ) from e
+        self._model = SentenceTransformer(model_name, device="cpu")
+        self.dim = self._model.get_sentence_embedding_dimension()
+        self.name = f"sentence-transformers:{model_name}"
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = self._model.encode(texts, batch_size=32, convert_to_numpy=True)
+        return _normalize(vectors.astype(np.float32))
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def load_embedder(spec: Optional[str] = None):
+    """Embedder from a spec: "hashing[:dim]" (default), "sentence-transformers[:model]" or "module:callable"
+
+    Any object with ``name``, ``dim`` and ``embed(texts) -> (n, dim) float32``
+    can be plugged in through the "module:callable" form.
+    """
+    if not spec or spec.startswith("hashing"):
+        _, _, dim = (spec or "").partition(":")
+        return HashingEmbedder(int(dim) if dim else 512)
+    if spec.startswith("sentence-transformers"):
+        _, _, model_name = spec.partition(":")
+        return SentenceTransformerEmbedder(model_name or "all-MiniLM-L6-v2")
+    module_name, _, factory_name = spec.partition(":")
+    return getattr(importlib.import_module(module_name), factory_name)()
+
+
+@dataclass(frozen=True)
+class ChunkHit:
+    """A ranked corpus chunk with the attribution of its document"""
+    path: str
+    agent: str
+    category: str
+    title: str
+    heading: str
+    source: str
+    url: str
+    legal_status: str
+    attribution: str
+    text: str
+    score: float
+
+
+class _Snapshot:
+    """Immutable view of one index generation"""
+
+    def __init__(self, chunks: List[Dict[str, Any]], docs: Dict[str, Dict[str, Any]], vectors: Optional[np.ndarray]):
+        self.chunks = chunks
+        self.docs = docs
+        self.vectors = vectors
+        # Contiguous row range of each agent's chunks (chunks are sorted by path)
+        self.agent_rows: Dict[str, Tuple[int, int]] = {}
+        for row, chunk in enumerate(chunks):
+            agent = docs[chunk["path"]]["agent"]
+            start, _ = self.agent_rows.get(agent, (row, row))
+            self.agent_rows[agent] = (start, row + 1)
+
+
+class EmbeddingIndex:
+    """Persisted, memory-mapped chunk embedding matrix with exact top-k search"""
+
+    def __init__(
+        self,
+        root: str,
+        index_dir: str,
+        embedder=None,
+        dtype: str = "float16",
+        refresh_interval: float = 30.0
+    ):
+        self.root = os.path.abspath(root)
+        self.index_dir = index_dir
+        self.embedder = embedder or HashingEmbedder()
+        self.dtype = np.dtype(dtype)
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._last_check = 0.0
+        self._metadata_stamp: Optional[List[int]] = None
+        self._snapshot = _Snapshot([], {}, None)
+        self._last_refresh: Dict[str, Any] = {}
+        os.makedirs(index_dir, exist_ok=True)
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            with open(os.path.join(self.index_dir, _CHUNKS_FILE), "r", encoding="utf-8") as f:
+                table = json.load(f)
+            if table.get("version") != INDEX_VERSION:
+                return
+            vectors = np.load(os.path.join(self.index_dir, table["vectors_file"]), mmap_mode="r")
+        except (OSError, ValueError, KeyError):
+            return
+
+        if (table.get("root") != self.root
+                or table.get("embedder") != self.embedder.name
+                or vectors.dtype != self.dtype
+                or vectors.shape != (len(table["chunks"]), self.embedder.dim)):
+            return
+
+        self._metadata_stamp = table.get("metadata_stamp")
+        self._snapshot = _Snapshot(table["chunks"], table["docs"], vectors)
+
+    def refresh(self, force: bool = False) -> Dict[str, Any]:
+        """Re-embed added and modified documents and drop removed ones; returns what changed"""
+        with self._lock:
+            started = time.perf_counter()
+            self._last_check = time.time()
+            snapshot = self._snapshot
+            previous = snapshot.docs
+            files = scan_corpus(self.root)
+            metadata_stamp = attribution_stamp(self.root)
+            metadata_changed = metadata_stamp != self._metadata_stamp
+
+            changed = [
+                path for path, stat in files.items()
+                if force or path not in previous
+                or previous[path]["mtime_ns"] != stat.st_mtime_ns
+                or previous[path]["size"] != stat.st_size
+            ]
+            removed = [path for path in previous if path not in files]
+
+            stats = {"documents": len(files), "reindexed": len(changed), "removed": len(removed)}
+            if not changed and not removed and not metadata_changed:
+                stats["chunks"] = len(snapshot.chunks)
+                stats["elapsed_ms"] = (time.perf_counter() - started) * 1000
+                self._last_refresh = stats
+                return stats
+
+            # Rows of the previous matrix for each unchanged document
+            previous_rows: Dict[str, List[int]] = {}
+            for row, chunk in enumerate(snapshot.chunks):
+                previous_rows.setdefault(chunk["path"], []).append(row)
+
+            metadata = load_attribution(self.root) if (changed or metadata_changed) else {}
+            docs: Dict[str, Dict[str, Any]] = {}
+            chunks: List[Dict[str, Any]] = []
+            blocks: List[np.ndarray] = []
+            for path in sorted(files):
+                stat = files[path]
+                reuse = path not in changed and path in previous_rows
+                if reuse and not metadata_changed:
+                    doc = dict(previous[path])
+                else:
+                    with open(os.path.join(self.root, path), "r", encoding="utf-8", errors="replace") as f:
+                        content = f.read()
+                    doc = describe_document(path, content, metadata)
+                doc.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+                docs[path] = doc
+
+                if reuse:
+                    rows = previous_rows[path]
+                    chunks.extend(snapshot.chunks[row] for row in rows)
+                    blocks.append(np.asarray(snapshot.vectors[rows[0]:rows[-1] + 1]))
+                    continue
+
+                pieces = chunk_markdown(content)
+                if not pieces:
+                    continue
+                # Prefix each chunk with its document title and heading so short sections keep their context
+                texts = [f"{doc['title']}\n{heading}\n{text}" for heading, text in pieces]
+                blocks.append(self.embedder.embed(texts).astype(self.dtype))
+                chunks.extend({"path": path, "heading": heading, "text": text} for heading, text in pieces)
+
+            if blocks:
+                vectors = np.concatenate(blocks).astype(self.dtype, copy=False)
+            else:
+                vectors = np.zeros((0, self.embedder.dim), dtype=self.dtype)
+
+            vectors_file = f"{_VECTORS_PREFIX}-{time.time_ns():x}.npy"
+            table = {
+                "version": INDEX_VERSION,
+                "root": self.root,
+                "embedder": self.embedder.name,
+                "metadata_stamp": metadata_stamp,
+                "built_at": time.time(),
+                "vectors_file": vectors_file,
+                "docs": docs,
+                "chunks": chunks
+            }
+            vectors_path = os.path.join(self.index_dir, vectors_file)
+            chunks_path = os.path.join(self.index_dir, _CHUNKS_FILE)
+            with open(vectors_path + ".tmp", "wb") as f:
+                np.save(f, vectors)
+            os.replace(vectors_path + ".tmp", vectors_path)
+            with open(chunks_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(table, f)
+            os.replace(chunks_path + ".tmp", chunks_path)
+
+            self._metadata_stamp = metadata_stamp
+            self._snapshot = _Snapshot(chunks, docs, np.load(vectors_path, mmap_mode="r"))
+            self._remove_stale_vectors(vectors_file)
+            stats["chunks"] = len(chunks)
+            stats["elapsed_ms"] = (time.perf_counter() - started) * 1000
+            self._last_refresh = stats
+            return stats
+
+    def _remove_stale_vectors(self, current: str) -> None:
+        for filename in os.listdir(self.index_dir):
+            if filename.startswith(_VECTORS_PREFIX) and filename != current:
+                try:
+                    os.remove(os.path.join(self.index_dir, filename))
+                except OSError:
+                    pass  # Still mapped by a snapshot (Windows); removed after a later build
+
+    def maybe_refresh(self) -> Optional[Dict[str, Any]]:
+        """Refresh if the corpus has not been checked for refresh_interval seconds"""
+        if time.time() - self._last_check < self.refresh_interval:
+            return None
+        return self.refresh()
+
+    def search(
+        self,
+        query: str,
+        agents: Optional[List[str]] = None,
+        limit: int = 5,
+        per_document: int = 2
+    ) -> List[ChunkHit]:
+        """Top chunks by cosine similarity, optionally restricted to some agents' corpora
+
+        At most ``per_document`` chunks are returned from any one document so a
+        single long source does not crowd out the rest.
+        """
+        snapshot = self._snapshot
+        if snapshot.vectors is None or not snapshot.chunks:
+            return []
+
+        if agents:
+            ranges = [snapshot.agent_rows[a.upper()] for a in agents if a.upper() in snapshot.agent_rows]
+        else:
+            ranges = [(0, len(snapshot.chunks))]
+        if not ranges:
+            return []
+
+        query_vector = self.embedder.embed([query])[0].astype(np.float32)
+        rows, scores = [], []
+        for start, end in ranges:
+            for block_start in range(start, end, SEARCH_BLOCK_ROWS):
+                block_end = min(end, block_start + SEARCH_BLOCK_ROWS)
+                block = np.asarray(snapshot.vectors[block_start:block_end], dtype=np.float32)
+                rows.append(np.arange(block_start, block_end))
+                scores.append(block @ query_vector)
+        rows = np.concatenate(rows)
+        scores = np.concatenate(scores)
+
+        # Over-fetch so the per-document cap can still fill the limit
+        candidates = min(len(scores), limit * max(per_document, 1) * 4)
+        top = np.argpartition(-scores, candidates - 1)[:candidates]
+        top = top[np.argsort(-scores[top])]
+
+        hits: List[ChunkHit] = []
+        per_doc: Dict[str, int] = {}
+        for position in top:
+            chunk = snapshot.chunks[rows[position]]
+            path = chunk["path"]
+            if per_doc.get(path, 0) >= per_document:
+                continue
+            per_doc[path] = per_doc.get(path, 0) + 1
+            doc = snapshot.docs[path]
+            hits.append(ChunkHit(
+                path=path,
+                agent=doc["agent"],
+                category=doc["category"],
+                title=doc["title"],
+                heading=chunk["heading"],
+                source=doc["source"],
+                url=doc["url"],
+                legal_status=doc["legal_status"],
+                attribution=doc["attribution"],
+                text=chunk["text"],
+                score=float(scores[position])
+            ))
+            if len(hits) >= limit:
+                break
+        return hits
+
+    def stats(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        return {
+            "documents": len(snapshot.docs),
+            "chunks": len(snapshot.chunks),
+            "dim": self.embedder.dim,
+            "dtype": self.dtype.name,
+            "embedder": self.embedder.name,
+            "bytes": int(snapshot.vectors.nbytes) if snapshot.vectors is not None else 0,
+            "last_refresh": dict(self._last_refresh)
+        }
@@ -0,0 +1,332 @@
+"""
+Streaming export and analytics of the query history
+
+Exports every chat and TPP entry in the history store (one owner's, or all of
+them) as JSONL, Parquet or an Arrow IPC stream. Each format is a generator of
+byte chunks, one per chunk of history rows, so writing a file or an HTTP
+response needs memory for one chunk at a time, however long the history is.
+
+Rows are flattened to the summary columns the store computes on insert
+(EXPORT_COLUMNS): kind, agent, confidence, source, conflict and agent counts,
+client latency, error flag. Responses are never decoded. With
+include_responses, each row also carries the stored response: embedded as is
+in JSONL, and as a JSON string column in Parquet and Arrow.
+
+analyze() aggregates those columns with numpy (per-agent confidence
+percentiles, source use, conflict rate, latency, a confidence histogram),
+reading only the numeric columns.
+
+Parquet and Arrow output need pyarrow; JSONL needs nothing extra.
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+from typing import Any, Dict, Iterator, List, Optional
+
+from socratiq.history import KIND_CHAT, KIND_TPP, HistoryStore
+from socratiq.payload import json_dumps
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # Optional; only JSONL export is available
+    pyarrow = None
+
+FORMAT_JSONL = "jsonl"
+FORMAT_PARQUET = "parquet"
+FORMAT_ARROW = "arrow"
+
+FORMATS = (FORMAT_JSONL, FORMAT_PARQUET, FORMAT_ARROW) if pyarrow is not None else (FORMAT_JSONL,)
+
+FILE_EXTENSIONS = {FORMAT_JSONL: "jsonl", FORMAT_PARQUET: "parquet", FORMAT_ARROW: "arrows"}
+MIME_TYPES = {
+    FORMAT_JSONL: "application/x-ndjson",
+    FORMAT_PARQUET: "application/vnd.apache.parquet",
+    FORMAT_ARROW: "application/vnd.apache.arrow.stream"
+}
+
+# History rows per chunk (and per Parquet row group)
+DEFAULT_CHUNK_SIZE = 1000
+
+# Flattened columns, in output order, with their Arrow types
+EXPORT_COLUMNS = {
+    "id": "int64",
+    "kind": "string",
+    "agent": "string",
+    "drug_name": "string",
+    "therapeutic_area": "string",
+    "query": "string",
+    "title": "string",
+    "timestamp": "string",
+    "confidence": "float64",
+    "source_count": "int32",
+    "conflict_count": "int32",
+    "agent_count": "int32",
+    "latency_ms": "float64",
+    "is_error": "bool_"
+}
+
+# Confidence histogram bin edges (confidence is 0-1)
+CONFIDENCE_BINS = tuple(i / 10 for i in range(11))
+
+
+def flatten(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Export record for a history summary row; TPP reports are attributed to Sophie"""
+    record = {column: row.get(column) for column in EXPORT_COLUMNS}
+    if record["agent"] is None and row.get("kind") == KIND_TPP:
+        record["agent"] = "Sophie"
+    record["is_error"] = bool(record["is_error"])
+    return record
+
+
+def iter_records(
+    store: HistoryStore,
+    owner: Optional[str] = None,
+    kind: Optional[str] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    include_responses: bool = False
+) -> Iterator[List[Dict[str, Any]]]:
+    """Chunks of flattened records, oldest first; with include_responses each has "response_json" bytes"""
+    for rows in store.iter_rows(owner, kind, chunk_size, with_responses=include_responses):
+        chunk = []
+        for row in rows:
+            record = flatten(row)
+            if include_responses:
+                record["response_json"] = row["response_json"]
+            chunk.append(record)
+        yield chunk
+
+
+def iter_jsonl(chunks: Iterator[List[Dict[str, Any]]]) -> Iterator[bytes]:
+    """One JSON object per line; a stored response is spliced in as the "response" field without re-encoding"""
+    for chunk in chunks:
+        lines = []
+        for record in chunk:
+            response_json = record.pop("response_json", None)
+            line = json_dumps(record)
+            if response_json is not None:
+                line = line[:-1] + b',"response":' + response_json + b"}"
+            lines.append(line)
+        yield b"\n".join(lines) + b"\n"
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only stream that hands back what was written since the last drain()
+
+    tell() counts every byte ever written, which the Parquet writer relies on
+    for the file offsets in its footer.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def arrow_schema(include_responses: bool = False):
+    fields = [(column, getattr(pyarrow, arrow_type)()) for column, arrow_type in EXPORT_COLUMNS.items()]
+    if include_responses:
+        fields.append(("response", pyarrow.string()))
+    return pyarrow.schema(fields)
+
+
+def _record_batch(chunk: List[Dict[str, Any]], schema):
+    columns = {column: [record[column] for record in chunk] for column in EXPORT_COLUMNS}
+    if "response" in schema.names:
+        columns["response"] = [record["response_json"].decode("utf-8") for record in chunk]
+    return pyarrow.RecordBatch.from_pydict(columns, schema=schema)
+
+
+def _iter_arrow_writer(chunks: Iterator[List[Dict[str, Any]]], include_responses: bool, open_writer) -> Iterator[bytes]:
+    if pyarrow is None:
+        raise RuntimeError("Parquet and Arrow export require pyarrow (pip install pyarrow)")
+    schema = arrow_schema(include_responses)
+    sink = _ChunkSink()
+    writer = open_writer(sink, schema)
+    try:
+        for chunk in chunks:
+            if chunk:
+                writer.write_batch(_record_batch(chunk, schema))
+                yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def iter_parquet(chunks: Iterator[List[Dict[str, Any]]], include_responses: bool = False) -> Iterator[bytes]:
+    """A Parquet file, one row group per chunk (zstd-compressed columns), streamed as it is written"""
+    return _iter_arrow_writer(
+        chunks, include_responses,
+        lambda sink, schema: pyarrow.parquet.ParquetWriter(sink, schema, compression="zstd")
+    )
+
+
+def iter_arrow(chunks: Iterator[List[Dict[str, Any]]], include_responses: bool = False) -> Iterator[bytes]:
+    """An Arrow IPC stream, one record batch per chunk"""
+    return _iter_arrow_writer(chunks, include_responses, pyarrow.ipc.new_stream if pyarrow is not None else None)
+
+
+def export_history(
+    store: HistoryStore,
+    fmt: str = FORMAT_JSONL,
+    owner: Optional[str] = None,
+    kind: Optional[str] = None,
+    include_responses: bool = False,
+    chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Iterator[bytes]:
+    """Byte chunks of the history export in fmt (one of FORMATS)"""
+    chunks = iter_records(store, owner, kind, chunk_size, include_responses)
+    if fmt == FORMAT_JSONL:
+        return iter_jsonl(chunks)
+    if fmt == FORMAT_PARQUET:
+        return iter_parquet(chunks, include_responses)
+    if fmt == FORMAT_ARROW:
+        return iter_arrow(chunks, include_responses)
+    raise ValueError(f"Unknown export format {fmt!r}; expected one of {', '.join(FILE_EXTENSIONS)}")
+
+
+# -- analytics -----------------------------------------------------------
+
+def load_columns(chunks: Iterator[List[Dict[str, Any]]]) -> Dict[str, Any]:
+    """numpy arrays of the columns analyze() reads, built chunk by chunk"""
+    import numpy as np
+
+    parts: Dict[str, List[Any]] = {name: [] for name in ("kind", "agent", "confidence", "source_count", "conflict_count", "latency_ms", "is_error")}
+    for chunk in chunks:
+        parts["kind"].append(np.array([record["kind"] for record in chunk], dtype=object))
+        parts["agent"].append(np.array([record["agent"] or "" for record in chunk], dtype=object))
+        for name in ("confidence", "latency_ms"):
+            parts[name].append(np.array([np.nan if record[name] is None else record[name] for record in chunk], dtype=np.float64))
+        for name in ("source_count", "conflict_count"):
+            parts[name].append(np.array([record[name] or 0 for record in chunk], dtype=np.int64))
+        parts["is_error"].append(np.array([record["is_error"] for record in chunk], dtype=bool))
+    return {
+        name: np.concatenate(arrays) if arrays else np.array([], dtype=object if name in ("kind", "agent") else np.float64)
+        for name, arrays in parts.items()
+    }
+
+
+def analyze(columns: Dict[str, Any]) -> Dict[str, Any]:
+    """Totals, per-agent aggregates and a confidence histogram over columns from load_columns()
+
+    Per-agent counts and sums are single bincounts over the agent codes;
+    percentiles are taken per agent over its slice of the confidence and
+    latency columns, ignoring missing values.
+    """
+    import numpy as np
+
+    agents, codes = np.unique(columns["agent"].astype(str), return_inverse=True)
+    n_agents = len(agents)
+    entries = np.bincount(codes, minlength=n_agents)
+    errors = np.bincount(codes, weights=columns["is_error"], minlength=n_agents)
+    sources = np.bincount(codes, weights=columns["source_count"], minlength=n_agents)
+    conflicts = np.bincount(codes, weights=columns["conflict_count"], minlength=n_agents)
+    with_conflicts = np.bincount(codes, weights=columns["conflict_count"] > 0, minlength=n_agents)
+
+    confidence = columns["confidence"]
+    latency = columns["latency_ms"]
+    order = np.argsort(codes, kind="stable")
+    bounds = np.searchsorted(codes[order], np.arange(n_agents + 1))
+
+    def quantiles(values, qs):
+        present = values[~np.isnan(values)]
+        return np.percentile(present, qs).tolist() if present.size else [None] * len(qs)
+
+    by_agent = []
+    for index, agent in enumerate(agents):
+        rows = order[bounds[index]:bounds[index + 1]]
+        c10, c50, c90 = quantiles(confidence[rows], [10, 50, 90])
+        l50, l95 = quantiles(latency[rows], [50, 95])
+        by_agent.append({
+            "agent": agent,
+            "entries": int(entries[index]),
+            "error_rate": float(errors[index] / entries[index]),
+            "confidence_mean": float(np.nanmean(confidence[rows])) if not np.isnan(confidence[rows]).all() else None,
+            "confidence_p10": c10,
+            "confidence_p50": c50,
+            "confidence_p90": c90,
+            "sources_mean": float(sources[index] / entries[index]),
+            "sources_total": int(sources[index]),
+            "conflicts_mean": float(conflicts[index] / entries[index]),
+            "conflict_rate": float(with_conflicts[index] / entries[index]),
+            "latency_p50_ms": l50,
+            "latency_p95_ms": l95
+        })
+
+    present = confidence[~np.isnan(confidence)]
+    histogram, edges = np.histogram(np.clip(present, 0.0, 1.0), bins=np.array(CONFIDENCE_BINS))
+    return {
+        "entries": int(entries.sum()),
+        "chats": int((columns["kind"] == KIND_CHAT).sum()),
+        "tpps": int((columns["kind"] == KIND_TPP).sum()),
+        "error_rate": float(columns["is_error"].mean()) if len(codes) else 0.0,
+        "by_agent": by_agent,
+        "confidence_histogram": [
+            {"bin": f"{low:.0%}-{high:.0%}", "entries": int(count)}
+            for low, high, count in zip(edges[:-1], edges[1:], histogram)
+        ]
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Export the SocratIQ query history, or print analytics over it")
+    parser.add_argument(
+        "--db",
+        default=os.path.join(
+            os.environ.get("SOCRATIQ_DATA_DIR", os.path.join(os.path.expanduser("~"), ".socratiq")),
+            "history.db"
+        ),
+        help="History database written by the app"
+    )
+    parser.add_argument("--format", choices=FILE_EXTENSIONS, default=FORMAT_JSONL)
+    parser.add_argument("--owner", help="Only this browser's entries (the app's cid URL parameter)")
+    parser.add_argument("--kind", choices=(KIND_CHAT, KIND_TPP), help="Only chats or only TPP reports")
+    parser.add_argument("--responses", action="store_true", help="Include each full response")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--analyze", action="store_true", help="Print aggregates as JSON instead of exporting")
+    parser.add_argument("-o", "--output", default="-", help="Output file, or - for stdout")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.db):
+        parser.error(f"No history database at {args.db}")
+    store = HistoryStore(args.db)
+
+    if args.analyze:
+        summary = analyze(load_columns(iter_records(store, args.owner, args.kind, args.chunk_size)))
+        sys.stdout.buffer.write(json_dumps(summary, indent=True) + b"\n")
+        return 0
+
+    try:
+        chunks = export_history(store, args.format, args.owner, args.kind, args.responses, args.chunk_size)
+        with (contextlib.nullcontext(sys.stdout.buffer) if args.output == "-" else open(args.output, "wb")) as out:
+            for data in chunks:
+                out.write(data)
+    except RuntimeError as e:
+        print(f"socratiq.export: {e}", file=sys.stderr)
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,304 @@
+"""
+Persistent query history for SocratIQ
+
+Agent chats and TPP reports are stored in a SQLite database (WAL mode) indexed
+by owner, agent, timestamp and drug name, with an FTS5 full-text index over
+queries and response text. The Streamlit app keeps only a small recent window
+in session state and pages through this store for the History view.
+
+Summary columns (title, confidence, source and conflict counts, agents
+consulted, client latency) are computed once when an entry is saved, so
+listing, exporting and analyzing history never decodes the stored responses; a full entry is loaded only when it is opened. Responses are stored as
+compressed JSON blobs (see socratiq.payload); rows written as plain JSON text
+by earlier versions are still read.
+"""
+
+import sqlite3
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from socratiq.payload import decompress, pack_json, unpack_json
+
+KIND_CHAT = "chat"
+KIND_TPP = "tpp"
+
+# Columns returned by page(); everything except the stored response
+SUMMARY_COLUMNS = (
+    "id, owner, kind, agent, drug_name, therapeutic_area, query, timestamp, "
+    "title, confidence, source_count, agent_count, is_error, conflict_count, latency_ms"
+)
+
+# Summary columns added after the initial schema, with their SQL types
+_SUMMARY_SCHEMA = {
+    "title": "TEXT",
+    "confidence": "REAL",
+    "source_count": "INTEGER",
+    "agent_count": "INTEGER",
+    "is_error": "INTEGER",
+    "conflict_count": "INTEGER",
+    "latency_ms": "REAL"
+}
+
+# Response fields whose text is included in the full-text index
+SEARCHABLE_FIELDS = (
+    "response",
+    "recommendation",
+    "mechanisticAnalysis",
+    "deterministicScoring",
+    "probabilisticRisk"
+)
+
+
+def response_text(response: Dict[str, Any]) -> str:
+    """Concatenate the searchable text of a response"""
+    parts = [response.get(field) for field in SEARCHABLE_FIELDS]
+    parts.extend((response.get("agentContributions") or {}).values())
+    return "\n".join(part for part in parts if isinstance(part, str))
+
+
+def summarize(
+    kind: str,
+    query: str,
+    response: Dict[str, Any],
+    drug_name: Optional[str] = None,
+    therapeutic_area: Optional[str] = None
+) -> Dict[str, Any]:
+    """Summary columns for a history entry"""
+    if kind == KIND_TPP and drug_name:
+        title = f"{drug_name} - {therapeutic_area}"
+    else:
+        title = query[:80]
+
+    confidence = response.get("confidence")
+    latency_ms = (response.get("_meta") or {}).get("latency_ms")
+    return {
+        "title": title,
+        "confidence": confidence if isinstance(confidence, (int, float)) else None,
+        "source_count": len(response.get("sources") or []),
+        "agent_count": len(response.get("agentContributions") or {}),
+        "is_error": 1 if "error" in response else 0,
+        "conflict_count": len(response.get("conflicts") or []),
+        "latency_ms": latency_ms if isinstance(latency_ms, (int, float)) else None
+    }
+
+
+def fts_query(text: str) -> str:
+    """Turn free text into an FTS5 query matching all terms, with FTS syntax escaped"""
+    return " ".join('"' + term.replace('"', '""') + '"' for term in text.split())
+
+
+class HistoryStore:
+    """Thread-safe SQLite store for chat and TPP history"""
+
+    def __init__(self, db_path: str = ":memory:"):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                owner TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                agent TEXT,
+                drug_name TEXT,
+                therapeutic_area TEXT,
+                query TEXT NOT NULL,
+                response TEXT NOT NULL,
+                timestamp TEXT NOT NULL,
+                title TEXT,
+                confidence REAL,
+                source_count INTEGER,
+                agent_count INTEGER,
+                is_error INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS idx_history_owner_kind_ts ON history(owner, kind, timestamp);
+            CREATE INDEX IF NOT EXISTS idx_history_owner_agent_ts ON history(owner, agent, timestamp);
+            CREATE INDEX IF NOT EXISTS idx_history_drug_name ON history(drug_name);
+            CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(query, body);
+        """)
+        self._migrate_summaries()
+        self._db.commit()
+
+    def add_chat(self, owner: str, agent: str, query: str, response: Dict[str, Any], timestamp: str) -> int:
+        """Record an agent chat exchange and return its entry ID"""
+        return self._insert(owner, KIND_CHAT, query, response, timestamp, agent=agent)
+
+    def add_tpp(
+        self,
+        owner: str,
+        query: str,
+        response: Dict[str, Any],
+        timestamp: str,
+        drug_name: Optional[str] = None,
+        therapeutic_area: Optional[str] = None
+    ) -> int:
+        """Record a Sophie/TPP report and return its entry ID"""
+        return self._insert(
+            owner, KIND_TPP, query, response, timestamp,
+            drug_name=drug_name, therapeutic_area=therapeutic_area
+        )
+
+    def count(self, owner: str, kind: str, agent: Optional[str] = None, search: Optional[str] = None) -> int:
+        """Number of entries matching the filters"""
+        where, params = self._filters(owner, kind, agent, search)
+        with self._lock:
+            return self._db.execute(f"SELECT COUNT(*) FROM history WHERE {where}", params).fetchone()[0]
+
+    def version(self, owner: str) -> int:
+        """Highest entry ID for owner (0 if none); entries are only ever added, so it changes whenever the history does"""
+        with self._lock:
+            return self._db.execute("SELECT COALESCE(MAX(id), 0) FROM history WHERE owner = ?", (owner,)).fetchone()[0]
+
+    def page(
+        self,
+        owner: str,
+        kind: str,
+        agent: Optional[str] = None,
+        search: Optional[str] = None,
+        offset: int = 0,
+        limit: int = 10
+    ) -> List[Dict[str, Any]]:
+        """Summary rows (without responses) of entries matching the filters, newest first"""
+        where, params = self._filters(owner, kind, agent, search)
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {SUMMARY_COLUMNS} FROM history WHERE {where} "
+                "ORDER BY timestamp DESC, id DESC LIMIT ? OFFSET ?",
+                (*params, limit, offset)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def get(self, owner: str, entry_id: int) -> Optional[Dict[str, Any]]:
+        """A full entry, including its decoded response"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT * FROM history WHERE owner = ? AND id = ?",
+                (owner, entry_id)
+            ).fetchone()
+        return self._to_dict(row) if row else None
+
+    def get_response_json(self, owner: str, entry_id: int) -> Optional[bytes]:
+        """An entry's response as JSON bytes, decompressed but not decoded (e.g. for downloads)"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT response FROM history WHERE owner = ? AND id = ?",
+                (owner, entry_id)
+            ).fetchone()
+        if row is None:
+            return None
+        stored = row[0]
+        return stored.encode("utf-8") if isinstance(stored, str) else decompress(stored)
+
+    def iter_rows(
+        self,
+        owner: Optional[str] = None,
+        kind: Optional[str] = None,
+        chunk_size: int = 500,
+        with_responses: bool = False
+    ) -> Iterator[List[Dict[str, Any]]]:
+        """Summary rows of every entry (one owner's, one kind's, or all), oldest first, in chunks of chunk_size
+
+        Each chunk is a separate query resuming after the last ID, so the lock is
+        not held between chunks and memory stays bounded by one chunk. With
+        with_responses, rows also carry "response_json": the stored response as
+        JSON bytes, decompressed but not decoded.
+        """
+        clauses, params = ["id > ?"], []
+        if owner is not None:
+            clauses.append("owner = ?")
+            params.append(owner)
+        if kind is not None:
+            clauses.append("kind = ?")
+            params.append(kind)
+        columns = SUMMARY_COLUMNS + (", response" if with_responses else "")
+        last_id = 0
+        while True:
+            with self._lock:
+                rows = self._db.execute(
+                    f"SELECT {columns} FROM history WHERE {' AND '.join(clauses)} ORDER BY id LIMIT ?",
+                    (last_id, *params, chunk_size)
+                ).fetchall()
+            if not rows:
+                return
+            chunk = [dict(row) for row in rows]
+            if with_responses:
+                for row in chunk:
+                    stored = row.pop("response")
+                    row["response_json"] = stored.encode("utf-8") if isinstance(stored, str) else decompress(stored)
+            last_id = chunk[-1]["id"]
+            yield chunk
+
+    def agents(self, owner: str) -> List[str]:
+        """Agents this owner has chatted with"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT DISTINCT agent FROM history WHERE owner = ? AND kind = ? ORDER BY agent",
+                (owner, KIND_CHAT)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def _insert(self, owner: str, kind: str, query: str, response: Dict[str, Any], timestamp: str, **columns: Any) -> int:
+        summary = summarize(kind, query, response, columns.get("drug_name"), columns.get("therapeutic_area"))
+        # The client's annotations (trace, cache, hedging) are per call; only latency is kept, as a summary column
+        response = {k: v for k, v in response.items() if k != "_meta"}
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO history (owner, kind, agent, drug_name, therapeutic_area, query, response, timestamp, "
+                "title, confidence, source_count, agent_count, is_error, conflict_count, latency_ms) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    owner, kind, columns.get("agent"), columns.get("drug_name"), columns.get("therapeutic_area"),
+                    query, pack_json(response), timestamp,
+                    summary["title"], summary["confidence"], summary["source_count"],
+                    summary["agent_count"], summary["is_error"], summary["conflict_count"], summary["latency_ms"]
+                )
+            )
+            entry_id = cursor.lastrowid
+            self._db.execute(
+                "INSERT INTO history_fts (rowid, query, body) VALUES (?, ?, ?)",
+                (entry_id, query, response_text(response))
+            )
+            self._db.commit()
+        return entry_id
+
+    def _migrate_summaries(self) -> None:
+        """Add summary columns to databases created before they existed and backfill them"""
+        existing = {row[1] for row in self._db.execute("PRAGMA table_info(history)")}
+        for column, sql_type in _SUMMARY_SCHEMA.items():
+            if column not in existing:
+                self._db.execute(f"ALTER TABLE history ADD COLUMN {column} {sql_type}")
+
+        # conflict_count is never NULL once computed, so it marks rows saved before the newest columns
+        rows = self._db.execute(
+            "SELECT id, kind, query, response, drug_name, therapeutic_area FROM history "
+            "WHERE title IS NULL OR conflict_count IS NULL"
+        ).fetchall()
+        for row in rows:
+            summary = summarize(row["kind"], row["query"], unpack_json(row["response"]), row["drug_name"], row["therapeutic_area"])
+            self._db.execute(
+                "UPDATE history SET title = ?, confidence = ?, source_count = ?, agent_count = ?, is_error = ?, "
+                "conflict_count = ?, latency_ms = ? WHERE id = ?",
+                (summary["title"], summary["confidence"], summary["source_count"],
+                 summary["agent_count"], summary["is_error"], summary["conflict_count"],
+                 summary["latency_ms"], row["id"])
+            )
+
+    @staticmethod
+    def _filters(owner: str, kind: str, agent: Optional[str], search: Optional[str]) -> Tuple[str, Tuple[Any, ...]]:
+        clauses = ["owner = ?", "kind = ?"]
+        params: List[Any] = [owner, kind]
+        if agent:
+            clauses.append("agent = ?")
+            params.append(agent)
+        if search and search.strip():
+            clauses.append("id IN (SELECT rowid FROM history_fts WHERE history_fts MATCH ?)")
+            params.append(fts_query(search))
+        return " AND ".join(clauses), tuple(params)
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        entry = dict(row)
+        entry["response"] = unpack_json(entry["response"])
+        return entry
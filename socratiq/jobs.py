@@ -0,0 +1,143 @@
+"""
+Background job subsystem for long-running SocratIQ invocations
+
+Jobs (e.g. TPP generation through Sophie) run on a local worker pool instead of
+blocking a Streamlit script run. Job state and results are kept in a SQLite
+job store so a page refresh or dropped connection does not lose the result;
+the submitting page polls the store by owner and job ID.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from socratiq.payload import pack_json, unpack_json
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+PENDING_STATUSES = (JOB_QUEUED, JOB_RUNNING)
+
+
+class JobStore:
+    """Thread-safe SQLite store of job state and results"""
+
+    def __init__(self, db_path: str = ":memory:"):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                label TEXT NOT NULL,
+                params TEXT NOT NULL,
+                status TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_jobs_owner_created ON jobs(owner, created_at)")
+
+        # Workers from a previous process are gone; their jobs can never complete
+        self._db.execute(
+            "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE status IN (?, ?)",
+            (JOB_FAILED, "Interrupted by application restart", time.time(), *PENDING_STATUSES)
+        )
+        self._db.commit()
+
+    def create(self, owner: str, kind: str, label: str, params: Dict[str, Any]) -> str:
+        """Record a new queued job and return its ID"""
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, owner, kind, label, params, status, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, owner, kind, label, json.dumps(params), JOB_QUEUED, time.time())
+            )
+            self._db.commit()
+        return job_id
+
+    def mark_running(self, job_id: str) -> None:
+        self._update(job_id, status=JOB_RUNNING, started_at=time.time())
+
+    def complete(self, job_id: str, result: Dict[str, Any]) -> None:
+        """Store a job result; results carrying an "error" key mark the job failed"""
+        # The client's per-call annotations (trace, cache, hedging) are not part of the result
+        result = {k: v for k, v in result.items() if k != "_meta"}
+        self._update(
+            job_id,
+            status=JOB_FAILED if "error" in result else JOB_SUCCEEDED,
+            result=pack_json(result),
+            error=result.get("error"),
+            finished_at=time.time()
+        )
+
+    def fail(self, job_id: str, error: str) -> None:
+        self._update(job_id, status=JOB_FAILED, error=error, finished_at=time.time())
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def list_for_owner(self, owner: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """Return an owner's most recent jobs, newest first, without their results"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, owner, kind, label, params, status, error, created_at, started_at, finished_at "
+                "FROM jobs WHERE owner = ? ORDER BY created_at DESC LIMIT ?",
+                (owner, limit)
+            ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def _update(self, job_id: str, **fields: Any) -> None:
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._db.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+            self._db.commit()
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        if "result" in job:
+            job["result"] = unpack_json(job["result"]) if job["result"] else None
+        return job
+
+
+class JobRunner:
+    """Runs job callables on a bounded worker pool and records their outcome in a JobStore"""
+
+    def __init__(self, store: JobStore, max_workers: int = 4):
+        self.store = store
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="socratiq-job")
+
+    def submit(
+        self,
+        owner: str,
+        kind: str,
+        label: str,
+        params: Dict[str, Any],
+        fn: Callable[[], Dict[str, Any]]
+    ) -> str:
+        """Queue fn as a background job and return the job ID immediately"""
+        job_id = self.store.create(owner, kind, label, params)
+        self._executor.submit(self._run, job_id, fn)
+        return job_id
+
+    def _run(self, job_id: str, fn: Callable[[], Dict[str, Any]]) -> None:
+        self.store.mark_running(job_id)
+        try:
+            self.store.complete(job_id, fn())
+        except Exception as e:
+            self.store.fail(job_id, str(e))
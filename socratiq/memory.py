@@ -0,0 +1,246 @@
+"""
+Per-session memory accounting for Streamlit session state
+
+Each browser session keeps a recent window of entries in session state
+(chat_history, tpp_history): the query, timestamp and history_id of each
+exchange. Responses live only in the history store. Streamlit keeps a
+session's state for as long as its tab stays open, so SessionMemory accounts
+for what each session holds:
+
+- the size of each entry is estimated once, when it is inserted (deep_sizeof)
+- sessions idle for longer than idle_timeout, or closed by the server, have
+  their tracked entries cleared and are no longer tracked
+- sample() records process RSS and, when tracemalloc tracing is enabled, traced
+  memory and the top allocation sites, so the admin view can show whether
+  server memory stays flat over a day of load
+"""
+
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+# Samples kept for the memory trend: one a minute covers a day
+SAMPLE_WINDOW = 1440
+
+# Allocation sites reported from each tracemalloc snapshot
+TOP_ALLOCATIONS = 10
+
+
+def deep_sizeof(obj: Any, _seen: Optional[set] = None) -> int:
+    """Approximate bytes held by obj and the containers, strings and slot values it references"""
+    seen = set() if _seen is None else _seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (str, bytes, bytearray, int, float, bool)) or obj is None:
+        return size
+    if isinstance(obj, dict):
+        return size + sum(deep_sizeof(key, seen) + deep_sizeof(value, seen) for key, value in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset, deque)):
+        return size + sum(deep_sizeof(item, seen) for item in obj)
+    for slot in getattr(type(obj), "__slots__", ()):
+        if hasattr(obj, slot):
+            size += deep_sizeof(getattr(obj, slot), seen)
+    if hasattr(obj, "__dict__"):
+        size += deep_sizeof(vars(obj), seen)
+    return size
+
+
+def process_rss() -> Optional[int]:
+    """Current resident set size in bytes (peak RSS where /proc is unavailable), or None"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+@dataclass
+class _Tracked:
+    container: list
+    item: Dict[str, Any]
+    bytes: int
+
+
+@dataclass
+class _Session:
+    label: str
+    last_seen: float
+    entries: List[_Tracked] = field(default_factory=list)
+
+    @property
+    def bytes(self) -> int:
+        return sum(entry.bytes for entry in self.entries)
+
+
+class SessionMemory:
+    """Process-wide accounting of session state entries, with idle-session eviction
+
+    Sizes are in bytes. is_active(session_id) reports whether the server still
+    has a session; sessions it reports closed are dropped at the next
+    maintenance pass.
+    """
+
+    def __init__(
+        self,
+        idle_timeout: float = 1800.0,
+        sample_interval: float = 60.0,
+        trace_allocations: bool = False,
+        is_active: Optional[Callable[[str], bool]] = None,
+        clock: Callable[[], float] = time.time
+    ):
+        self.idle_timeout = idle_timeout
+        self.sample_interval = sample_interval
+        self.trace_allocations = trace_allocations
+        self._is_active = is_active
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, _Session] = {}
+        self._last_maintenance = 0.0
+        self._counters = {"tracked": 0, "evicted_sessions": 0, "evicted_bytes": 0}
+        self._samples: Deque[Dict[str, Any]] = deque(maxlen=SAMPLE_WINDOW)
+        self._top_allocations: List[Dict[str, Any]] = []
+        if trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def touch(self, session_id: str, label: Optional[str] = None) -> None:
+        """Mark a session as active; runs eviction and sampling if sample_interval has passed"""
+        now = self._clock()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = _Session(label or session_id, now)
+            session.last_seen = now
+            due = now - self._last_maintenance >= self.sample_interval
+            if due:
+                self._last_maintenance = now
+        if due:
+            self.evict_idle()
+            self.sample()
+
+    def track(self, session_id: str, container: list, item: Dict[str, Any], label: Optional[str] = None) -> int:
+        """Account for item, just appended to container; returns its estimated size
+
+        Entries previously tracked for container that are no longer in it
+        (trimmed by the caller) stop counting.
+        """
+        size = deep_sizeof(item)
+        now = self._clock()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = _Session(label or session_id, now)
+            session.last_seen = now
+            held = {id(entry) for entry in container}
+            session.entries = [
+                entry for entry in session.entries
+                if entry.container is not container or id(entry.item) in held
+            ]
+            session.entries.append(_Tracked(container, item, size))
+            self._counters["tracked"] += 1
+        return size
+
+    def evict_idle(self) -> List[str]:
+        """Clear and stop tracking sessions idle for idle_timeout, or closed; returns their IDs"""
+        now = self._clock()
+        with self._lock:
+            idle = [
+                session_id for session_id, session in self._sessions.items()
+                if now - session.last_seen >= self.idle_timeout
+                or (self._is_active is not None and not self._is_active(session_id))
+            ]
+            for session_id in idle:
+                session = self._sessions.pop(session_id)
+                for container in {id(entry.container): entry.container for entry in session.entries}.values():
+                    container.clear()
+                self._counters["evicted_sessions"] += 1
+                self._counters["evicted_bytes"] += session.bytes
+        return idle
+
+    def sample(self) -> Dict[str, Any]:
+        """Record RSS, tracked bytes and (when tracing) traced memory and top allocation sites"""
+        traced = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+        top = None
+        if tracemalloc.is_tracing():
+            statistics = tracemalloc.take_snapshot().statistics("lineno")
+            top = [
+                {"location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}", "bytes": stat.size, "blocks": stat.count}
+                for stat in statistics[:TOP_ALLOCATIONS]
+            ]
+        with self._lock:
+            sample = {
+                "time": self._clock(),
+                "rss_bytes": process_rss(),
+                "traced_bytes": traced,
+                "state_bytes": self._state_bytes(),
+                "sessions": len(self._sessions)
+            }
+            self._samples.append(sample)
+            if top is not None:
+                self._top_allocations = top
+        return sample
+
+    def heaviest(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """Sessions holding the most memory, heaviest first"""
+        now = self._clock()
+        with self._lock:
+            rows = [
+                {
+                    "session": session_id,
+                    "label": session.label,
+                    "entries": len(session.entries),
+                    "bytes": session.bytes,
+                    "idle_s": now - session.last_seen
+                } for session_id, session in self._sessions.items()
+            ]
+        return sorted(rows, key=lambda row: row["bytes"], reverse=True)[:limit]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "state_bytes": self._state_bytes(),
+                "idle_timeout": self.idle_timeout,
+                "tracing": tracemalloc.is_tracing(),
+                **self._counters,
+                "samples": list(self._samples),
+                "top_allocations": list(self._top_allocations)
+            }
+
+    def to_prometheus(self) -> str:
+        """Session memory gauges and eviction counters in the Prometheus text exposition format"""
+        stats = self.stats()
+        latest = stats["samples"][-1] if stats["samples"] else {}
+        lines = [
+            "# HELP socratiq_session_memory_bytes Estimated bytes of entries held in session state across sessions",
+            "# TYPE socratiq_session_memory_bytes gauge",
+            f"socratiq_session_memory_bytes {stats['state_bytes']}",
+            "# HELP socratiq_sessions_tracked Sessions with tracked session state",
+            "# TYPE socratiq_sessions_tracked gauge",
+            f"socratiq_sessions_tracked {stats['sessions']}",
+            "# HELP socratiq_session_evictions_total Idle or closed sessions whose state was evicted",
+            "# TYPE socratiq_session_evictions_total counter",
+            f"socratiq_session_evictions_total {stats['evicted_sessions']}"
+        ]
+        if latest.get("rss_bytes") is not None:
+            lines.extend([
+                "# HELP socratiq_process_resident_memory_bytes Resident set size of the app server at the last sample",
+                "# TYPE socratiq_process_resident_memory_bytes gauge",
+                f"socratiq_process_resident_memory_bytes {latest['rss_bytes']}"
+            ])
+        return "\n".join(lines) + "\n"
+
+    def _state_bytes(self) -> int:
+        return sum(session.bytes for session in self._sessions.values())
@@ -0,0 +1,238 @@
+"""
+Client-side latency instrumentation for SocratIQ agent calls
+
+Every agent or Sophie call made by the app is traced with a unique trace ID
+(also sent to the Lambda as traceId) and per-phase timings: admission queue
+wait, payload serialization, Lambda round trip, response parsing and UI render. Traces are
+kept in a bounded in-memory window for percentile reporting, alongside
+monotonic per-agent counters, and can be exported in Prometheus text format.
+Run times of UI panels (Streamlit fragments) are kept in the same registry.
+"""
+
+import math
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict, deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Phases recorded for a call, in pipeline order
+PHASES = ("queue", "serialize", "round_trip", "first_byte", "parse", "render")
+
+QUANTILES = (50, 95, 99)
+
+# Recent run times kept per UI panel
+PANEL_WINDOW = 500
+
+
+def new_trace_id(prefix: str) -> str:
+    """Unique trace ID for one call"""
+    return f"{prefix}-{uuid.uuid4().hex[:16]}"
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """Nearest-rank percentile of values (0.0 when empty)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, math.ceil(q / 100 * len(ordered)) - 1)
+    return ordered[rank]
+
+
+class CallTrace:
+    """Timings and outcome of a single agent call"""
+
+    def __init__(self, agent: str, trace_id: str):
+        self.agent = agent
+        self.trace_id = trace_id
+        self.started_at = time.time()
+        self.spans: Dict[str, float] = {}
+        self.total_ms: Optional[float] = None
+        self.error = False
+        self.cache_hit = False
+        self.coalesced = False
+        self.retries = 0
+        self.hedged = False
+        self.circuit_open = False
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        """Time the enclosed block as phase name (milliseconds, accumulated)"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - started) * 1000)
+
+    def add(self, name: str, duration_ms: float) -> None:
+        self.spans[name] = self.spans.get(name, 0.0) + duration_ms
+
+    def finish(self) -> None:
+        """Record the total call duration"""
+        self.total_ms = (time.perf_counter() - self._started) * 1000
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "agent": self.agent,
+            "started_at": self.started_at,
+            "total_ms": self.total_ms,
+            "error": self.error,
+            "cache_hit": self.cache_hit,
+            "coalesced": self.coalesced,
+            "retries": self.retries,
+            "hedged": self.hedged,
+            "circuit_open": self.circuit_open,
+            **{f"{name}_ms": self.spans.get(name) for name in PHASES}
+        }
+
+
+class MetricsRegistry:
+    """Thread-safe store of recent call traces and per-agent counters"""
+
+    def __init__(self, max_traces: int = 5000):
+        self.max_traces = max_traces
+        self._lock = threading.Lock()
+        self._traces: "OrderedDict[str, CallTrace]" = OrderedDict()
+        self._counters: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: {"calls": 0, "errors": 0, "cache_hits": 0, "coalesced": 0, "retries": 0, "hedged": 0, "circuit_open": 0}
+        )
+        self._panel_runs: Dict[str, "deque[Tuple[float, float]]"] = defaultdict(lambda: deque(maxlen=PANEL_WINDOW))
+
+    def record(self, trace: CallTrace) -> None:
+        """Store a finished trace"""
+        with self._lock:
+            self._traces[trace.trace_id] = trace
+            while len(self._traces) > self.max_traces:
+                self._traces.popitem(last=False)
+
+            counters = self._counters[trace.agent]
+            counters["calls"] += 1
+            counters["errors"] += int(trace.error)
+            counters["cache_hits"] += int(trace.cache_hit)
+            counters["coalesced"] += int(trace.coalesced)
+            counters["retries"] += trace.retries
+            counters["hedged"] += int(trace.hedged)
+            counters["circuit_open"] += int(trace.circuit_open)
+
+    def add_span(self, trace_id: str, name: str, duration_ms: float) -> None:
+        """Attach a phase recorded after the call finished (e.g. render) to a stored trace"""
+        with self._lock:
+            trace = self._traces.get(trace_id)
+            if trace is not None:
+                trace.add(name, duration_ms)
+
+    def record_panel_run(self, panel: str, duration_ms: float, call_ms: float = 0.0) -> None:
+        """Record one run of a UI panel (a full script run or a fragment rerun)
+
+        call_ms is the part of duration_ms spent waiting on agent calls.
+        """
+        with self._lock:
+            self._panel_runs[panel].append((duration_ms - call_ms, duration_ms))
+
+    def panel_summary(self) -> Dict[str, Dict[str, Any]]:
+        """Run-time percentiles per UI panel over the recent window, excluding agent calls
+
+        with_calls_p95_ms is the p95 of the whole run, agent calls included.
+        """
+        with self._lock:
+            runs = {panel: list(values) for panel, values in self._panel_runs.items()}
+        return {
+            panel: {
+                "runs": len(values),
+                **{f"p{q}_ms": percentile([own for own, _ in values], q) for q in QUANTILES},
+                "with_calls_p95_ms": percentile([total for _, total in values], 95)
+            }
+            for panel, values in sorted(runs.items())
+        }
+
+    def recent(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """Most recent traces, newest first"""
+        with self._lock:
+            traces = list(self._traces.values())[-limit:]
+        return [trace.to_dict() for trace in reversed(traces)]
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """Per-agent latency percentiles, phase percentiles, error and cache hit rates"""
+        with self._lock:
+            by_agent: Dict[str, List[CallTrace]] = defaultdict(list)
+            for trace in self._traces.values():
+                by_agent[trace.agent].append(trace)
+            counters = {agent: dict(values) for agent, values in self._counters.items()}
+
+        summary = {}
+        for agent, traces in sorted(by_agent.items()):
+            totals = [trace.total_ms for trace in traces if trace.total_ms is not None]
+            phases = {}
+            for phase in PHASES:
+                values = [trace.spans[phase] for trace in traces if phase in trace.spans]
+                if values:
+                    phases[phase] = {f"p{q}": percentile(values, q) for q in QUANTILES}
+
+            summary[agent] = {
+                "window": len(traces),
+                **{f"p{q}_ms": percentile(totals, q) for q in QUANTILES},
+                "error_rate": sum(trace.error for trace in traces) / len(traces),
+                "cache_hit_rate": sum(trace.cache_hit for trace in traces) / len(traces),
+                "coalesced_rate": sum(trace.coalesced for trace in traces) / len(traces),
+                "phases": phases,
+                "counters": counters.get(agent, {})
+            }
+        return summary
+
+    def to_prometheus(self) -> str:
+        """Render current metrics in the Prometheus text exposition format"""
+        summary = self.summary()
+        lines = [
+            "# HELP socratiq_call_duration_seconds Client-observed agent call duration over the recent window",
+            "# TYPE socratiq_call_duration_seconds summary"
+        ]
+        with self._lock:
+            totals_by_agent: Dict[str, List[float]] = defaultdict(list)
+            for trace in self._traces.values():
+                if trace.total_ms is not None:
+                    totals_by_agent[trace.agent].append(trace.total_ms)
+
+        for agent, stats in summary.items():
+            for q in QUANTILES:
+                lines.append(f'socratiq_call_duration_seconds{{agent="{agent}",quantile="{q / 100}"}} {stats[f"p{q}_ms"] / 1000:.6f}')
+            lines.append(f'socratiq_call_duration_seconds_sum{{agent="{agent}"}} {sum(totals_by_agent[agent]) / 1000:.6f}')
+            lines.append(f'socratiq_call_duration_seconds_count{{agent="{agent}"}} {len(totals_by_agent[agent])}')
+
+        lines.extend([
+            "# HELP socratiq_phase_duration_seconds Client-observed duration of each call phase over the recent window",
+            "# TYPE socratiq_phase_duration_seconds gauge"
+        ])
+        for agent, stats in summary.items():
+            for phase, quantiles in stats["phases"].items():
+                for q in QUANTILES:
+                    lines.append(
+                        f'socratiq_phase_duration_seconds{{agent="{agent}",phase="{phase}",quantile="{q / 100}"}} '
+                        f'{quantiles[f"p{q}"] / 1000:.6f}'
+                    )
+
+        for counter, help_text in (
+            ("calls", "Agent calls made by the client"),
+            ("errors", "Agent calls that returned an error"),
+            ("cache_hits", "Agent calls served from the response cache"),
+            ("coalesced", "Agent calls that joined an identical in-flight call"),
+            ("retries", "Retried invocation attempts"),
+            ("hedged", "Agent calls that sent a hedged duplicate request"),
+            ("circuit_open", "Agent calls rejected by an open circuit breaker")
+        ):
+            lines.append(f"# HELP socratiq_{counter}_total {help_text}")
+            lines.append(f"# TYPE socratiq_{counter}_total counter")
+            for agent, stats in summary.items():
+                lines.append(f'socratiq_{counter}_total{{agent="{agent}"}} {stats["counters"].get(counter, 0)}')
+
+        lines.extend([
+            "# HELP socratiq_panel_run_seconds Run time of each UI panel over the recent window, excluding agent calls",
+            "# TYPE socratiq_panel_run_seconds gauge"
+        ])
+        for panel, stats in self.panel_summary().items():
+            for q in QUANTILES:
+                lines.append(f'socratiq_panel_run_seconds{{panel="{panel}",quantile="{q / 100}"}} {stats[f"p{q}_ms"] / 1000:.6f}')
+
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,155 @@
+"""
+Lambda payload handling for SocratIQ agent responses
+
+Agent Lambdas may return either a bare response object or an API Gateway style
+envelope ({"statusCode": ..., "body": "<json>"}); both are normalized here.
+
+Sophie responses carry three long analysis sections plus agentContributions
+and sources, so copies held for later (cache entries, session history, the
+history store) use a compact form: CompactResponse keeps scalar fields as-is
+and compresses each large section separately, decoding it only when read.
+orjson and zstandard are used when installed, with json and zlib as fallbacks.
+"""
+
+import json
+import zlib
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, Union
+
+try:
+    import orjson
+except ImportError:  # Optional; the standard library json module is used instead
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:  # Optional; zlib is used instead
+    zstandard = None
+
+# Leading byte of a compressed blob, naming its codec
+CODEC_ZLIB = b"z"
+CODEC_ZSTD = b"s"
+
+# Strings at most this long (and numbers, booleans, None) stay uncompressed in a CompactResponse
+INLINE_STRING_LIMIT = 256
+
+if zstandard is not None:
+    _zstd_compressor = zstandard.ZstdCompressor(level=6)
+    _zstd_decompressor = zstandard.ZstdDecompressor()
+
+
+def json_loads(data: Union[bytes, str]) -> Any:
+    """Decode JSON, reading bytes directly (without a str copy) when orjson is available"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def json_dumps(value: Any, indent: bool = False) -> bytes:
+    """Encode JSON as UTF-8 bytes (two-space indented when indent is set)"""
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_INDENT_2 if indent else 0)
+    return json.dumps(value, indent=2 if indent else None, separators=None if indent else (",", ":")).encode("utf-8")
+
+
+def compress(data: bytes) -> bytes:
+    """Compress bytes with zstd when available, else zlib; the codec is recorded in the first byte"""
+    if zstandard is not None:
+        return CODEC_ZSTD + _zstd_compressor.compress(data)
+    return CODEC_ZLIB + zlib.compress(data, 6)
+
+
+def decompress(blob: bytes) -> bytes:
+    """Inverse of compress() for either codec"""
+    codec, data = blob[:1], blob[1:]
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("This payload was compressed with zstd; install zstandard to read it")
+        return _zstd_decompressor.decompress(data)
+    return zlib.decompress(data)
+
+
+def pack_json(value: Any) -> bytes:
+    """JSON-encode and compress a value"""
+    return compress(json_dumps(value))
+
+
+def unpack_json(blob: Union[bytes, str]) -> Any:
+    """Decode a pack_json() blob; plain JSON text (as stored by earlier versions) is accepted too"""
+    if isinstance(blob, str):
+        return json_loads(blob)
+    return json_loads(decompress(blob))
+
+
+def parse_lambda_result(result: Dict[str, Any], caller: str) -> Dict[str, Any]:
+    """Unwrap the API Gateway style envelope returned by the agent Lambdas"""
+    if 'statusCode' in result:
+        if result['statusCode'] == 200:
+            body = json_loads(result['body']) if isinstance(result['body'], str) else result['body']
+            return body
+        else:
+            return {"error": f"{caller} returned status {result['statusCode']}"}
+
+    return result
+
+
+def _is_inline(value: Any) -> bool:
+    if isinstance(value, str):
+        return len(value) <= INLINE_STRING_LIMIT
+    return value is None or isinstance(value, (bool, int, float))
+
+
+class CompactResponse(Mapping):
+    """Read-only response mapping whose large sections stay compressed until accessed
+
+    Behaves like the response dict for the display code (``response['x']``,
+    ``'x' in response``, ``response.get``). Large sections are decoded on each
+    access and not retained, so a stored response costs roughly its compressed
+    size.
+    """
+
+    __slots__ = ("_inline", "_packed")
+
+    def __init__(self, inline: Dict[str, Any], packed: Dict[str, bytes]):
+        self._inline = inline
+        self._packed = packed
+
+    @classmethod
+    def from_dict(cls, response: Mapping) -> "CompactResponse":
+        if isinstance(response, CompactResponse):
+            return response
+        inline, packed = {}, {}
+        for key, value in response.items():
+            if _is_inline(value):
+                inline[key] = value
+            else:
+                packed[key] = pack_json(value)
+        return cls(inline, packed)
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._inline:
+            return self._inline[key]
+        return unpack_json(self._packed[key])
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._inline or key in self._packed
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self._inline
+        yield from self._packed
+
+    def __len__(self) -> int:
+        return len(self._inline) + len(self._packed)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """A fully decoded, independent copy"""
+        return {key: self[key] for key in self}
+
+    def to_json(self, indent: bool = False) -> bytes:
+        """The response as JSON bytes, e.g. for a download"""
+        return json_dumps(self.to_dict(), indent=indent)
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate size of the compressed sections"""
+        return sum(len(blob) for blob in self._packed.values())
@@ -0,0 +1,342 @@
+"""
+Resilient invocation: retries, hedged requests and circuit breaking
+
+Wraps a single Lambda invocation attempt with:
+
+- jittered exponential retries, only for retryable failures (throttling,
+  transient service and connection errors, function timeouts)
+- hedging: once an attempt has run longer than a recent latency percentile for
+  that function, a duplicate is sent and whichever finishes first wins
+- a circuit breaker per agent, so a degraded agent fails fast instead of
+  tying up a session until the read timeout
+
+Errors are classified by botocore error code or exception class name, so this
+module does not import the AWS SDK.
+"""
+
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+from socratiq.metrics import percentile
+
+# botocore ClientError codes worth retrying
+RETRYABLE_ERROR_CODES = frozenset({
+    "TooManyRequestsException",
+    "ThrottlingException",
+    "ServiceException",
+    "ResourceNotReadyException",
+    "EC2ThrottledException",
+    "EFSMountConnectivityException",
+    "RequestTimeoutException"
+})
+
+# Transport exceptions worth retrying, by class name
+RETRYABLE_EXCEPTION_NAMES = frozenset({
+    "EndpointConnectionError",
+    "ConnectTimeoutError",
+    "ConnectionClosedError",
+    "ConnectionError"
+})
+
+# API Gateway style statusCode values worth retrying
+RETRYABLE_STATUS_CODES = frozenset({429, 502, 503, 504})
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+
+class InvocationError(Exception):
+    """A failed invocation the caller has already classified
+
+    retryable failures are worth another attempt; client errors (4xx
+    envelopes, function errors raised for a bad query) say nothing about the
+    function's health and do not count against its circuit breaker.
+    """
+
+    def __init__(self, message: str, retryable: bool = False, client_error: bool = False):
+        super().__init__(message)
+        self.retryable = retryable
+        self.client_error = client_error
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of invoking while an agent's circuit breaker is open"""
+
+    def __init__(self, key: str, retry_in: float):
+        super().__init__(f"{key} is temporarily unavailable after repeated failures; retrying in {retry_in:.0f}s")
+        self.key = key
+        self.retry_in = retry_in
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether a failed attempt is worth retrying"""
+    if isinstance(error, InvocationError):
+        return error.retryable
+    code = getattr(error, "response", {}).get("Error", {}).get("Code")
+    if code in RETRYABLE_ERROR_CODES:
+        return True
+    return any(cls.__name__ in RETRYABLE_EXCEPTION_NAMES for cls in type(error).__mro__)
+
+
+def is_client_error(error: BaseException) -> bool:
+    """Whether a failed attempt was caused by the request rather than the service"""
+    if isinstance(error, InvocationError):
+        return error.client_error
+    status = getattr(error, "response", {}).get("ResponseMetadata", {}).get("HTTPStatusCode")
+    return status is not None and 400 <= status < 500 and not is_retryable(error)
+
+
+@dataclass
+class RetryPolicy:
+    """Exponential backoff with full jitter"""
+    max_attempts: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 8.0
+
+    def delay(self, retry: int, rng: random.Random) -> float:
+        """Sleep before the given retry (1-based)"""
+        return rng.uniform(0, min(self.max_delay, self.base_delay * 2 ** (retry - 1)))
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open probe"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CIRCUIT_CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> None:
+        """Raise CircuitOpenError unless a call may proceed"""
+        with self._lock:
+            if self.state == CIRCUIT_OPEN:
+                remaining = self.opened_at + self.reset_timeout - time.monotonic()
+                if remaining > 0:
+                    raise CircuitOpenError("", remaining)
+                self.state = CIRCUIT_HALF_OPEN
+                self._probe_in_flight = False
+
+            if self.state == CIRCUIT_HALF_OPEN:
+                if self._probe_in_flight:
+                    raise CircuitOpenError("", self.reset_timeout)
+                self._probe_in_flight = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = CIRCUIT_CLOSED
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def release_probe(self) -> None:
+        """End a call that neither proves nor disproves the agent's health, e.g. a rejected query"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == CIRCUIT_HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != CIRCUIT_OPEN:
+                    self.trips += 1
+                self.state = CIRCUIT_OPEN
+                self.opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            retry_in = max(0.0, self.opened_at + self.reset_timeout - time.monotonic()) if self.state == CIRCUIT_OPEN else 0.0
+            return {"state": self.state, "failures": self.failures, "trips": self.trips, "retry_in": retry_in}
+
+
+@dataclass
+class CallOutcome:
+    """How a resilient call was served
+
+    pending is an attempt still running after the call returned: a primary
+    beaten by its hedge, which is still invoking the function.
+    """
+    attempts: int = 1
+    hedged: bool = False
+    hedge_won: bool = False
+    pending: Optional[Future] = None
+
+    @property
+    def retries(self) -> int:
+        return self.attempts - 1
+
+
+class ResilientInvoker:
+    """Applies retries, hedging and per-key circuit breakers to invocation attempts"""
+
+    def __init__(
+        self,
+        retry_policy: Optional[RetryPolicy] = None,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        hedge_percentile: float = 95,
+        hedge_min_samples: int = 20,
+        max_hedge_ratio: float = 0.1,
+        max_workers: int = 16,
+        seed: Optional[int] = None
+    ):
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.max_hedge_ratio = max_hedge_ratio
+
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._counters: Dict[str, Dict[str, int]] = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="socratiq-hedge")
+        # Primaries that may be hedged run on a pool of their own, so they never queue behind hedges
+        self._primaries = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="socratiq-primary")
+        self._primary_slots = threading.Semaphore(max_workers)
+
+    def call(
+        self,
+        key: str,
+        attempt: Callable[[bool], Any],
+        hedge: bool = False,
+        reserve_hedge: Optional[Callable[[], Optional[Callable[[], None]]]] = None
+    ) -> Tuple[Any, CallOutcome]:
+        """Run attempt(is_hedge) for key with retries, optional hedging and circuit breaking.
+
+        attempt must raise on failure; use InvocationError to classify failures the
+        SDK does not raise itself. Returns (result, outcome) or raises the final error;
+        outcome.pending is set when a beaten primary is still running.
+        reserve_hedge(), when given, is asked before each hedge is sent: it returns
+        a callable to run once the hedge finishes, or None to skip the hedge.
+        """
+        breaker = self.breaker(key)
+        outcome = CallOutcome(attempts=0)
+
+        while True:
+            try:
+                breaker.allow()
+            except CircuitOpenError as e:
+                raise CircuitOpenError(key, e.retry_in) from None
+
+            outcome.attempts += 1
+            self._count(key, "attempts")
+            started = time.perf_counter()
+            try:
+                result = self._hedged(key, attempt, outcome, reserve_hedge) if hedge else attempt(False)
+            except Exception as e:
+                # A bad query from one user must not open the circuit for everyone
+                if is_client_error(e):
+                    breaker.release_probe()
+                else:
+                    breaker.record_failure()
+                self._count(key, "failed_attempts")
+                if outcome.attempts >= self.retry_policy.max_attempts or not is_retryable(e):
+                    raise
+                self._count(key, "retries")
+                time.sleep(self.retry_policy.delay(outcome.attempts, self._rng))
+                continue
+
+            breaker.record_success()
+            self._record_latency(key, (time.perf_counter() - started) * 1000)
+            return result, outcome
+
+    def breaker(self, key: str) -> CircuitBreaker:
+        with self._lock:
+            if key not in self._breakers:
+                self._breakers[key] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return self._breakers[key]
+
+    def hedge_delay_ms(self, key: str) -> Optional[float]:
+        """Latency after which an attempt for key is hedged, or None if too few samples"""
+        with self._lock:
+            samples = list(self._latencies.get(key, ()))
+        if len(samples) < self.hedge_min_samples:
+            return None
+        return percentile(samples, self.hedge_percentile)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Breaker state and retry/hedge counters per key"""
+        with self._lock:
+            keys = sorted(set(self._breakers) | set(self._counters))
+            counters = {key: dict(self._counters.get(key, {})) for key in keys}
+        return {
+            key: {**self.breaker(key).snapshot(), **counters[key], "hedge_delay_ms": self.hedge_delay_ms(key)}
+            for key in keys
+        }
+
+    def _hedged(self, key: str, attempt: Callable[[bool], Any], outcome: CallOutcome, reserve_hedge=None) -> Any:
+        delay_ms = self.hedge_delay_ms(key)
+        if delay_ms is None or not self._has_hedge_budget(key):
+            return attempt(False)
+
+        # The caller must be free to return when the hedge wins, so the primary runs on the
+        # primary pool; when that is busy it runs on the caller's thread, unhedged, rather than queue
+        if not self._primary_slots.acquire(blocking=False):
+            return attempt(False)
+        primary = self._primaries.submit(attempt, False)
+        primary.add_done_callback(lambda _: self._primary_slots.release())
+        done, _ = wait([primary], timeout=delay_ms / 1000)
+        if done:
+            return primary.result()
+        release = reserve_hedge() if reserve_hedge is not None else (lambda: None)
+        if release is None:
+            self._count(key, "hedges_skipped")
+            return primary.result()
+        if not self._take_hedge_budget(key):
+            release()
+            return primary.result()
+
+        outcome.hedged = True
+        hedge = self._executor.submit(attempt, True)
+        hedge.add_done_callback(lambda _: release())
+        pending = {primary, hedge}
+        first_error: Optional[BaseException] = None
+
+        # First successful attempt wins; fail only if both fail
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    outcome.hedge_won = future is hedge
+                    if outcome.hedge_won:
+                        self._count(key, "hedge_wins")
+                        if not primary.done():
+                            outcome.pending = primary
+                    return future.result()
+                first_error = first_error or future.exception()
+        raise first_error
+
+    def _has_hedge_budget(self, key: str) -> bool:
+        with self._lock:
+            counters = self._counters.get(key, {})
+            return counters.get("hedges", 0) < self.max_hedge_ratio * counters.get("attempts", 0)
+
+    def _take_hedge_budget(self, key: str) -> bool:
+        with self._lock:
+            counters = self._counters.setdefault(key, {})
+            if counters.get("hedges", 0) >= self.max_hedge_ratio * counters.get("attempts", 0):
+                return False
+            counters["hedges"] = counters.get("hedges", 0) + 1
+            return True
+
+    def _record_latency(self, key: str, latency_ms: float) -> None:
+        with self._lock:
+            self._latencies.setdefault(key, deque(maxlen=200)).append(latency_ms)
+
+    def _count(self, key: str, counter: str) -> None:
+        with self._lock:
+            counters = self._counters.setdefault(key, {})
+            counters[counter] = counters.get(counter, 0) + 1
@@ -0,0 +1,275 @@
+"""
+Local routing of Sophie questions to a single specialist agent
+
+Sophie's Lambda spends a Bedrock call in classifyQuery before fanning out to
+VERA/FINN/NORA/CLIA, even when only one specialist is needed. QueryRouter
+classifies a question locally so that clearly single-domain questions can be
+sent straight to that agent, and everything else still goes to Sophie.
+
+The classifier is seeded from files already in the repository:
+
+- each ``### <AGENT>-<Sub>`` section of ``agents/<AGENT>/skills.md`` (focus,
+  skills, key documents) becomes one TF-IDF profile per sub-agent
+- the sub-agent keyword map in ``lambda/shared/corpus-retrieval.ts``
+  (getSubAgentKeywords) adds phrase matches on top
+
+An agent scores as its best sub-agent. Confidence is the top agent's share of
+the summed squared agent scores, which discounts weak incidental matches.
+Below the threshold, with too little domain signal, or when the question asks
+for a TPP or a cross-domain synthesis, Sophie is used.
+"""
+
+import argparse
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from socratiq.corpus import tokenize
+
+SPECIALISTS = ("VERA", "FINN", "NORA", "CLIA")
+
+# Minimum confidence (top agent's share of squared scores) needed to skip Sophie
+DEFAULT_THRESHOLD = 0.75
+
+# Below this total score a question carries too little domain signal to route
+MIN_EVIDENCE = 0.25
+
+# Score added to a sub-agent per keyword phrase from the keyword map found in the question
+KEYWORD_WEIGHT = 0.35
+
+# Phrases that ask for Sophie's multi-agent synthesis regardless of domain
+ORCHESTRATION_CUES = (
+    "tpp", "target product profile", "txp", "comprehensive", "holistic", "go/no-go", "go no-go",
+    "all agents", "cross-functional", "end-to-end", "overall strategy", "strategic recommendation",
+    "synthesize", "trade-off", "tradeoff"
+)
+
+_SECTION_RE = re.compile(r"^###\s+(VERA|FINN|NORA|CLIA)-(\S+)\s*$", re.MULTILINE)
+_KEYWORD_ENTRY_RE = re.compile(r"'(VERA|FINN|NORA|CLIA)-([A-Za-z]+)':\s*\[([^\]]*)\]")
+_QUOTED_RE = re.compile(r"'([^']+)'")
+_SUFFIXES = ("ing", "ed", "es", "s", "e")
+
+
+def _stem(term: str) -> str:
+    """Crude suffix folding so 'pricing', 'priced' and 'price' (or 'patents' and 'patent') match"""
+    if term.endswith("ss"):
+        return term
+    for suffix in _SUFFIXES:
+        if term.endswith(suffix) and len(term) - len(suffix) >= 4:
+            return term[:-len(suffix)]
+    return term
+
+
+def terms(text: str) -> List[str]:
+    return [_stem(term) for term in tokenize(text)]
+
+
+def _phrase_pattern(phrases: Iterable[str]) -> re.Pattern:
+    alternatives = sorted({re.escape(phrase.lower()) for phrase in phrases}, key=len, reverse=True)
+    return re.compile(r"(?<![a-z0-9])(?:" + "|".join(alternatives) + r")s?(?![a-z0-9])")
+
+
+def load_skill_sections(agents_dir: str) -> Dict[str, str]:
+    """Sub-agent name ("FINN-ROI") -> text of its skills.md section"""
+    sections = {}
+    for agent in SPECIALISTS:
+        try:
+            with open(os.path.join(agents_dir, agent, "skills.md"), encoding="utf-8") as f:
+                content = f.read()
+        except OSError:
+            continue
+        matches = list(_SECTION_RE.finditer(content))
+        for i, match in enumerate(matches):
+            end = matches[i + 1].start() if i + 1 < len(matches) else len(content)
+            # A section ends at the next heading of any level
+            body = content[match.end():end]
+            heading = re.search(r"^#{1,3}\s", body, re.MULTILINE)
+            if heading:
+                body = body[:heading.start()]
+            sections[f"{match.group(1)}-{match.group(2)}"] = body
+    return sections
+
+
+def load_keyword_map(source_path: str) -> Dict[str, List[str]]:
+    """Sub-agent name -> keywords, parsed from the getSubAgentKeywords map in corpus-retrieval.ts"""
+    try:
+        with open(source_path, encoding="utf-8") as f:
+            source = f.read()
+    except OSError:
+        return {}
+    return {
+        f"{match.group(1)}-{match.group(2)}": [keyword.lower() for keyword in _QUOTED_RE.findall(match.group(3))]
+        for match in _KEYWORD_ENTRY_RE.finditer(source)
+    }
+
+
+@dataclass(frozen=True)
+class RouteDecision:
+    """Where a question should go; agent is None when it should go to Sophie"""
+    agent: Optional[str]
+    sub_agent: Optional[str]
+    confidence: float
+    reason: str
+    scores: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def routed(self) -> bool:
+        return self.agent is not None
+
+
+class QueryRouter:
+    """TF-IDF and keyword classifier over the specialist sub-agent profiles
+
+    Thread-safe; routing decisions and overrides are counted for stats().
+    """
+
+    def __init__(
+        self,
+        sections: Dict[str, str],
+        keywords: Dict[str, List[str]],
+        threshold: float = DEFAULT_THRESHOLD
+    ):
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._counts: Counter = Counter()
+        self._by_agent: Counter = Counter()
+
+        # Sub-agent documents: skills section text plus its keywords
+        documents = {
+            name: Counter(terms(sections.get(name, "") + " " + " ".join(keywords.get(name, []))))
+            for name in set(sections) | set(keywords)
+        }
+        document_frequency: Counter = Counter()
+        for counts in documents.values():
+            document_frequency.update(counts.keys())
+        total = len(documents)
+
+        # Log-scaled term frequency times smoothed IDF, L2-normalized per sub-agent
+        self._weights: Dict[str, Dict[str, float]] = {}
+        for name, counts in documents.items():
+            weights = {
+                term: (1 + math.log(count)) * math.log((total + 1) / (document_frequency[term] + 0.5))
+                for term, count in counts.items()
+            }
+            norm = math.sqrt(sum(weight * weight for weight in weights.values())) or 1.0
+            self._weights[name] = {term: weight / norm for term, weight in weights.items() if weight > 0}
+
+        # Shared keywords (e.g. 'crada' for VERA and NORA) are split between their sub-agents
+        owners: Dict[str, List[str]] = defaultdict(list)
+        for name, phrases in keywords.items():
+            for phrase in phrases:
+                owners[phrase].append(name)
+        self._keyword_owners = dict(owners)
+        self._keyword_re = _phrase_pattern(owners) if owners else None
+        self._cue_re = _phrase_pattern(ORCHESTRATION_CUES)
+
+    @classmethod
+    def from_repo(cls, root: str, threshold: float = DEFAULT_THRESHOLD) -> "QueryRouter":
+        """Router seeded from <root>/agents/*/skills.md and <root>/lambda/shared/corpus-retrieval.ts"""
+        return cls(
+            load_skill_sections(os.path.join(root, "agents")),
+            load_keyword_map(os.path.join(root, "lambda", "shared", "corpus-retrieval.ts")),
+            threshold
+        )
+
+    @property
+    def sub_agents(self) -> List[str]:
+        return sorted(self._weights)
+
+    def score(self, query: str) -> Dict[str, float]:
+        """Score per sub-agent for a question"""
+        query_terms = set(terms(query))
+        scores = {
+            name: sum(weights.get(term, 0.0) for term in query_terms)
+            for name, weights in self._weights.items()
+        }
+        if self._keyword_re is not None:
+            for match in self._keyword_re.finditer(query.lower()):
+                phrase = match.group(0)
+                names = self._keyword_owners.get(phrase) or self._keyword_owners.get(phrase[:-1], [])
+                for name in names:
+                    scores[name] = scores.get(name, 0.0) + KEYWORD_WEIGHT / len(names)
+        return scores
+
+    def classify(self, query: str, threshold: Optional[float] = None) -> RouteDecision:
+        """Decide where a question should go without counting it in stats()"""
+        threshold = self.threshold if threshold is None else threshold
+        best: Dict[str, Tuple[float, str]] = {}
+        for name, value in self.score(query).items():
+            agent = name.split("-", 1)[0]
+            if value > best.get(agent, (0.0, ""))[0]:
+                best[agent] = (value, name)
+
+        agent_scores = {agent: round(value, 4) for agent, (value, _) in best.items()}
+        total = sum(value for value, _ in best.values())
+        if not best or total < MIN_EVIDENCE:
+            return RouteDecision(None, None, 0.0, "no clear specialist domain", agent_scores)
+
+        agent, (value, sub_agent) = max(best.items(), key=lambda item: item[1][0])
+        confidence = value * value / sum(other * other for other, _ in best.values())
+        if self._cue_re.search(query.lower()):
+            return RouteDecision(None, sub_agent, confidence, "asks for a multi-agent synthesis", agent_scores)
+        if confidence < threshold:
+            return RouteDecision(None, sub_agent, confidence, "spans several specialist domains", agent_scores)
+        return RouteDecision(agent, sub_agent, confidence, f"single-domain question for {sub_agent}", agent_scores)
+
+    def route(self, query: str, threshold: Optional[float] = None) -> RouteDecision:
+        """classify() and count the decision"""
+        decision = self.classify(query, threshold)
+        with self._lock:
+            self._counts["decisions"] += 1
+            if decision.routed:
+                self._counts["routed"] += 1
+                self._by_agent[decision.agent] += 1
+            else:
+                self._counts["orchestrated"] += 1
+        return decision
+
+    def record_override(self) -> None:
+        """A routed question was sent on to Sophie by the user after all"""
+        with self._lock:
+            self._counts["overridden"] += 1
+
+    def record_bypass(self) -> None:
+        """A question went to Sophie because routing was switched off"""
+        with self._lock:
+            self._counts["bypassed"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self._counts)
+            by_agent = dict(self._by_agent)
+        routed = counts.get("routed", 0)
+        decisions = counts.get("decisions", 0)
+        return {
+            "decisions": decisions,
+            "routed": routed,
+            "orchestrated": counts.get("orchestrated", 0),
+            "overridden": counts.get("overridden", 0),
+            "bypassed": counts.get("bypassed", 0),
+            "round_trips_avoided": routed - counts.get("overridden", 0),
+            "routed_rate": routed / decisions if decisions else 0.0,
+            "by_agent": by_agent
+        }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Show where Sophie questions would be routed")
+    parser.add_argument("query", nargs="+", help="Question to classify")
+    parser.add_argument("--root", default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), help="Repository root")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Minimum confidence to route")
+    args = parser.parse_args(argv)
+
+    router = QueryRouter.from_repo(args.root, args.threshold)
+    decision = router.classify(" ".join(args.query))
+    print(f"{decision.agent or 'Sophie'} ({decision.reason}; confidence {decision.confidence:.2f})")
+    for agent, value in sorted(decision.scores.items(), key=lambda item: -item[1]):
+        print(f"  {agent:5} {value:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Single-flight request coalescing
+
+Concurrent callers asking for the same key share one in-flight execution: the
+first caller runs the function and every caller that arrives before it finishes
+waits for and receives the same result. Used process-wide so identical agent
+queries from different Streamlit sessions cost a single Lambda invocation.
+
+The function reports progress (queue position, partial responses) through a
+callback instead of touching any caller's state. Each caller receives it on
+its own thread through its own on_progress, so one Streamlit session's
+placeholders are only ever updated, and its rerun or stop exceptions only ever
+raised, in that session's script thread.
+"""
+
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Returned by _follow when the leader gave up without a result
+_ABANDONED = object()
+
+
+class _Flight:
+    """One in-flight execution: its result, latest progress and waiting followers"""
+
+    def __init__(self):
+        self.future: Future = Future()
+        self.cond = threading.Condition()
+        self.progress: Any = None
+        self.version = 0
+        self.followers = 0
+        self.abandoned = False
+
+
+class SingleFlight:
+    """Thread-safe coalescing of concurrent calls by key"""
+
+    def __init__(self):
+        self.executions = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Flight] = {}
+
+    def do(
+        self,
+        key: str,
+        fn: Callable[[Callable[[Any], None]], Any],
+        on_progress: Optional[Callable[[Any], None]] = None
+    ) -> Tuple[Any, bool]:
+        """Run fn(report) for key, or wait for an identical in-flight call.
+
+        Returns (result, shared) where shared is True when the result came from
+        another caller's execution. Every value fn passes to report is relayed
+        to each caller's on_progress, on that caller's thread; followers may
+        skip intermediate values and only see the latest.
+
+        Exceptions raised by fn propagate to every caller. Anything else that
+        ends the leader (a BaseException such as a Streamlit rerun) is not
+        shared: a waiting follower takes over and runs fn itself. An error
+        raised by the leader's own on_progress is held back while followers
+        wait on the execution, and raised once they have its result.
+        """
+        while True:
+            with self._lock:
+                flight = self._calls.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._calls[key] = _Flight()
+                    self.executions += 1
+                else:
+                    flight.followers += 1
+                    self.coalesced += 1
+
+            if leader:
+                return self._lead(key, flight, fn, on_progress), False
+
+            result = self._follow(flight, on_progress)
+            if result is not _ABANDONED:
+                return result, True
+            with self._lock:
+                self.coalesced -= 1
+
+    def stats(self) -> Dict[str, int]:
+        """Return execution, coalesced and in-flight counters"""
+        with self._lock:
+            return {
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls)
+            }
+
+    def _lead(self, key: str, flight: _Flight, fn: Callable[[Callable[[Any], None]], Any], on_progress) -> Any:
+        deferred: List[BaseException] = []
+
+        def report(value: Any) -> None:
+            with flight.cond:
+                flight.progress = value
+                flight.version += 1
+                flight.cond.notify_all()
+            if on_progress is None or deferred:
+                return
+            try:
+                on_progress(value)
+            except BaseException as e:
+                with self._lock:
+                    followed = flight.followers > 0
+                if not followed:
+                    raise
+                # Others are waiting on this execution, so finish it for them first
+                deferred.append(e)
+
+        try:
+            result = fn(report)
+        except Exception as e:
+            flight.future.set_exception(e)
+            self._finish(key, flight)
+            if deferred:
+                raise deferred[0] from None
+            raise
+        except BaseException:
+            self._finish(key, flight, abandoned=True)
+            raise
+        flight.future.set_result(result)
+        self._finish(key, flight)
+        if deferred:
+            raise deferred[0]
+        return result
+
+    def _finish(self, key: str, flight: _Flight, abandoned: bool = False) -> None:
+        """Stop sharing the flight and wake its followers; abandoned flights have no result"""
+        with self._lock:
+            del self._calls[key]
+        with flight.cond:
+            flight.abandoned = abandoned
+            flight.cond.notify_all()
+
+    def _follow(self, flight: _Flight, on_progress) -> Any:
+        seen = 0
+        try:
+            while True:
+                with flight.cond:
+                    while not flight.future.done() and not flight.abandoned and flight.version == seen:
+                        flight.cond.wait()
+                    progress, seen = flight.progress, flight.version
+                    done, abandoned = flight.future.done(), flight.abandoned
+                if abandoned:
+                    return _ABANDONED
+                if done:
+                    return flight.future.result()
+                if on_progress is not None:
+                    on_progress(progress)
+        finally:
+            with self._lock:
+                flight.followers -= 1
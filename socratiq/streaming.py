@@ -0,0 +1,88 @@
+"""
+Incremental assembly of streamed Lambda responses
+
+Functions invoked through InvokeWithResponseStream deliver their payload in
+chunks. Streaming-enabled agents emit newline-delimited JSON events so the UI
+can render sections as they arrive:
+
+    {"section": "mechanisticAnalysis", "delta": "partial text"}   appended to the field
+    {"section": "confidence", "value": 0.82}                      replaces the field
+
+Any other JSON object on a line is treated as a complete (possibly enveloped)
+response and merged in. Functions that do not stream return a single buffered
+document, which is parsed once the stream completes.
+"""
+
+from typing import Any, Dict, List
+
+from socratiq.payload import json_loads, parse_lambda_result
+
+
+class StreamAssembler:
+    """Accumulates payload chunks into a response dict"""
+
+    def __init__(self, caller: str):
+        self.caller = caller
+        self.response: Dict[str, Any] = {}
+        self.buffered = False  # True once the payload turns out not to be line-delimited JSON
+        self.incremental = False  # True once at least one section event has been applied
+        self.status_code = None  # statusCode of the last enveloped document, if any
+        self._raw = bytearray()
+        self._pending = b""
+
+    def feed(self, chunk: bytes) -> List[str]:
+        """Consume a payload chunk and return the names of sections it updated"""
+        self._raw.extend(chunk)
+        if self.buffered:
+            return []
+
+        lines = (self._pending + chunk).split(b"\n")
+        self._pending = lines.pop()
+
+        updated: List[str] = []
+        for line in lines:
+            if not line.strip():
+                continue
+            if not self._apply(line, updated):
+                self.buffered = True
+                return []
+        return updated
+
+    def finish(self) -> Dict[str, Any]:
+        """Return the final response once the stream has completed"""
+        if not self.buffered and self._pending.strip():
+            if not self._apply(self._pending, []):
+                self.buffered = True
+        self._pending = b""
+
+        if self.buffered:
+            document = json_loads(self._raw)
+            if isinstance(document, dict):
+                self.status_code = document.get("statusCode", self.status_code)
+            return parse_lambda_result(document, self.caller)
+        return self.response
+
+    def _apply(self, line: bytes, updated: List[str]) -> bool:
+        try:
+            event = json_loads(line)
+        except ValueError:
+            return False
+        if not isinstance(event, dict):
+            return False
+
+        if "section" in event:
+            section = event["section"]
+            if event.get("delta") is not None:
+                self.response[section] = self.response.get(section, "") + event["delta"]
+            elif event.get("value") is not None:
+                self.response[section] = event["value"]
+            else:
+                return True  # Nothing to apply; keep what the section already holds
+            updated.append(section)
+            self.incremental = True
+        else:
+            self.status_code = event.get("statusCode", self.status_code)
+            document = parse_lambda_result(event, self.caller)
+            self.response.update(document)
+            updated.extend(document.keys())
+        return True
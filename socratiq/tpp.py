@@ -0,0 +1,310 @@
+"""
+Incremental Target Product Profile generation
+
+A TPP is generated as a set of per-component results. Each result holds one
+TPP component's part of Sophie's analysis sections and of the contributions
+of the agents behind it, stored under a key derived from that component's own
+inputs: function, prompt version, drug, the component, and the therapeutic
+area only for components whose prompt uses it.
+
+Regenerating a TPP reuses every stored result and sends the components left
+over in one Sophie call. A combined response is split per component before it
+is stored: the combined prompt asks Sophie to start each component's part of
+every section with a "### <component>" heading, and agent contributions are
+attributed through the component-to-agent map. So a cold TPP costs the single
+orchestration it always did, unticking a component costs nothing, and editing
+the therapeutic area re-requests only the components that depend on it.
+
+Text Sophie did not put under a component heading is kept with every
+component of that call, and shown once when they are merged. Keys normalize
+case and whitespace, so "Oncology " and "oncology" share results. Failed
+results are never stored, and stored ones expire after the store's TTL.
+"""
+
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Collection, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+from socratiq.payload import pack_json, unpack_json
+
+# Bump when the component prompts change, so results for the old prompts are not reused
+COMPONENT_PROMPT_VERSION = 2
+
+# Sophie's analysis sections, merged component by component
+ANALYSIS_SECTIONS = ("recommendation", "mechanisticAnalysis", "deterministicScoring", "probabilisticRisk")
+
+# Heading the combined prompt asks Sophie to put before each component's part of a section
+COMPONENT_HEADING = "### {component}"
+
+STATUS_FRESH = "fresh"
+STATUS_REUSED = "reused"
+STATUS_FAILED = "failed"
+
+# A markdown heading or a line in bold, as Sophie may write a component heading either way
+_HEADING = re.compile(r"^\s*(?:#{1,6}\s*(.+?)\s*#*|\*\*(.+?)\*\*:?)\s*$")
+
+
+def _normalize(text: Optional[str]) -> str:
+    return " ".join((text or "").split()).casefold()
+
+
+def component_key(function_name: str, drug_name: str, therapeutic_area: Optional[str], component: str) -> str:
+    """Key for a component's result; pass therapeutic_area=None for components whose prompt does not use it"""
+    inputs = [COMPONENT_PROMPT_VERSION, function_name, _normalize(drug_name), _normalize(therapeutic_area), component]
+    return hashlib.sha256(json.dumps(inputs).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class ComponentResult:
+    """One TPP component's part of a Sophie response, and where it came from"""
+    component: str
+    key: str
+    response: Dict[str, Any]
+    status: str
+    latency_ms: float = 0.0
+
+    @property
+    def agents(self) -> List[str]:
+        return sorted(self.response.get("agentContributions") or {})
+
+
+class ComponentStore:
+    """Thread-safe SQLite store of TPP component results keyed by component_key()
+
+    Results older than ttl_seconds are neither returned nor kept, and the
+    oldest results beyond max_entries are dropped.
+    """
+
+    def __init__(self, db_path: str = ":memory:", ttl_seconds: float = 3600, max_entries: int = 2000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS tpp_components (
+                key TEXT PRIMARY KEY,
+                component TEXT NOT NULL,
+                drug_name TEXT,
+                therapeutic_area TEXT,
+                response BLOB NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_tpp_components_created ON tpp_components(created_at);
+        """)
+        self._db.commit()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Unexpired responses stored under any of keys, by key"""
+        keys = list(keys)
+        if not keys:
+            return {}
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT key, response FROM tpp_components WHERE key IN ({', '.join('?' * len(keys))}) AND created_at >= ?",
+                (*keys, time.time() - self.ttl_seconds)
+            ).fetchall()
+        return {key: unpack_json(response) for key, response in rows}
+
+    def put_many(self, results: Iterable["ComponentResult"], drug_name: str, therapeutic_area: Optional[str]) -> None:
+        now = time.time()
+        rows = [
+            (
+                result.key, result.component, drug_name, therapeutic_area,
+                pack_json({k: v for k, v in result.response.items() if k != "_meta"}), now
+            )
+            for result in results
+        ]
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO tpp_components "
+                "(key, component, drug_name, therapeutic_area, response, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            self._db.execute("DELETE FROM tpp_components WHERE created_at < ?", (now - self.ttl_seconds,))
+            self._db.execute(
+                "DELETE FROM tpp_components WHERE key NOT IN "
+                "(SELECT key FROM tpp_components ORDER BY created_at DESC LIMIT ?)",
+                (self.max_entries,)
+            )
+            self._db.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM tpp_components").fetchone()[0]
+
+
+def split_text(text: str, components: Sequence[str]) -> Dict[Optional[str], str]:
+    """Split text at component headings: {component: its part}, plus {None: text under no component heading}"""
+    names = {_normalize(component): component for component in components}
+    parts: Dict[Optional[str], List[str]] = {}
+    current: Optional[str] = None
+    for line in text.splitlines():
+        match = _HEADING.match(line)
+        heading = names.get(_normalize(match.group(1) or match.group(2))) if match else None
+        if heading is not None:
+            current = heading
+            continue
+        parts.setdefault(current, []).append(line)
+    split = {component: "\n".join(lines).strip() for component, lines in parts.items()}
+    return {component: part for component, part in split.items() if part}
+
+
+def _attribute(text: Any, owners: Sequence[str], components: Sequence[str]) -> Dict[str, Any]:
+    """Each owner's part of text: its own heading's part, else the part under no component heading"""
+    parts = split_text(text, components) if isinstance(text, str) else {None: text}
+    attributed = {component: parts.get(component) or parts.get(None) for component in owners}
+    return {component: part for component, part in attributed.items() if part}
+
+
+def split_response(
+    response: Dict[str, Any],
+    components: Sequence[str],
+    component_agents: Mapping[str, str]
+) -> Dict[str, Dict[str, Any]]:
+    """One Sophie-shaped response per component, from a response covering all of components
+
+    Each component gets its part of every section, or the section's text under
+    no component heading when it has none. An agent's contribution goes to the
+    components that agent covers (to all of them for an agent covering none).
+    Confidence, sources, conflicts and timestamp are kept with every component.
+    """
+    if len(components) == 1:
+        return {components[0]: {k: v for k, v in response.items() if k != "_meta"}}
+
+    common = {k: v for k, v in response.items() if k not in ANALYSIS_SECTIONS and k not in ("agentContributions", "_meta")}
+    split: Dict[str, Dict[str, Any]] = {component: dict(common) for component in components}
+
+    for section in ANALYSIS_SECTIONS:
+        if response.get(section):
+            for component, part in _attribute(response[section], components, components).items():
+                split[component][section] = part
+
+    for component in components:
+        split[component]["agentContributions"] = {}
+    for agent, text in (response.get("agentContributions") or {}).items():
+        owners = [component for component in components if component_agents.get(component) == agent] or list(components)
+        for component, part in _attribute(text, owners, components).items():
+            split[component]["agentContributions"][agent] = part
+    return split
+
+
+def generate_components(
+    components: Sequence[str],
+    build_prompt: Callable[[Sequence[str]], str],
+    fetch: Callable[[str], Dict[str, Any]],
+    store: ComponentStore,
+    function_name: str,
+    drug_name: str,
+    therapeutic_area: Optional[str],
+    component_agents: Mapping[str, str],
+    area_components: Collection[str],
+    reuse: bool = True
+) -> Iterator[ComponentResult]:
+    """Yield one result per component: stored ones first, then those from at most one fresh call
+
+    The components with no stored result (every component when reuse is
+    False) are requested together: fetch(build_prompt(components)). A
+    successful response is split per component (split_response) and stored.
+    area_components are the components whose prompt includes the therapeutic area.
+    """
+    keys = {
+        component: component_key(function_name, drug_name, therapeutic_area if component in area_components else None, component)
+        for component in components
+    }
+    stored = store.get_many(keys.values()) if reuse else {}
+    remaining = []
+    for component in components:
+        if keys[component] in stored:
+            yield ComponentResult(component, keys[component], stored[keys[component]], STATUS_REUSED)
+        else:
+            remaining.append(component)
+    if not remaining:
+        return
+
+    started = time.perf_counter()
+    response = fetch(build_prompt(remaining))
+    latency_ms = (time.perf_counter() - started) * 1000
+    if "error" in response:
+        for component in remaining:
+            yield ComponentResult(component, keys[component], response, STATUS_FAILED, latency_ms)
+        return
+
+    # A response-cache hit cost no invocation either
+    status = STATUS_REUSED if response.get("_meta", {}).get("cache_hit") else STATUS_FRESH
+    parts = split_response(response, remaining, component_agents)
+    results = [ComponentResult(component, keys[component], parts[component], status, latency_ms) for component in remaining]
+    store.put_many(results, drug_name, therapeutic_area)
+    yield from results
+
+
+def _merge_texts(parts: List[Tuple[str, Any]]) -> str:
+    """Join (component, text) parts under component headings, showing text shared by several components once"""
+    grouped: List[Tuple[Any, List[str]]] = []
+    for component, text in parts:
+        group = next((group for group in grouped if group[0] == text), None)
+        if group is None:
+            grouped.append((text, [component]))
+        else:
+            group[1].append(component)
+    return "\n\n".join(f"**{' + '.join(components)}**\n\n{text}" for text, components in grouped)
+
+
+def merge_components(results: List[ComponentResult], order: Iterable[str]) -> Dict[str, Any]:
+    """Combine per-component results into one Sophie-shaped TPP response, in component order
+
+    With more than one result, each component's sections and agent
+    contributions sit under a heading naming it; a single result is returned
+    as it is.
+    """
+    order = list(order)
+    position = {component: index for index, component in enumerate(order)}
+    ranked = sorted(results, key=lambda result: position.get(result.component, len(order)))
+    succeeded = [result for result in ranked if result.status != STATUS_FAILED]
+    if not succeeded:
+        errors = sorted({str(result.response.get("error")) for result in results})
+        return {"error": "; ".join(errors) or "No TPP components selected"}
+    if len(succeeded) == 1:
+        return {k: v for k, v in succeeded[0].response.items() if k != "_meta"}
+
+    merged: Dict[str, Any] = {}
+    for section in ANALYSIS_SECTIONS:
+        parts = [(result.component, result.response[section]) for result in succeeded if result.response.get(section)]
+        if parts:
+            merged[section] = _merge_texts(parts)
+
+    contributions: Dict[str, List[Tuple[str, Any]]] = {}
+    for result in succeeded:
+        for agent, text in (result.response.get("agentContributions") or {}).items():
+            contributions.setdefault(agent, []).append((result.component, text))
+    merged["agentContributions"] = {agent: _merge_texts(parts) for agent, parts in contributions.items()}
+
+    confidences = [result.response["confidence"] for result in succeeded if isinstance(result.response.get("confidence"), (int, float))]
+    if confidences:
+        merged["confidence"] = sum(confidences) / len(confidences)
+
+    sources, seen = [], set()
+    for result in succeeded:
+        for source in result.response.get("sources") or []:
+            identity = (source.get("title"), source.get("url")) if isinstance(source, dict) else source
+            if identity not in seen:
+                seen.add(identity)
+                sources.append(source)
+    merged["sources"] = sources
+
+    conflicts: Dict[str, List[str]] = {}
+    for result in succeeded:
+        for conflict in result.response.get("conflicts") or []:
+            conflicts.setdefault(conflict, []).append(result.component)
+    merged["conflicts"] = [f"{' + '.join(components)}: {conflict}" for conflict, components in conflicts.items()]
+
+    timestamps = [result.response["timestamp"] for result in succeeded if result.response.get("timestamp")]
+    if timestamps:
+        merged["timestamp"] = max(timestamps)
+    return merged
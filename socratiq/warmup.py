@@ -0,0 +1,200 @@
+"""
+Keep-warm pings for the agent Lambdas
+
+Lambda reclaims containers that sit idle, so the first request after a quiet
+period pays a cold start (runtime init, module load, SDK clients) on top of
+the agent's own work. WarmupScheduler sends lightweight ``{"warmup": true}``
+invocations, which the handlers answer without corpus or Bedrock work:
+
+- to every function once at startup
+- every ``interval`` seconds while a session has been active within
+  ``active_window``, to functions without traffic since the previous round
+- on demand through prewarm(), e.g. for the agents a page is about to use
+
+Real calls are reported through record_call(). A call (or ping) made more than
+``cold_after`` seconds after the function's last known activity counts as
+cold, otherwise as warm, so cold and warm latency can be compared per function.
+The first activity seen for a function is not classified, since another
+client may have kept it warm.
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional
+
+from socratiq.metrics import percentile
+
+# Latency samples kept per function and kind (cold/warm, call/ping)
+SAMPLE_WINDOW = 200
+
+STATE_WARM = "warm"
+STATE_COLD = "cold"
+STATE_UNKNOWN = "unknown"
+
+
+@dataclass
+class _FunctionState:
+    last_active: Optional[float] = None
+    last_ping_at: Optional[float] = None
+    pinging: bool = False
+    pings: int = 0
+    ping_failures: int = 0
+    samples: Dict[str, Deque[float]] = field(
+        default_factory=lambda: {
+            kind: deque(maxlen=SAMPLE_WINDOW) for kind in ("cold_call", "warm_call", "cold_ping", "warm_ping")
+        }
+    )
+
+
+class WarmupScheduler:
+    """Background keep-warm pings plus cold/warm latency tracking, keyed by agent label
+
+    ping(function_name) performs one keep-warm invocation and raises on failure.
+    """
+
+    def __init__(
+        self,
+        ping: Callable[[str], None],
+        functions: Dict[str, str],
+        interval: float = 300.0,
+        active_window: float = 900.0,
+        cold_after: float = 600.0,
+        max_workers: int = 4,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.functions = dict(functions)
+        self.interval = interval
+        self.active_window = active_window
+        self.cold_after = cold_after
+        self._ping = ping
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._states = {label: _FunctionState() for label in self.functions}
+        self._last_heartbeat: Optional[float] = None
+        self._last_round: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="warmup")
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval > 0
+
+    def start(self) -> None:
+        """Ping every function now and keep pinging on schedule while sessions are active"""
+        if not self.enabled or self._thread is not None:
+            return
+        self._last_round = self._clock()
+        self.prewarm(self.functions, fresh_for=0)
+        self._thread = threading.Thread(target=self._run, name="warmup-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._pool.shutdown(wait=False)
+
+    def heartbeat(self) -> None:
+        """Note that a session is active, which keeps the scheduled pings running"""
+        with self._lock:
+            self._last_heartbeat = self._clock()
+
+    def prewarm(self, labels: Iterable[str], fresh_for: Optional[float] = None) -> List[str]:
+        """Ping the given functions in the background unless they were active within fresh_for seconds
+
+        fresh_for defaults to the scheduling interval. Returns the labels pinged.
+        """
+        if not self.enabled:
+            return []
+        fresh_for = self.interval if fresh_for is None else fresh_for
+        now = self._clock()
+        pinged = []
+        with self._lock:
+            for label in labels:
+                state = self._states.get(label)
+                if state is None or state.pinging:
+                    continue
+                if state.last_active is not None and now - state.last_active < fresh_for:
+                    continue
+                state.pinging = True
+                pinged.append(label)
+        for label in pinged:
+            self._pool.submit(self._ping_one, label)
+        return pinged
+
+    def record_call(self, label: str, latency_ms: float) -> None:
+        """Record a real invocation's round trip, classified cold or warm by the idle time before it"""
+        self._record(label, "call", latency_ms)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-function warm state, ping counts and cold/warm latency percentiles"""
+        now = self._clock()
+        with self._lock:
+            states = {
+                label: (state.last_active, state.last_ping_at, state.pings, state.ping_failures,
+                        {kind: list(values) for kind, values in state.samples.items()})
+                for label, state in self._states.items()
+            }
+
+        stats = {}
+        for label, (last_active, last_ping_at, pings, failures, samples) in states.items():
+            idle = None if last_active is None else now - last_active
+            stats[label] = {
+                "state": STATE_UNKNOWN if idle is None else STATE_COLD if idle > self.cold_after else STATE_WARM,
+                "idle_s": idle,
+                "last_ping_s": None if last_ping_at is None else now - last_ping_at,
+                "pings": pings,
+                "ping_failures": failures,
+                **{f"{kind}s": len(values) for kind, values in samples.items()},
+                **{f"{kind}_p50_ms": percentile(values, 50) if values else None for kind, values in samples.items()}
+            }
+        return stats
+
+    def seconds_since_round(self) -> Optional[float]:
+        """Seconds since the last scheduled (or startup) ping round"""
+        with self._lock:
+            return None if self._last_round is None else self._clock() - self._last_round
+
+    def _record(self, label: str, kind: str, latency_ms: float) -> None:
+        now = self._clock()
+        with self._lock:
+            state = self._states.get(label)
+            if state is None:
+                return
+            if state.last_active is not None:
+                temperature = "cold" if now - state.last_active - latency_ms / 1000 > self.cold_after else "warm"
+                state.samples[f"{temperature}_{kind}"].append(latency_ms)
+            state.last_active = now
+
+    def _ping_one(self, label: str) -> None:
+        started = self._clock()
+        try:
+            self._ping(self.functions[label])
+        except Exception:
+            with self._lock:
+                state = self._states[label]
+                state.pings += 1
+                state.ping_failures += 1
+                state.pinging = False
+            return
+
+        self._record(label, "ping", (self._clock() - started) * 1000)
+        with self._lock:
+            state = self._states[label]
+            state.pings += 1
+            state.last_ping_at = self._clock()
+            state.pinging = False
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                last_heartbeat = self._last_heartbeat
+            if last_heartbeat is None or self._clock() - last_heartbeat > self.active_window:
+                continue  # No active sessions: let the functions go cold rather than pay for idle pings
+            with self._lock:
+                self._last_round = self._clock()
+            self.prewarm(self.functions)
@@ -8,11 +8,55 @@ This application provides an interactive interface to:
 """
 
 import streamlit as st
-import boto3
-import json
+from streamlit import runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+import contextlib
+import functools
+import math
+import os
+from contextvars import ContextVar
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Callable, Dict, Any, Iterator, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import time
+import uuid
+
+from socratiq.batch import (
+    BATCH_RUNNING,
+    ITEM_FAILED,
+    ITEM_QUEUED,
+    ITEM_RUNNING,
+    ITEM_SUCCEEDED,
+    BatchRunner,
+    BatchStore,
+    parse_batch_csv
+)
+from socratiq.admission import PRIORITY_BATCH, PRIORITY_CHAT, PRIORITY_TPP, AdmissionController
+from socratiq.agents import AGENTS, SOPHIE_CONFIG
+from socratiq.cache import ResponseCache
+from socratiq.client import AgentClient, create_invoker, create_lambda_client, ping_function
+from socratiq.clients import LazyClient
+from socratiq.corpus import CorpusIndex
+from socratiq.embeddings import EmbeddingIndex, load_embedder
+from socratiq.export import FILE_EXTENSIONS, FORMATS, MIME_TYPES, analyze, export_history, iter_records, load_columns
+from socratiq.history import KIND_CHAT, KIND_TPP, HistoryStore
+from socratiq.memory import SessionMemory
+from socratiq.metrics import PHASES, MetricsRegistry
+from socratiq.jobs import JOB_FAILED, JOB_SUCCEEDED, PENDING_STATUSES, JobRunner, JobStore
+from socratiq.payload import CompactResponse, json_dumps
+from socratiq.resilience import CIRCUIT_CLOSED, CIRCUIT_OPEN
+from socratiq.routing import DEFAULT_THRESHOLD, QueryRouter
+from socratiq.singleflight import SingleFlight
+from socratiq.tpp import (
+    COMPONENT_HEADING,
+    STATUS_FAILED,
+    STATUS_FRESH,
+    STATUS_REUSED,
+    ComponentStore,
+    generate_components,
+    merge_components
+)
+from socratiq.warmup import STATE_COLD, STATE_WARM, WarmupScheduler
 
 # Configure page
 st.set_page_config(
@@ -22,8 +66,10 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Custom CSS for attractive styling
-st.markdown("""
+# Custom CSS for attractive styling, built once per process rather than on every rerun
+@st.cache_data(show_spinner=False)
+def app_css() -> str:
+    return """
 <style>
     .main-header {
         font-size: 2.5rem;
@@ -68,133 +114,798 @@ st.markdown("""
         margin-top: 1rem;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+st.markdown(app_css(), unsafe_allow_html=True)
+
+# Upper bound on concurrent Lambda invocations issued by this Streamlit process
+MAX_INVOKE_WORKERS = 16
+
+# Worker threads for background jobs (e.g. TPP generation), kept separate from interactive calls
+MAX_JOB_WORKERS = 4
+
+# Most concurrent Sophie invocations a batch TPP run may use; keep below Sophie's reserved Lambda concurrency
+BATCH_MAX_CONCURRENCY = int(os.environ.get("SOCRATIQ_BATCH_CONCURRENCY", "4"))
+
+# Batch TPP invocations started per second (token bucket), smoothing bursts against Lambda throttling
+BATCH_RATE_LIMIT = float(os.environ.get("SOCRATIQ_BATCH_RATE", "2"))
+
+# Seconds between job status polls while a session has background jobs in flight
+JOB_POLL_INTERVAL = 3
+
+# Recent entries kept in session memory (per agent for chats); full history lives in the history store
+RECENT_HISTORY_WINDOW = 5
+
+# Page sizes offered on the History page
+HISTORY_PAGE_SIZES = (10, 25, 50)
+
+# Local directory for persistent application state (job store, history store, ...)
+DATA_DIR = os.environ.get("SOCRATIQ_DATA_DIR", os.path.join(os.path.expanduser("~"), ".socratiq"))
+
+# Minimum seconds between re-renders of a streaming response (new sections render immediately)
+STREAM_RENDER_INTERVAL = 0.25
+
+# Local copy of the agent corpora (see corpus-downloads/upload-to-s3.sh), indexed for source previews
+CORPUS_DIR = os.environ.get(
+    "SOCRATIQ_CORPUS_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus-downloads")
+)
+
+# Sources shown in the corpus preview
+CORPUS_PREVIEW_RESULTS = 5
+
+# Minimum classifier confidence for sending a Home question straight to one agent instead of Sophie
+ROUTING_THRESHOLD = float(os.environ.get("SOCRATIQ_ROUTING_THRESHOLD", DEFAULT_THRESHOLD))
+
+# Seconds between keep-warm ping rounds while sessions are active (0 disables keep-warm pings)
+KEEP_WARM_INTERVAL = float(os.environ.get("SOCRATIQ_KEEP_WARM_INTERVAL", 300))
+
+# Idle seconds after which a Lambda container is assumed to have been reclaimed
+COLD_AFTER = float(os.environ.get("SOCRATIQ_COLD_AFTER", 600))
+
+# Lambda invocations admitted at once per function, e.g. "Sophie=5,VERA=10"; others get SOCRATIQ_DEFAULT_CONCURRENCY
+FUNCTION_CONCURRENCY = {
+    label.strip(): int(limit)
+    for label, _, limit in (entry.partition("=") for entry in os.environ.get("SOCRATIQ_FUNCTION_CONCURRENCY", "").split(","))
+    if label.strip()
+}
+DEFAULT_FUNCTION_CONCURRENCY = int(os.environ.get("SOCRATIQ_DEFAULT_CONCURRENCY", "10"))
 
-# Initialize AWS Lambda client
+# Per-browser budget for TPP and batch invocations: tokens per second and burst size (0 disables); chat is exempt
+USER_INVOKE_RATE = float(os.environ.get("SOCRATIQ_USER_RATE", "2"))
+USER_INVOKE_BURST = float(os.environ.get("SOCRATIQ_USER_BURST", "12"))
+
+# Seconds a call may wait for admission before it fails with a "busy" error
+MAX_QUEUE_WAIT = float(os.environ.get("SOCRATIQ_MAX_QUEUE_WAIT", "120"))
+
+# Idle seconds after which a session's state is evicted
+SESSION_IDLE_TIMEOUT = float(os.environ.get("SOCRATIQ_SESSION_IDLE_TIMEOUT", "1800"))
+
+# Trace allocations with tracemalloc for the memory samples on the Performance page (slows allocation-heavy code)
+TRACE_ALLOCATIONS = os.environ.get("SOCRATIQ_TRACEMALLOC", "") == "1"
+
+# p95 budget (ms) for fragment reruns against the fake Lambda client; checked by benchmarks/run_benchmarks.py
+PANEL_RERUN_TARGET_MS = 100
+
+# st.download_button accepts a callable (generating data only on click) from Streamlit 1.50
+DEFERRED_DOWNLOADS = tuple(int(part) for part in st.__version__.split(".")[:2]) >= (1, 50)
+
+# AWS Lambda client, built on a background thread; the first invocation waits for it only if it is not ready yet
 @st.cache_resource
 def get_lambda_client():
-    from botocore.config import Config
-    config = Config(
-        read_timeout=300,  # 5 minutes to match Lambda timeout
-        connect_timeout=10,
-        retries={'max_attempts': 0}
+    return LazyClient(functools.partial(create_lambda_client, MAX_INVOKE_WORKERS))
+
+# Retries, hedging and per-agent circuit breakers shared by all sessions
+@st.cache_resource
+def get_resilient_invoker():
+    return create_invoker(MAX_INVOKE_WORKERS)
+
+# Per-call latency traces and counters shared by all sessions
+@st.cache_resource
+def get_call_metrics():
+    return MetricsRegistry()
+
+# Process-wide coalescing of identical in-flight invocations across sessions
+@st.cache_resource
+def get_inflight_requests():
+    return SingleFlight()
+
+# Bounded thread pool shared by all sessions for concurrent agent fan-out
+@st.cache_resource
+def get_invoke_executor():
+    return ThreadPoolExecutor(max_workers=MAX_INVOKE_WORKERS, thread_name_prefix="socratiq-invoke")
+
+# Per-function concurrency caps, per-browser token buckets and priority queueing shared by all sessions
+@st.cache_resource
+def get_admission_controller():
+    return AdmissionController(
+        limits=FUNCTION_CONCURRENCY,
+        default_limit=DEFAULT_FUNCTION_CONCURRENCY,
+        user_rate=USER_INVOKE_RATE,
+        user_burst=USER_INVOKE_BURST,
+        max_wait=MAX_QUEUE_WAIT
     )
-    return boto3.client('lambda', region_name='us-east-1', config=config)
 
-lambda_client = get_lambda_client()
+def session_is_active(session_id: str) -> bool:
+    """Whether the Streamlit server still holds a session (always True outside a server, e.g. under AppTest)"""
+    if not runtime.exists():
+        return True
+    return runtime.get_instance().is_active_session(session_id)
 
-# Agent configurations
-AGENTS = {
-    "VERA": {
-        "name": "VERA",
-        "full_name": "Product & Clinical Intelligence",
-        "function": "SocratIQ-VERA-Agent-prod",
-        "icon": "🔬",
-        "description": "Expert in product architecture, formulation, manufacturing, stability, packaging, and quality systems",
-        "color": "vera-card"
-    },
-    "FINN": {
-        "name": "FINN",
-        "full_name": "Financial & Investment Intelligence",
-        "function": "SocratIQ-FINN-Agent-prod",
-        "icon": "💰",
-        "description": "Specialist in valuation, deal structure, due diligence, portfolio strategy, and risk assessment",
-        "color": "finn-card"
-    },
-    "NORA": {
-        "name": "NORA",
-        "full_name": "Legal, Regulatory & IP Intelligence",
-        "function": "SocratIQ-NORA-Agent-prod",
-        "icon": "⚖️",
-        "description": "Authority on regulatory pathways, FDA strategy, CRADAs, patent landscape, and compliance",
-        "color": "nora-card"
-    },
-    "CLIA": {
-        "name": "CLIA",
-        "full_name": "Clinical Trials & Market Intelligence",
-        "function": "SocratIQ-CLIA-Agent-prod",
-        "icon": "📊",
-        "description": "Expert in protocol design, clinical operations, market access, competitive intelligence, and evidence generation",
-        "color": "clia-card"
-    }
+# Memory held in each session's state, with idle eviction, shared by all sessions
+@st.cache_resource
+def get_session_memory():
+    return SessionMemory(
+        idle_timeout=SESSION_IDLE_TIMEOUT,
+        trace_allocations=TRACE_ALLOCATIONS,
+        is_active=session_is_active
+    )
+
+# Response cache shared by all sessions; set SOCRATIQ_CACHE_DB to persist it across restarts
+@st.cache_resource
+def get_response_cache():
+    return ResponseCache(
+        max_entries=int(os.environ.get("SOCRATIQ_CACHE_SIZE", "256")),
+        ttl_seconds=float(os.environ.get("SOCRATIQ_CACHE_TTL", "3600")),
+        db_path=os.environ.get("SOCRATIQ_CACHE_DB")
+    )
+
+# Background job runner and its job store, shared by all sessions
+@st.cache_resource
+def get_job_runner():
+    os.makedirs(DATA_DIR, exist_ok=True)
+    return JobRunner(JobStore(os.path.join(DATA_DIR, "jobs.db")), max_workers=MAX_JOB_WORKERS)
+
+# Batch TPP runner and its batch store, shared by all sessions
+@st.cache_resource
+def get_batch_runner():
+    os.makedirs(DATA_DIR, exist_ok=True)
+    return BatchRunner(
+        BatchStore(os.path.join(DATA_DIR, "batches.db")),
+        max_concurrency=BATCH_MAX_CONCURRENCY,
+        rate_per_second=BATCH_RATE_LIMIT
+    )
+
+# Persistent, searchable query history shared by all sessions
+@st.cache_resource
+def get_history_store():
+    os.makedirs(DATA_DIR, exist_ok=True)
+    return HistoryStore(os.path.join(DATA_DIR, "history.db"))
+
+# Per-component TPP results keyed by their inputs, reused when a TPP is regenerated; they expire with the response cache
+@st.cache_resource
+def get_component_store():
+    os.makedirs(DATA_DIR, exist_ok=True)
+    return ComponentStore(
+        os.path.join(DATA_DIR, "tpp_components.db"),
+        ttl_seconds=float(os.environ.get("SOCRATIQ_CACHE_TTL", "3600"))
+    )
+
+# BM25 index over CORPUS_DIR, re-indexed incrementally when corpus files change
+@st.cache_resource
+def get_corpus_index():
+    index = CorpusIndex(CORPUS_DIR, os.path.join(DATA_DIR, "corpus-index"))
+    index.refresh()
+    return index
+
+# Chunk embedding index over CORPUS_DIR; created on first use of Corpus Search since loading a model can be slow.
+# SOCRATIQ_EMBEDDER selects the embedder ("hashing", "sentence-transformers:<model>" or "module:callable")
+@st.cache_resource(show_spinner="Building the corpus embedding index...")
+def get_embedding_index():
+    index = EmbeddingIndex(
+        CORPUS_DIR,
+        os.path.join(DATA_DIR, "embedding-index"),
+        embedder=load_embedder(os.environ.get("SOCRATIQ_EMBEDDER")),
+        dtype=os.environ.get("SOCRATIQ_EMBEDDING_DTYPE", "float16")
+    )
+    index.refresh()
+    return index
+
+# Local classifier seeded from agents/*/skills.md and the sub-agent keywords in lambda/shared/corpus-retrieval.ts
+@st.cache_resource
+def get_query_router():
+    return QueryRouter.from_repo(os.path.dirname(os.path.abspath(__file__)), ROUTING_THRESHOLD)
+
+lambda_client = get_lambda_client()
+inflight_requests = get_inflight_requests()
+call_metrics = get_call_metrics()
+resilient_invoker = get_resilient_invoker()
+response_cache = get_response_cache()
+admission_controller = get_admission_controller()
+session_memory = get_session_memory()
+job_runner = get_job_runner()
+batch_runner = get_batch_runner()
+history_store = get_history_store()
+component_store = get_component_store()
+corpus_index = get_corpus_index()
+query_router = get_query_router()
+
+# TPP components offered on the Generate TPP page, mapped to the analysis requested from Sophie
+TPP_COMPONENTS = {
+    "Product Architecture": "product architecture and formulation strategy",
+    "Clinical Strategy": "clinical trial design and enrollment strategy",
+    "Regulatory Pathway": "regulatory pathway and FDA strategy",
+    "Financial Analysis": "valuation and investment potential",
+    "Market Assessment": "market access and competitive landscape",
+    "IP Landscape": "patent landscape and IP strategy"
 }
 
-SOPHIE_CONFIG = {
-    "name": "Sophie",
-    "full_name": "Strategic Orchestration Engine",
-    "function": "SocratIQ-Sophie-Orchestrator-prod",
-    "icon": "🧠",
-    "description": "Multi-agent coordinator using Tri-Paradigm Reasoning (Mechanistic, Deterministic, Probabilistic)",
-    "color": "sophie-card"
+# Agents Sophie consults for each TPP component; pre-warmed when the Generate TPP page opens
+TPP_COMPONENT_AGENTS = {
+    "Product Architecture": "VERA",
+    "Clinical Strategy": "VERA",
+    "Regulatory Pathway": "NORA",
+    "Financial Analysis": "FINN",
+    "Market Assessment": "CLIA",
+    "IP Landscape": "NORA"
 }
 
+# TPP components whose analysis depends on the therapeutic area; the others are prompted, and stored, without it
+TPP_AREA_COMPONENTS = frozenset({"Clinical Strategy", "Regulatory Pathway", "Financial Analysis", "Market Assessment"})
+
+# Keep-warm pings to every agent function, started with the first session
+@st.cache_resource
+def get_warmup_scheduler():
+    functions = {agent_name: agent["function"] for agent_name, agent in AGENTS.items()}
+    functions[SOPHIE_CONFIG["name"]] = SOPHIE_CONFIG["function"]
+    scheduler = WarmupScheduler(functools.partial(ping_function, lambda_client), functions, interval=KEEP_WARM_INTERVAL, cold_after=COLD_AFTER)
+    scheduler.start()
+    return scheduler
+
+warmup_scheduler = get_warmup_scheduler()
+
+# Invocation pipeline (cache, coalescing, resilience, streaming, tracing) shared by all sessions
+@st.cache_resource
+def get_agent_client():
+    return AgentClient(
+        lambda_client,
+        invoker=resilient_invoker,
+        cache=response_cache,
+        inflight=inflight_requests,
+        metrics=call_metrics,
+        on_round_trip=warmup_scheduler.record_call,
+        render_interval=STREAM_RENDER_INTERVAL,
+        admission=admission_controller
+    )
+
+agent_client = get_agent_client()
+
 # Initialize session state
 if 'chat_history' not in st.session_state:
     st.session_state.chat_history = {}
 if 'tpp_history' not in st.session_state:
     st.session_state.tpp_history = []
 
-def invoke_agent(agent_name: str, query: str) -> Dict[str, Any]:
-    """Invoke a single agent Lambda function"""
+def timed_render(response: Dict[str, Any], render: Callable[[], None]):
+    """Run a render callback, recording its duration against the response's trace"""
+    started = time.perf_counter()
+    render()
+    trace_id = response.get("_meta", {}).get("trace_id")
+    if trace_id:
+        call_metrics.add_span(trace_id, "render", (time.perf_counter() - started) * 1000)
+
+# Milliseconds the running panel has spent waiting on agent calls, so its own run time can be told apart
+_agent_wait_ms: ContextVar[Optional[List[float]]] = ContextVar("agent_wait_ms", default=None)
+
+def add_agent_wait(duration_ms: float):
+    """Count duration_ms against the agent calls of the running panel, if any"""
+    waits = _agent_wait_ms.get()
+    if waits is not None:
+        waits.append(duration_ms)
+
+@contextlib.contextmanager
+def waiting_on_agents():
+    """Time the block as agent call time of the running panel (streamed sections rendered meanwhile included)"""
+    started = time.perf_counter()
     try:
-        function_name = AGENTS[agent_name]["function"]
-
-        payload = {
-            "query": query,
-            "traceId": f"streamlit-{int(time.time())}"
-        }
-
-        with st.spinner(f"Consulting {AGENTS[agent_name]['full_name']}..."):
-            response = lambda_client.invoke(
-                FunctionName=function_name,
-                InvocationType='RequestResponse',
-                Payload=json.dumps(payload)
-            )
+        yield
+    finally:
+        add_agent_wait((time.perf_counter() - started) * 1000)
+
+@contextlib.contextmanager
+def timed_panel(panel: str):
+    """Record the block's run time under `panel` in call_metrics, with its agent call time separated"""
+    waits: List[float] = []
+    token = _agent_wait_ms.set(waits)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration_ms = (time.perf_counter() - started) * 1000
+        _agent_wait_ms.reset(token)
+        # A fragment run inside a full page run counts towards the page's call time too
+        add_agent_wait(sum(waits))
+        call_metrics.record_panel_run(panel, duration_ms, sum(waits))
+
+def panel_fragment(panel: str):
+    """st.fragment that records each run's duration under `panel` in call_metrics
+
+    Widget interactions inside the panel rerun only the panel, not the whole script.
+    """
+    def decorate(fn: Callable[..., None]) -> Callable[..., None]:
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            with timed_panel(panel):
+                return fn(*args, **kwargs)
+
+        return st.fragment(timed)
+
+    return decorate
+
+@st.cache_data(show_spinner=False)
+def agent_card_html(agent_key: str) -> str:
+    """Static HTML card for an agent on the Home page"""
+    agent = AGENTS[agent_key]
+    return f"""
+    <div class="agent-card {agent['color']}">
+        <h3>{agent['icon']} {agent['full_name']}</h3>
+        <p>{agent['description']}</p>
+    </div>
+    """
 
-            result = json.loads(response['Payload'].read())
+def _use_cache() -> bool:
+    """Whether the current session allows cached responses"""
+    return not st.session_state.get("bypass_cache", False)
 
-            # Handle API Gateway response format
-            if 'statusCode' in result:
-                if result['statusCode'] == 200:
-                    body = json.loads(result['body']) if isinstance(result['body'], str) else result['body']
-                    return body
-                else:
-                    return {"error": f"Agent returned status {result['statusCode']}"}
+def _stream_renderer(placeholder, render: Callable[[Dict[str, Any]], None]) -> Optional[Callable[[Dict[str, Any]], None]]:
+    """Build an on_update callback that re-renders partial responses into placeholder"""
+    if placeholder is None or not st.session_state.get("stream_responses", True):
+        return None
 
-            return result
+    def on_update(partial: Dict[str, Any]):
+        with placeholder.container():
+            render(partial)
 
-    except Exception as e:
-        return {"error": str(e)}
+    return on_update
 
-def invoke_sophie(message: str) -> Dict[str, Any]:
-    """Invoke Sophie orchestrator for multi-agent coordination"""
-    try:
-        payload = {
-            "query": message,
-            "traceId": f"streamlit-sophie-{int(time.time())}"
-        }
+def _queue_reporter(label: str) -> Callable[[int, float], None]:
+    """on_wait callback showing a queued call's position and estimated wait until it is admitted"""
+    notice = st.empty()
 
-        with st.spinner("Sophie is orchestrating multiple agents for comprehensive analysis..."):
-            response = lambda_client.invoke(
-                FunctionName=SOPHIE_CONFIG["function"],
-                InvocationType='RequestResponse',
-                Payload=json.dumps(payload)
+    def on_wait(position: int, eta_s: float):
+        if position == 0:
+            notice.empty()
+        else:
+            notice.info(f"🚦 {label} is at capacity: you are **#{position}** in the queue, about {math.ceil(eta_s)} s to go")
+
+    return on_wait
+
+def show_queue_estimate(labels, priority: int):
+    """One-off note of the admission queue ahead of calls made from worker threads, which cannot update the page"""
+    waits = {label: admission_controller.estimate(label, priority) for label in labels}
+    queued = {label: wait for label, wait in waits.items() if wait[0] or wait[1]}
+    if queued:
+        st.caption("🚦 " + " · ".join(
+            f"{label}: {ahead} queued ahead, about {math.ceil(eta_s)} s wait" for label, (ahead, eta_s) in queued.items()
+        ))
+
+def invoke_agent(agent_name: str, query: str, placeholder=None) -> Dict[str, Any]:
+    """Invoke a single agent Lambda function, streaming partial output into placeholder if given"""
+    on_update = _stream_renderer(placeholder, lambda partial: display_agent_response(partial, agent_name))
+    on_wait = _queue_reporter(agent_name)
+    with st.spinner(f"Consulting {AGENTS[agent_name]['full_name']}..."), waiting_on_agents():
+        return agent_client.call(
+            AGENTS[agent_name]["function"], query, "streamlit", "Agent", _use_cache(), on_update,
+            user=get_client_id(), priority=PRIORITY_CHAT, on_wait=on_wait
+        )
+
+def invoke_all_agents(query: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Invoke every agent in AGENTS concurrently, yielding (agent_name, response) as each completes.
+
+    Wall-clock time is bounded by the slowest agent rather than the sum of all of them.
+    """
+    executor = get_invoke_executor()
+    # Session state and query params are only readable from the script thread
+    use_cache = _use_cache()
+    user = get_client_id()
+    show_queue_estimate(AGENTS, PRIORITY_CHAT)
+    futures = {
+        executor.submit(
+            agent_client.call, agent["function"], query, "streamlit", "Agent", use_cache, user=user, priority=PRIORITY_CHAT
+        ): agent_name
+        for agent_name, agent in AGENTS.items()
+    }
+    # Only the time spent waiting here is agent call time; the caller renders between results
+    waited = time.perf_counter()
+    for future in as_completed(futures):
+        add_agent_wait((time.perf_counter() - waited) * 1000)
+        yield futures[future], future.result()
+        waited = time.perf_counter()
+
+def invoke_sophie(message: str, placeholder=None) -> Dict[str, Any]:
+    """Invoke Sophie orchestrator for multi-agent coordination, streaming sections into placeholder if given"""
+    on_update = _stream_renderer(placeholder, display_sophie_response)
+    on_wait = _queue_reporter(SOPHIE_CONFIG["name"])
+    with st.spinner("Sophie is orchestrating multiple agents for comprehensive analysis..."), waiting_on_agents():
+        return agent_client.call(
+            SOPHIE_CONFIG["function"], message, "streamlit-sophie", "Sophie", _use_cache(), on_update,
+            user=get_client_id(), priority=PRIORITY_CHAT, on_wait=on_wait
+        )
+
+def get_client_id() -> str:
+    """Stable ID for this browser, kept in the URL so it survives page refreshes"""
+    if "cid" not in st.query_params:
+        st.query_params["cid"] = uuid.uuid4().hex[:12]
+    return st.query_params["cid"]
+
+def get_session_id() -> str:
+    """ID of this Streamlit session (one per browser tab); the client ID when there is no script run context"""
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else get_client_id()
+
+def deferred_download(make_data: Callable[[], bytes]):
+    """Data argument for st.download_button that is only generated when the button is clicked
+
+    Streamlit 1.50+ accepts a callable; older versions get the generated data up front.
+    """
+    return make_data if DEFERRED_DOWNLOADS else make_data()
+
+def record_chat(agent_name: str, query: str, response: Dict[str, Any]):
+    """Save an agent exchange to the history store and the session's recent window"""
+    timestamp = datetime.now().isoformat()
+    history_id = history_store.add_chat(get_client_id(), agent_name, query, response, timestamp)
+
+    # The response is read back from the history store; session state keeps only the reference
+    recent = st.session_state.chat_history.setdefault(agent_name, [])
+    entry = {
+        "query": query,
+        "timestamp": timestamp,
+        "history_id": history_id
+    }
+    recent.append(entry)
+    del recent[:-RECENT_HISTORY_WINDOW]
+    session_memory.track(get_session_id(), recent, entry, get_client_id())
+
+def record_tpp(query: str, response: Dict[str, Any], drug_name: Optional[str] = None, therapeutic_area: Optional[str] = None):
+    """Save a Sophie report to the history store and the session's recent window"""
+    timestamp = datetime.now().isoformat()
+    history_id = history_store.add_tpp(get_client_id(), query, response, timestamp, drug_name, therapeutic_area)
+
+    recent = st.session_state.tpp_history
+    entry = {
+        "query": query,
+        "drug_name": drug_name,
+        "therapeutic_area": therapeutic_area,
+        "timestamp": timestamp,
+        "history_id": history_id
+    }
+    recent.append(entry)
+    del recent[:-RECENT_HISTORY_WINDOW]
+    session_memory.track(get_session_id(), recent, entry, get_client_id())
+
+def build_tpp_prompt(drug_name: str, therapeutic_area: str, components) -> str:
+    """Build the Sophie prompt for a TPP from a drug, an optional therapeutic area and TPP_COMPONENTS labels"""
+    therapeutic_context = f" in {therapeutic_area}" if therapeutic_area else ""
+    analyses = [TPP_COMPONENTS[component] for component in components]
+
+    return f"""Generate a comprehensive Target Product Profile for {drug_name}{therapeutic_context}.
+
+Please analyze and provide insights on:
+{chr(10).join(f'- {analysis}' for analysis in analyses)}
+
+Use publicly available information and provide evidence-based recommendations with citations."""
+
+def _component_analysis(therapeutic_area: str, component: str) -> str:
+    """What to analyze for a component, in the therapeutic area only if TPP_AREA_COMPONENTS says it depends on it"""
+    if therapeutic_area and component in TPP_AREA_COMPONENTS:
+        return f"{TPP_COMPONENTS[component]} in {therapeutic_area}"
+    return TPP_COMPONENTS[component]
+
+def build_component_prompt(drug_name: str, therapeutic_area: str, component: str) -> str:
+    """Build the Sophie prompt for one TPP component; results are stored per component (socratiq.tpp)"""
+    return f"""Generate the {component} section of a Target Product Profile for {drug_name}.
+
+Focus your analysis on {_component_analysis(therapeutic_area, component)}.
+
+Use publicly available information and provide evidence-based recommendations with citations."""
+
+def build_components_prompt(drug_name: str, therapeutic_area: str, components) -> str:
+    """Build the Sophie prompt for several TPP components, asking for a heading per component so the response can be split"""
+    headings = ", ".join(f'"{COMPONENT_HEADING.format(component=component)}"' for component in components)
+
+    return f"""Generate these sections of a Target Product Profile for {drug_name}:
+{chr(10).join(f'- {component}: {_component_analysis(therapeutic_area, component)}' for component in components)}
+
+In each part of your analysis and in each agent contribution, put every section's text under its own heading line: {headings}.
+
+Use publicly available information and provide evidence-based recommendations with citations."""
+
+def generate_tpp(drug_name: str, therapeutic_area: str, components: list, progress) -> Tuple[Dict[str, Any], list]:
+    """Generate a TPP, reusing stored results for unchanged components
+
+    Components without a stored result go to Sophie in one call: the combined
+    component prompt, or the single component prompt when only one is left.
+    Returns the merged response and the ComponentResults it was built from.
+    """
+    # Session state and query params are only readable from the script thread
+    use_cache = _use_cache()
+    user = get_client_id()
+
+    def build_prompt(remaining) -> str:
+        if len(remaining) == 1:
+            return build_component_prompt(drug_name, therapeutic_area, remaining[0])
+        return build_components_prompt(drug_name, therapeutic_area, remaining)
+
+    def fetch(prompt: str) -> Dict[str, Any]:
+        with waiting_on_agents():
+            return agent_client.call(
+                SOPHIE_CONFIG["function"], prompt, "streamlit-sophie", "Sophie", use_cache, user=user, priority=PRIORITY_TPP
             )
 
-            result = json.loads(response['Payload'].read())
+    show_queue_estimate([SOPHIE_CONFIG["name"]], PRIORITY_TPP)
+
+    started = time.perf_counter()
+    results = []
+    ready = 0
+    for result in generate_components(
+        components, build_prompt, fetch, component_store, SOPHIE_CONFIG["function"], drug_name, therapeutic_area,
+        TPP_COMPONENT_AGENTS, TPP_AREA_COMPONENTS, reuse=use_cache
+    ):
+        results.append(result)
+        ready += 1
+        progress.progress(ready / len(components), text=f"{ready}/{len(components)} components ready")
+
+    response = merge_components(results, components)
+    response["_meta"] = {
+        "tpp_components": {result.component: result.status for result in results},
+        "cache_hit": all(result.status != STATUS_FRESH for result in results),
+        "latency_ms": (time.perf_counter() - started) * 1000
+    }
+    return response, results
+
+def show_component_status(results: list, components: list):
+    """Which TPP sections were generated fresh, reused from an earlier run, or failed"""
+    by_component = {result.component: result for result in results}
+    fresh = sum(1 for result in results if result.status == STATUS_FRESH)
+    st.caption(
+        f"🧩 {fresh} of {len(by_component)} components generated fresh, {len(by_component) - fresh} reused"
+        + (" · 🔁 tick **Bypass cache** to regenerate every component" if fresh < len(by_component) else "")
+    )
+    with st.expander("Component details"):
+        st.dataframe(
+            [{
+                "Component": component,
+                "Status": {STATUS_FRESH: "🆕 fresh", STATUS_FAILED: "❌ failed"}.get(by_component[component].status, "♻️ reused"),
+                "Depends on Area": component in TPP_AREA_COMPONENTS,
+                "Agents": ", ".join(by_component[component].agents),
+                "Latency (ms)": round(by_component[component].latency_ms) if by_component[component].status != STATUS_REUSED else None,
+                "Error": by_component[component].response.get("error")
+            } for component in components if component in by_component],
+            hide_index=True,
+            use_container_width=True
+        )
 
-            # Handle API Gateway response format
-            if 'statusCode' in result:
-                if result['statusCode'] == 200:
-                    body = json.loads(result['body']) if isinstance(result['body'], str) else result['body']
-                    return body
-                else:
-                    return {"error": f"Sophie returned status {result['statusCode']}"}
+def submit_tpp_job(drug_name: str, therapeutic_area: str, message: str) -> str:
+    """Queue a TPP generation on the background job runner and return the job ID"""
+    # Session state and query params are only readable from the script thread
+    use_cache = _use_cache()
+    owner = get_client_id()
+    therapeutic_area = therapeutic_area or "Not specified"
+
+    def run() -> Dict[str, Any]:
+        response = agent_client.call(
+            SOPHIE_CONFIG["function"], message, "streamlit-sophie-job", "Sophie", use_cache, user=owner, priority=PRIORITY_TPP
+        )
+        history_store.add_tpp(owner, message, response, datetime.now().isoformat(), drug_name, therapeutic_area)
+        return response
+
+    return job_runner.submit(
+        owner=owner,
+        kind="tpp",
+        label=drug_name,
+        params={"drug_name": drug_name, "therapeutic_area": therapeutic_area},
+        fn=run
+    )
+
+def batch_item_runner(owner: str, components, use_cache: bool) -> Callable[[Dict[str, Any]], Tuple[Dict[str, Any], int]]:
+    """Callable that generates one batch item's TPP and records it in the history store"""
+    def run(item: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+        message = build_tpp_prompt(item["drug_name"], item["therapeutic_area"], components)
+        response = agent_client.call(
+            SOPHIE_CONFIG["function"], message, "streamlit-sophie-batch", "Sophie", use_cache, user=owner, priority=PRIORITY_BATCH
+        )
+        history_id = history_store.add_tpp(
+            owner, message, response, datetime.now().isoformat(),
+            item["drug_name"], item["therapeutic_area"] or "Not specified"
+        )
+        return response, history_id
 
-            return result
+    return run
 
-    except Exception as e:
-        return {"error": str(e)}
+def resume_batch(batch: Dict[str, Any]):
+    """Restart a batch's unfinished and failed items with the settings it was submitted with"""
+    params = batch["params"]
+    batch_runner.resume(
+        batch["id"],
+        batch_item_runner(batch["owner"], params["components"], params["use_cache"]),
+        concurrency=params["concurrency"]
+    )
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def batch_archive(batch_id: str, archive_format: str, finished: int) -> bytes:
+    """Export a batch as JSONL or zip; `finished` keys the cache so new results invalidate it"""
+    if archive_format == "zip":
+        return batch_runner.store.export_zip(batch_id, history_store)
+    return batch_runner.store.export_jsonl(batch_id, history_store)
+
+def paginate(total: int, key: str) -> Tuple[int, int]:
+    """Render page-size and page selectors for total entries and return (offset, limit)"""
+    col1, col2 = st.columns([1, 1])
+    with col1:
+        page_size = st.selectbox("Entries per page", HISTORY_PAGE_SIZES, key=f"{key}_size")
+    pages = max(1, math.ceil(total / page_size))
+    with col2:
+        page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, step=1, key=f"{key}_{page_size}")
+    return (page - 1) * page_size, page_size
+
+def show_history_table(rows, kind: str, key: str) -> Optional[int]:
+    """Render precomputed history summary rows and return the ID of the selected entry, if any"""
+    table = []
+    for row in rows:
+        if kind == KIND_CHAT:
+            who = f"{AGENTS.get(row['agent'], {}).get('icon', '🔹')} {row['agent']}"
+        else:
+            who = f"{row['agent_count']} agents"
+        table.append({
+            "Title": row['title'],
+            "Agent" if kind == KIND_CHAT else "Agents Consulted": who,
+            "Confidence": "Error" if row['is_error'] else (f"{row['confidence']:.0%}" if row['confidence'] is not None else "-"),
+            "Sources": row['source_count'],
+            "Date": row['timestamp'].split('T')[0]
+        })
+
+    event = st.dataframe(
+        table,
+        on_select="rerun",
+        selection_mode="single-row",
+        hide_index=True,
+        use_container_width=True,
+        key=key
+    )
+    if event.selection.rows:
+        return rows[event.selection.rows[0]]['id']
+    return None
+
+def show_job_status(limit: int = 5):
+    """Compact, self-refreshing list of this browser's most recent background jobs"""
+    owner = get_client_id()
+    pending = any(job["status"] in PENDING_STATUSES for job in job_runner.store.list_for_owner(owner, limit))
+
+    # Poll only while something is still in flight
+    @st.fragment(run_every=JOB_POLL_INTERVAL if pending else None)
+    def job_status_panel():
+        jobs = job_runner.store.list_for_owner(owner, limit)
+        if not jobs:
+            return
+
+        st.markdown("---")
+        st.markdown("### ⏳ Background TPP Jobs")
+        for job in jobs:
+            icon = {JOB_SUCCEEDED: "✅", JOB_FAILED: "❌"}.get(job["status"], "⏳")
+            created = datetime.fromtimestamp(job["created_at"]).strftime("%H:%M:%S")
+            st.markdown(f"{icon} **{job['label']}** · {job['status']} · submitted {created}")
+        st.caption("Collect finished reports from **📊 History → ⏳ Background Jobs**.")
+
+        # Trigger a full rerun once everything has finished so polling stops
+        if pending and not any(job["status"] in PENDING_STATUSES for job in jobs):
+            st.rerun()
+
+    job_status_panel()
+
+def show_batch_status(limit: int = 3):
+    """Self-refreshing progress, controls and downloads for this browser's recent TPP batches"""
+    owner = get_client_id()
+    running = any(batch["status"] == BATCH_RUNNING for batch in batch_runner.store.list_for_owner(owner, limit))
+
+    # Poll only while a batch is running
+    @st.fragment(run_every=JOB_POLL_INTERVAL if running else None)
+    def batch_status_panel():
+        batches = batch_runner.store.list_for_owner(owner, limit)
+        if not batches:
+            return
+
+        st.markdown("---")
+        st.markdown("### 📦 TPP Batches")
+        for batch in batches:
+            counts = batch["counts"]
+            finished = counts[ITEM_SUCCEEDED] + counts[ITEM_FAILED]
+            remaining = counts[ITEM_QUEUED] + counts[ITEM_RUNNING]
+            created = datetime.fromtimestamp(batch["created_at"]).strftime("%Y-%m-%d %H:%M")
+
+            st.markdown(f"**{batch['label']}** · {batch['status']} · submitted {created}")
+            progress_text = (
+                f"{finished}/{counts['total']} done · {counts[ITEM_SUCCEEDED]} succeeded · "
+                f"{counts[ITEM_FAILED]} failed · {counts[ITEM_RUNNING]} running"
+            )
+
+            # ETA from the mean duration of finished items and the batch's concurrency
+            durations = [
+                item["finished_at"] - item["started_at"]
+                for item in batch_runner.store.items(batch["id"])
+                if item["finished_at"] and item["started_at"]
+            ]
+            if batch["status"] == BATCH_RUNNING and durations and remaining:
+                eta = sum(durations) / len(durations) * remaining / batch["params"]["concurrency"]
+                progress_text += f" · ~{eta / 60:.0f} min left" if eta >= 90 else f" · ~{eta:.0f} s left"
+            st.progress(finished / counts["total"] if counts["total"] else 1.0, text=progress_text)
+
+            col1, col2, col3 = st.columns([1, 1, 2])
+            with col1:
+                if batch["status"] == BATCH_RUNNING:
+                    if st.button("⏸️ Pause", key=f"pause_{batch['id']}", use_container_width=True):
+                        batch_runner.pause(batch["id"])
+                        st.rerun()
+                elif remaining or counts[ITEM_FAILED]:
+                    label = "▶️ Resume" if remaining else "🔁 Retry failed"
+                    if st.button(label, key=f"resume_{batch['id']}", use_container_width=True):
+                        resume_batch(batch)
+                        st.rerun()
+            if batch["status"] != BATCH_RUNNING and finished:
+                with col2:
+                    archive_format = st.selectbox(
+                        "Format",
+                        ["jsonl", "zip"],
+                        key=f"format_{batch['id']}",
+                        label_visibility="collapsed"
+                    )
+                with col3:
+                    st.download_button(
+                        label=f"📥 Download {finished} results",
+                        data=batch_archive(batch["id"], archive_format, finished),
+                        file_name=f"TPP_batch_{datetime.fromtimestamp(batch['created_at']).strftime('%Y%m%d_%H%M%S')}.{archive_format}",
+                        mime="application/zip" if archive_format == "zip" else "application/jsonl",
+                        key=f"download_{batch['id']}",
+                        use_container_width=True
+                    )
+
+        # Trigger a full rerun once every batch has stopped so polling stops
+        if running and not any(batch["status"] == BATCH_RUNNING for batch in batches):
+            st.rerun()
+
+    batch_status_panel()
+
+def show_corpus_preview(query: str, agent_name: Optional[str] = None):
+    """Sources from the local corpus index an agent would be likely to cite for a query"""
+    corpus_index.maybe_refresh()
+    started = time.perf_counter()
+    hits = corpus_index.search(query, agents=[agent_name] if agent_name else None, limit=CORPUS_PREVIEW_RESULTS)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    scope = f"{agent_name}'s corpus" if agent_name else "all agent corpora"
+    with st.expander(f"📚 Corpus preview · {len(hits)} source{'s' if len(hits) != 1 else ''} from {scope}"):
+        if not hits:
+            st.info(f"No documents in {scope} match this question.")
+        for i, hit in enumerate(hits, 1):
+            st.markdown(f"**{i}. {hit.title}** · {hit.agent} / {hit.category} · score {hit.score:.2f}")
+            st.caption(f"{hit.source} · {hit.legal_status}" + (f" · {hit.url}" if hit.url else ""))
+            if hit.excerpt:
+                st.text(hit.excerpt)
+        stats = corpus_index.stats()
+        st.caption(f"Searched {stats['documents']} indexed documents in {elapsed_ms:.1f} ms")
+
+def display_cache_status(response: Dict[str, Any]):
+    """Show whether a response was served from the response cache"""
+    meta = response.get('_meta', {})
+    if meta.get('coalesced'):
+        st.metric("Cache", "Shared", help="Joined an identical request already in flight")
+    elif 'cache_hit' in meta:
+        st.metric("Cache", "Hit" if meta['cache_hit'] else "Miss")
+
+def display_call_details(response: Dict[str, Any]):
+    """Show time-to-first-byte, retries, hedging and queue wait for a response"""
+    meta = response.get('_meta', {})
+    details = []
+    if meta.get('ttfb_ms') is not None:
+        mode = "streamed" if meta.get('streamed') else "buffered"
+        details.append(f"⚡ First byte after {meta['ttfb_ms']:,.0f} ms ({mode})")
+    if meta.get('retries'):
+        details.append(f"🔁 Retried {meta['retries']}×")
+    if meta.get('hedged'):
+        details.append("🪁 Hedged request")
+    if meta.get('queued_ms'):
+        details.append(f"🚦 Queued {meta['queued_ms'] / 1000:,.1f} s for capacity")
+    if details:
+        st.caption(" · ".join(details))
 
 def display_agent_response(response: Dict[str, Any], agent_name: str):
     """Display agent response in an attractive format"""
@@ -215,9 +926,9 @@ def display_agent_response(response: Dict[str, Any], agent_name: str):
         st.markdown(response['recommendation'])
 
     # Metadata
-    col1, col2, col3 = st.columns(3)
+    col1, col2, col3, col4 = st.columns(4)
     with col1:
-        if 'confidence' in response:
+        if isinstance(response.get('confidence'), (int, float)):
             st.metric("Confidence", f"{response['confidence']:.1%}")
     with col2:
         if 'timestamp' in response:
@@ -225,6 +936,9 @@ def display_agent_response(response: Dict[str, Any], agent_name: str):
     with col3:
         if 'sources' in response and response['sources']:
             st.metric("Sources", len(response['sources']))
+    with col4:
+        display_cache_status(response)
+    display_call_details(response)
 
     # Sources
     if 'sources' in response and response['sources']:
@@ -284,9 +998,9 @@ def display_sophie_response(response: Dict[str, Any]):
 
     # Metadata
     st.markdown("---")
-    col1, col2, col3, col4 = st.columns(4)
+    col1, col2, col3, col4, col5 = st.columns(5)
     with col1:
-        if 'confidence' in response:
+        if isinstance(response.get('confidence'), (int, float)):
             st.metric("Confidence", f"{response['confidence']:.1%}")
     with col2:
         if 'sources' in response:
@@ -297,6 +1011,9 @@ def display_sophie_response(response: Dict[str, Any]):
     with col4:
         if 'conflicts' in response and response['conflicts']:
             st.metric("Conflicts Identified", len(response['conflicts']))
+    with col5:
+        display_cache_status(response)
+    display_call_details(response)
 
     # Conflicts
     if 'conflicts' in response and response['conflicts']:
@@ -317,17 +1034,88 @@ def main():
     st.sidebar.markdown("## Navigation")
     app_mode = st.sidebar.radio(
         "Select Mode",
-        ["🏠 Home", "💬 Agent Chat", "🎯 Generate TPP", "📊 History"]
+        ["🏠 Home", "💬 Agent Chat", "🎯 Generate TPP", "🔎 Corpus Search", "📊 History", "📈 Performance"]
     )
 
-    if app_mode == "🏠 Home":
-        show_home()
-    elif app_mode == "💬 Agent Chat":
-        show_agent_chat()
-    elif app_mode == "🎯 Generate TPP":
-        show_tpp_generator()
-    elif app_mode == "📊 History":
-        show_history()
+    # Response cache controls
+    st.sidebar.markdown("## Response Cache")
+    st.sidebar.checkbox(
+        "Bypass cache",
+        key="bypass_cache",
+        help="Always call the agents and refresh the cached response"
+    )
+    cache_stats = response_cache.stats()
+    inflight_stats = inflight_requests.stats()
+    st.sidebar.caption(
+        f"{cache_stats['entries']} cached responses · {cache_stats['hit_rate']:.0%} hit rate · "
+        f"{inflight_stats['coalesced']} calls coalesced"
+    )
+    if st.sidebar.button("Clear cache", use_container_width=True):
+        response_cache.clear()
+
+    # Circuit breaker state per agent
+    st.sidebar.markdown("## Agent Health")
+    breakers = resilient_invoker.snapshot()
+    health = []
+    for agent_name in list(AGENTS) + [SOPHIE_CONFIG["name"]]:
+        breaker = breakers.get(agent_name, {"state": CIRCUIT_CLOSED})
+        icon = {CIRCUIT_CLOSED: "🟢", CIRCUIT_OPEN: "🔴"}.get(breaker["state"], "🟡")
+        health.append(f"{icon} {agent_name}")
+    st.sidebar.caption(" · ".join(health))
+    queue_depth = sum(function['queued'] for function in admission_controller.stats()['functions'].values())
+    if queue_depth:
+        st.sidebar.caption(f"🚦 {queue_depth} calls queued for Lambda capacity")
+
+    # Active sessions keep the scheduled keep-warm pings running, and are not evicted as idle
+    warmup_scheduler.heartbeat()
+    session_memory.touch(get_session_id(), get_client_id())
+    if warmup_scheduler.enabled:
+        warm_states = warmup_scheduler.stats()
+        warm = sum(1 for stats in warm_states.values() if stats['state'] == STATE_WARM)
+        since_round = warmup_scheduler.seconds_since_round()
+        st.sidebar.caption(
+            f"♨️ {warm}/{len(warm_states)} functions warm · keep-warm round "
+            f"{'pending' if since_round is None else f'{since_round:.0f} s ago'}"
+        )
+
+    st.sidebar.markdown("## Sophie Routing")
+    st.sidebar.checkbox(
+        "Route single-domain questions",
+        value=True,
+        key="route_questions",
+        help=(
+            "Send Home questions that clearly belong to one specialist straight to that agent "
+            f"(confidence ≥ {ROUTING_THRESHOLD:.0%}); untick to always ask Sophie"
+        )
+    )
+    routing_stats = query_router.stats()
+    st.sidebar.caption(
+        f"{routing_stats['round_trips_avoided']} orchestration round trips avoided · "
+        f"{routing_stats['routed_rate']:.0%} of questions routed"
+    )
+
+    st.sidebar.markdown("## Streaming")
+    st.sidebar.checkbox(
+        "Stream responses",
+        value=True,
+        key="stream_responses",
+        help="Render sections as they arrive; functions that cannot stream fall back to a buffered call"
+    )
+
+    # Full script runs are timed per page so they can be compared with fragment reruns
+    with timed_panel(f"Page: {app_mode[2:]}"):
+        if app_mode == "🏠 Home":
+            show_home()
+        elif app_mode == "💬 Agent Chat":
+            show_agent_chat()
+        elif app_mode == "🎯 Generate TPP":
+            show_tpp_generator()
+        elif app_mode == "🔎 Corpus Search":
+            show_corpus_search()
+        elif app_mode == "📊 History":
+            show_history()
+        elif app_mode == "📈 Performance":
+            show_performance()
 
 def show_home():
     """Home page with Sophie interface for general questions"""
@@ -361,6 +1149,31 @@ def show_home():
     </script>
     """, unsafe_allow_html=True)
 
+    # Submitting the form reruns only this panel
+    sophie_panel()
+
+    # Show agent overview below
+    st.markdown("---")
+    st.markdown("### Specialized Agent Team")
+
+    # Display agent cards
+    col1, col2 = st.columns(2)
+
+    for idx, agent_key in enumerate(AGENTS):
+        with col1 if idx % 2 == 0 else col2:
+            st.markdown(agent_card_html(agent_key), unsafe_allow_html=True)
+
+    st.markdown("---")
+    st.markdown("### Navigation")
+    st.markdown("""
+    - **💬 Agent Chat**: Ask specific questions to individual specialist agents
+    - **🎯 Generate TPP**: Create comprehensive Target Product Profiles with structured guidance
+    - **📊 History**: Review your previous queries and analyses
+    """)
+
+@panel_fragment("Home: Sophie")
+def sophie_panel():
+    """Sophie question form and response"""
     # Use form for Enter key submission
     with st.form(key="sophie_form", clear_on_submit=False):
         query = st.text_area(
@@ -375,56 +1188,71 @@ def show_home():
         with col1:
             submit_button = st.form_submit_button("🧠 Ask Sophie", use_container_width=True, type="primary")
         with col2:
-            clear_button = st.form_submit_button("🗑️ Clear", use_container_width=True)
+            # Any submission reruns the panel, which drops the previous response
+            st.form_submit_button("🗑️ Clear", use_container_width=True)
 
-    if clear_button:
-        st.rerun()
+    # "Ask Sophie instead" under a routed answer resubmits the question to Sophie
+    override = st.session_state.pop("sophie_override", None)
+    if override:
+        query_router.record_override()
+        query, submit_button = override, True
 
     if submit_button and query:
-        # Invoke Sophie
-        response = invoke_sophie(query)
+        st.markdown("---")
 
-        # Save to history
-        st.session_state.tpp_history.append({
-            "query": query,
-            "response": response,
-            "timestamp": datetime.now().isoformat()
-        })
+        # Single-domain questions go straight to the specialist, skipping Sophie's orchestration round trip
+        decision = None
+        if not override:
+            if st.session_state.get("route_questions", True):
+                decision = query_router.route(query)
+            else:
+                query_router.record_bypass()
 
-        # Display response
-        st.markdown("---")
-        display_sophie_response(response)
+        response_placeholder = st.empty()
 
-    # Show agent overview below
-    st.markdown("---")
-    st.markdown("### Specialized Agent Team")
+        if decision is not None and decision.routed:
+            agent_name = decision.agent
+            response = invoke_agent(agent_name, query, response_placeholder)
+            record_chat(agent_name, query, response)
 
-    # Display agent cards
-    col1, col2 = st.columns(2)
+            with response_placeholder.container():
+                timed_render(response, lambda: display_agent_response(response, agent_name))
 
-    agents_list = list(AGENTS.items())
-    for idx, (agent_key, agent) in enumerate(agents_list):
-        with col1 if idx % 2 == 0 else col2:
-            st.markdown(f"""
-            <div class="agent-card {agent['color']}">
-                <h3>{agent['icon']} {agent['full_name']}</h3>
-                <p>{agent['description']}</p>
-            </div>
-            """, unsafe_allow_html=True)
+            st.caption(
+                f"🧭 Answered by {agent_name} directly ({decision.sub_agent}, "
+                f"{decision.confidence:.0%} confidence), without Sophie's orchestration"
+            )
+            st.button("🧠 Ask Sophie instead", on_click=request_sophie_override, args=(query,))
+            return
 
-    st.markdown("---")
-    st.markdown("### Navigation")
-    st.markdown("""
-    - **💬 Agent Chat**: Ask specific questions to individual specialist agents
-    - **🎯 Generate TPP**: Create comprehensive Target Product Profiles with structured guidance
-    - **📊 History**: Review your previous queries and analyses
-    """)
+        # Invoke Sophie, rendering sections into the placeholder as they stream in
+        response = invoke_sophie(query, response_placeholder)
+
+        # Save to history
+        record_tpp(query, response)
+
+        # Display response
+        with response_placeholder.container():
+            timed_render(response, lambda: display_sophie_response(response))
+
+        if decision is not None:
+            st.caption(f"🧭 Sent to Sophie: {decision.reason}")
+
+def request_sophie_override(query: str):
+    """Button callback: send query to Sophie on the next run of the Sophie panel"""
+    st.session_state.sophie_override = query
 
 def show_agent_chat():
     """Individual agent chat interface"""
     st.markdown("## 💬 Chat with Agents")
     st.markdown("Ask questions to individual specialized agents")
 
+    # Agent selection, queries and recent history rerun as a panel without the rest of the page
+    agent_chat_panel()
+
+@panel_fragment("Agent Chat")
+def agent_chat_panel():
+    """Agent selection, question, response and the selected agent's recent queries"""
     # Agent selection
     col1, col2 = st.columns([1, 3])
 
@@ -450,26 +1278,47 @@ def show_agent_chat():
     with col1:
         submit_button = st.button("🚀 Ask Agent", use_container_width=True)
     with col2:
-        if st.button("🗑️ Clear", use_container_width=True):
-            st.rerun()
+        # Clicking reruns the panel without a submission, which drops the previous response
+        st.button("🗑️ Clear", use_container_width=True)
+    with col3:
+        ask_all = st.checkbox(
+            "Ask all agents",
+            help="Send the question to VERA, FINN, NORA and CLIA in parallel"
+        )
 
-    if submit_button and query:
-        # Invoke agent
-        response = invoke_agent(selected_agent, query)
+    if query:
+        show_corpus_preview(query, None if ask_all else selected_agent)
 
-        # Save to history
-        if selected_agent not in st.session_state.chat_history:
-            st.session_state.chat_history[selected_agent] = []
+    if submit_button and query and ask_all:
+        st.markdown("---")
+        progress = st.progress(0.0, text=f"Consulting {len(AGENTS)} agents in parallel...")
 
-        st.session_state.chat_history[selected_agent].append({
-            "query": query,
-            "response": response,
-            "timestamp": datetime.now().isoformat()
-        })
+        # Render each result card as soon as its agent responds
+        for completed, (agent_name, response) in enumerate(invoke_all_agents(query), 1):
+            progress.progress(
+                completed / len(AGENTS),
+                text=f"{completed}/{len(AGENTS)} agents responded"
+            )
 
-        # Display response
+            record_chat(agent_name, query, response)
+
+            timed_render(response, lambda: display_agent_response(response, agent_name))
+
+        progress.empty()
+
+    elif submit_button and query:
         st.markdown("---")
-        display_agent_response(response, selected_agent)
+        response_placeholder = st.empty()
+
+        # Invoke agent, rendering partial output into the placeholder as it streams in
+        response = invoke_agent(selected_agent, query, response_placeholder)
+
+        # Save to history
+        record_chat(selected_agent, query, response)
+
+        # Display response
+        with response_placeholder.container():
+            timed_render(response, lambda: display_agent_response(response, selected_agent))
 
     # Show recent history for this agent
     if selected_agent in st.session_state.chat_history and st.session_state.chat_history[selected_agent]:
@@ -480,11 +1329,89 @@ def show_agent_chat():
                 st.markdown(f"**Query:** {item['query']}")
                 st.markdown(f"**Time:** {item['timestamp']}")
 
+def select_tpp_components(key: str = "tpp") -> list:
+    """Checkboxes for the TPP components to include; returns the selected TPP_COMPONENTS labels"""
+    st.markdown("### TPP Components to Include")
+    columns = st.columns(3)
+
+    components = []
+    for idx, component in enumerate(TPP_COMPONENTS):
+        with columns[idx // 2]:
+            if st.checkbox(component, value=True, key=f"{key}_{component}"):
+                components.append(component)
+    return components
+
+def prewarm_tpp_agents(components: list):
+    """Ping Sophie and the agents behind the selected components, so a TPP started soon afterwards avoids cold starts"""
+    agents = {TPP_COMPONENT_AGENTS[component] for component in components}
+    warmup_scheduler.prewarm([SOPHIE_CONFIG["name"], *sorted(agents)])
+
+def show_tpp_batch():
+    """Batch TPP generation for a CSV of drugs, run on the rate-limited batch worker pool"""
+    st.markdown(
+        "Upload a CSV with one drug per row: a **Drug Name** column and an optional **Therapeutic Area** column "
+        "(or drug and area as the first two columns, without a header)."
+    )
+    uploaded = st.file_uploader("Drugs CSV", type=["csv"])
+
+    items = []
+    if uploaded is not None:
+        try:
+            items = parse_batch_csv(uploaded.getvalue())
+        except (ValueError, UnicodeDecodeError) as e:
+            st.error(f"Could not read the CSV: {e}")
+        else:
+            preview = ", ".join(drug for drug, _ in items[:5])
+            st.caption(f"{len(items)} drugs: {preview}{', ...' if len(items) > 5 else ''}")
+
+    components = select_tpp_components(key="batch")
+    prewarm_tpp_agents(components)
+
+    col1, col2 = st.columns([2, 1])
+    with col2:
+        # A slider needs min_value < max_value; with a cap of 1 there is nothing to choose
+        concurrency = BATCH_MAX_CONCURRENCY
+        if BATCH_MAX_CONCURRENCY > 1:
+            concurrency = st.slider(
+                "Concurrent requests",
+                min_value=1,
+                max_value=BATCH_MAX_CONCURRENCY,
+                value=BATCH_MAX_CONCURRENCY,
+                help=f"Sophie invocations in flight at once; new requests start at most {BATCH_RATE_LIMIT:g} per second"
+            )
+    with col1:
+        start_button = st.button(
+            f"🧠 Generate {len(items)} TPPs" if items else "🧠 Generate TPPs",
+            use_container_width=True,
+            disabled=not items or not components
+        )
+
+    if start_button and items:
+        owner = get_client_id()
+        use_cache = _use_cache()
+        label = f"{uploaded.name} ({len(items)} drugs)"
+        batch_runner.submit(
+            owner=owner,
+            label=label,
+            params={"components": components, "use_cache": use_cache, "concurrency": concurrency},
+            items=items,
+            fn=batch_item_runner(owner, components, use_cache),
+            concurrency=concurrency
+        )
+        st.success(f"Started batch **{label}**. Reports are saved to History as they finish.")
+
+    show_batch_status()
+
 def show_tpp_generator():
     """Target Product Profile generator using Sophie"""
     st.markdown("## 🎯 Generate Target Product Profile")
     st.markdown("Generate comprehensive Target Product Profiles using Sophie's multi-agent orchestration")
 
+    mode = st.radio("Generate", ["Single drug", "Batch from CSV"], horizontal=True, label_visibility="collapsed")
+    if mode == "Batch from CSV":
+        show_tpp_batch()
+        return
+
     # Drug name input
     drug_name = st.text_input(
         "Drug Name",
@@ -499,108 +1426,601 @@ def show_tpp_generator():
         help="Specify the therapeutic area to focus the analysis"
     )
 
-    # TPP components to include
-    st.markdown("### TPP Components to Include")
-    col1, col2, col3 = st.columns(3)
-
-    with col1:
-        include_product = st.checkbox("Product Architecture", value=True)
-        include_clinical = st.checkbox("Clinical Strategy", value=True)
-    with col2:
-        include_regulatory = st.checkbox("Regulatory Pathway", value=True)
-        include_financial = st.checkbox("Financial Analysis", value=True)
-    with col3:
-        include_market = st.checkbox("Market Assessment", value=True)
-        include_ip = st.checkbox("IP Landscape", value=True)
+    components = select_tpp_components()
+    prewarm_tpp_agents(components)
 
     # Generate button
     col1, col2 = st.columns([2, 1])
     with col1:
         generate_button = st.button("🧠 Generate TPP with Sophie", use_container_width=True)
+    with col2:
+        run_in_background = st.checkbox(
+            "Run in background",
+            help="Queue the TPP as a background job and keep working; collect it later from History"
+        )
 
-    if generate_button and drug_name:
-        # Build comprehensive query
-        components = []
-        if include_product:
-            components.append("product architecture and formulation strategy")
-        if include_clinical:
-            components.append("clinical trial design and enrollment strategy")
-        if include_regulatory:
-            components.append("regulatory pathway and FDA strategy")
-        if include_financial:
-            components.append("valuation and investment potential")
-        if include_market:
-            components.append("market access and competitive landscape")
-        if include_ip:
-            components.append("patent landscape and IP strategy")
-
-        therapeutic_context = f" in {therapeutic_area}" if therapeutic_area else ""
-
-        message = f"""Generate a comprehensive Target Product Profile for {drug_name}{therapeutic_context}.
+    if generate_button and drug_name and run_in_background:
+        message = build_tpp_prompt(drug_name, therapeutic_area, components)
+        job_id = submit_tpp_job(drug_name, therapeutic_area, message)
+        st.success(f"Queued TPP for **{drug_name}** (job `{job_id[:8]}`). You can leave this page while it runs.")
 
-Please analyze and provide insights on:
-{chr(10).join(f'- {comp}' for comp in components)}
+    elif generate_button and drug_name and components:
+        message = build_tpp_prompt(drug_name, therapeutic_area, components)
 
-Use publicly available information and provide evidence-based recommendations with citations."""
+        st.markdown("---")
+        st.markdown(f"## Target Product Profile: {drug_name}")
 
-        # Invoke Sophie
-        response = invoke_sophie(message)
+        # At most one Sophie call, for the components with no stored result; the rest are merged back from earlier runs
+        progress = st.progress(0.0, text=f"Preparing {len(components)} components...")
+        with st.spinner("Sophie is orchestrating multiple agents for comprehensive analysis..."):
+            response, results = generate_tpp(drug_name, therapeutic_area, components, progress)
+        progress.empty()
 
         # Save to history
-        st.session_state.tpp_history.append({
-            "drug_name": drug_name,
-            "therapeutic_area": therapeutic_area or "Not specified",
-            "response": response,
-            "timestamp": datetime.now().isoformat()
-        })
+        record_tpp(message, response, drug_name, therapeutic_area or "Not specified")
 
         # Display response
-        st.markdown("---")
-        st.markdown(f"## Target Product Profile: {drug_name}")
+        show_component_status(results, components)
         display_sophie_response(response)
 
-        # Download option
+        # Download option; the compact copy is only serialized if the button is clicked
         st.markdown("---")
-        tpp_json = json.dumps(response, indent=2)
+        compact = CompactResponse.from_dict({k: v for k, v in response.items() if k != "_meta"})
         st.download_button(
             label="📥 Download TPP as JSON",
-            data=tpp_json,
+            data=deferred_download(lambda: compact.to_json(indent=True)),
             file_name=f"TPP_{drug_name.replace(' ', '_')}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
             mime="application/json"
         )
 
+    elif generate_button and drug_name:
+        st.warning("Select at least one TPP component.")
+
+    show_job_status()
+
+def show_corpus_search():
+    """Semantic and keyword search over the local agent corpora"""
+    st.markdown("## 🔎 Corpus Search")
+    st.markdown("Search the documents the agents draw on, by meaning or by keyword")
+
+    query = st.text_input(
+        "Search the corpus",
+        placeholder="e.g., rNPV probability of success by phase"
+    )
+
+    col1, col2, col3 = st.columns([2, 1, 1])
+    with col1:
+        agent_filter = st.multiselect(
+            "Agents",
+            options=list(AGENTS.keys()),
+            format_func=lambda x: f"{AGENTS[x]['icon']} {x}",
+            help="Leave empty to search every agent's corpus"
+        )
+    with col2:
+        method = st.radio("Method", ["Semantic", "Keyword"], horizontal=True)
+    with col3:
+        limit = st.number_input("Results", min_value=1, max_value=25, value=8)
+
+    embedding_index = get_embedding_index()
+    if not query:
+        stats = embedding_index.stats()
+        st.caption(
+            f"{stats['documents']} documents · {stats['chunks']} chunks · "
+            f"{stats['embedder']} ({stats['dim']}-d {stats['dtype']})"
+        )
+        return
+
+    st.markdown("---")
+    if method == "Semantic":
+        embedding_index.maybe_refresh()
+        started = time.perf_counter()
+        hits = embedding_index.search(query, agents=agent_filter or None, limit=int(limit))
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        searched = f"{embedding_index.stats()['chunks']} chunks"
+    else:
+        corpus_index.maybe_refresh()
+        started = time.perf_counter()
+        hits = corpus_index.search(query, agents=agent_filter or None, limit=int(limit))
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        searched = f"{corpus_index.stats()['documents']} documents"
+
+    st.caption(f"{len(hits)} results · searched {searched} in {elapsed_ms:.1f} ms")
+    if not hits:
+        st.info("No matching passages. Agents without documents in corpus-downloads (e.g. NORA) have nothing to search yet.")
+        return
+
+    for i, hit in enumerate(hits, 1):
+        icon = AGENTS.get(hit.agent, SOPHIE_CONFIG)['icon']
+        st.markdown(f"**{i}. {hit.title}** · {icon} {hit.agent} / {hit.category} · score {hit.score:.2f}")
+        st.caption(f"{hit.source} · {hit.legal_status}" + (f" · {hit.url}" if hit.url else ""))
+        if method == "Semantic":
+            with st.expander(hit.heading or "Passage"):
+                st.markdown(hit.text)
+        elif hit.excerpt:
+            st.text(hit.excerpt)
+
 def show_history():
     """Display query history"""
     st.markdown("## 📊 Query History")
 
-    tab1, tab2 = st.tabs(["💬 Agent Chats", "🎯 TPP Reports"])
+    tab1, tab2, tab3, tab4 = st.tabs(["💬 Agent Chats", "🎯 TPP Reports", "⏳ Background Jobs", "📦 Export & Analytics"])
+
+    owner = get_client_id()
 
     with tab1:
         st.markdown("### Agent Chat History")
-        if st.session_state.chat_history:
-            for agent, history in st.session_state.chat_history.items():
-                if history:
-                    st.markdown(f"#### {AGENTS[agent]['icon']} {AGENTS[agent]['full_name']}")
-                    for idx, item in enumerate(reversed(history), 1):
-                        with st.expander(f"{idx}. {item['query'][:80]}... ({item['timestamp'].split('T')[0]})"):
-                            st.markdown(f"**Query:** {item['query']}")
-                            st.markdown(f"**Time:** {item['timestamp']}")
-                            display_agent_response(item['response'], agent)
+        col1, col2 = st.columns([1, 2])
+        with col1:
+            agent_filter = st.selectbox(
+                "Agent",
+                options=["All"] + list(AGENTS.keys()),
+                format_func=lambda x: x if x == "All" else f"{AGENTS[x]['icon']} {AGENTS[x]['name']}",
+                key="history_chat_agent"
+            )
+        with col2:
+            chat_search = st.text_input("Search queries and responses", key="history_chat_search")
+
+        agent = None if agent_filter == "All" else agent_filter
+        total = history_store.count(owner, KIND_CHAT, agent, chat_search)
+        if total:
+            page_key = f"history_chat_{agent_filter}_{chat_search}"
+            offset, limit = paginate(total, page_key)
+            st.caption(f"{total} matching chats · select a row to view the full response")
+            rows = history_store.page(owner, KIND_CHAT, agent, chat_search, offset, limit)
+
+            # Only the selected entry's response is loaded and rendered
+            selected_id = show_history_table(rows, KIND_CHAT, f"{page_key}_{offset}_{limit}_table")
+            item = history_store.get(owner, selected_id) if selected_id is not None else None
+            if item:
+                st.markdown("---")
+                st.markdown(f"**Query:** {item['query']}")
+                st.markdown(f"**Time:** {item['timestamp']}")
+                display_agent_response(item['response'], item['agent'])
+        elif agent or chat_search:
+            st.info("No chats match these filters.")
         else:
             st.info("No chat history yet. Start a conversation in Agent Chat!")
 
     with tab2:
         st.markdown("### Target Product Profile History")
-        if st.session_state.tpp_history:
-            for idx, item in enumerate(reversed(st.session_state.tpp_history), 1):
-                with st.expander(f"{idx}. {item['drug_name']} - {item['therapeutic_area']} ({item['timestamp'].split('T')[0]})"):
+        tpp_search = st.text_input("Search drugs, queries and analyses", key="history_tpp_search")
+
+        total = history_store.count(owner, KIND_TPP, search=tpp_search)
+        if total:
+            page_key = f"history_tpp_{tpp_search}"
+            offset, limit = paginate(total, page_key)
+            st.caption(f"{total} matching reports · select a row to view the full report")
+            rows = history_store.page(owner, KIND_TPP, search=tpp_search, offset=offset, limit=limit)
+
+            # Only the selected report is loaded and rendered
+            selected_id = show_history_table(rows, KIND_TPP, f"{page_key}_{offset}_{limit}_table")
+            item = history_store.get(owner, selected_id) if selected_id is not None else None
+            if item:
+                st.markdown("---")
+                if item['drug_name']:
                     st.markdown(f"**Drug:** {item['drug_name']}")
                     st.markdown(f"**Therapeutic Area:** {item['therapeutic_area']}")
-                    st.markdown(f"**Generated:** {item['timestamp']}")
-                    st.markdown("---")
-                    display_sophie_response(item['response'])
+                else:
+                    st.markdown(f"**Query:** {item['query']}")
+                st.markdown(f"**Generated:** {item['timestamp']}")
+                display_sophie_response(item['response'])
+                st.download_button(
+                    label="📥 Download TPP as JSON",
+                    data=deferred_download(lambda: history_store.get_response_json(owner, item['id'])),
+                    file_name=f"TPP_{(item['drug_name'] or 'report').replace(' ', '_')}_{item['id']}.json",
+                    mime="application/json",
+                    key=f"download_tpp_{item['id']}"
+                )
+        elif tpp_search:
+            st.info("No reports match this search.")
         else:
             st.info("No TPP history yet. Generate your first TPP!")
 
+    with tab3:
+        st.markdown("### Background TPP Jobs")
+        jobs = job_runner.store.list_for_owner(owner, limit=50)
+        if jobs:
+            st.caption("Select a finished job to view its report")
+            event = st.dataframe(
+                [{
+                    "Drug": job['params']['drug_name'],
+                    "Therapeutic Area": job['params']['therapeutic_area'],
+                    "Status": job['status'],
+                    "Submitted": datetime.fromtimestamp(job['created_at']).isoformat(timespec='seconds')
+                } for job in jobs],
+                on_select="rerun",
+                selection_mode="single-row",
+                hide_index=True,
+                use_container_width=True,
+                key="history_jobs_table"
+            )
+
+            # Only the selected job's result is loaded and rendered
+            if event.selection.rows:
+                job = job_runner.store.get(jobs[event.selection.rows[0]]['id'])
+                st.markdown("---")
+                if job['status'] in PENDING_STATUSES:
+                    st.info("Still running. Refresh this page to check again.")
+                elif job['result'] is not None:
+                    display_sophie_response(job['result'])
+                    if job['status'] == JOB_SUCCEEDED:
+                        st.download_button(
+                            label="📥 Download TPP as JSON",
+                            data=deferred_download(lambda: json_dumps(job['result'], indent=True)),
+                            file_name=f"TPP_{job['label'].replace(' ', '_')}_{job['id'][:8]}.json",
+                            mime="application/json",
+                            key=f"download_job_{job['id']}"
+                        )
+                else:
+                    st.error(f"Error: {job['error']}")
+        else:
+            st.info("No background jobs yet. Tick \"Run in background\" on the Generate TPP page.")
+
+    with tab4:
+        show_history_export(owner)
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def history_analytics(owner: str, kind: Optional[str], version: int) -> Dict[str, Any]:
+    """Aggregates of a browser's history; `version` keys the cache so new entries invalidate it"""
+    # From the summary columns only; no response is decoded
+    return analyze(load_columns(iter_records(history_store, owner, kind)))
+
+def show_history_export(owner: str):
+    """Download this browser's whole history as JSONL/Parquet/Arrow, and aggregates computed from the same columns"""
+    st.markdown("### Export & Analytics")
+    kinds = {"All": None, "Agent chats": KIND_CHAT, "TPP reports": KIND_TPP}
+    col1, col2, col3 = st.columns([1, 1, 1])
+    with col1:
+        scope = st.selectbox("Entries", list(kinds), key="history_export_kind")
+    with col2:
+        fmt = st.selectbox("Format", FORMATS, format_func=lambda f: {"jsonl": "JSONL", "parquet": "Parquet", "arrow": "Arrow IPC"}[f], key="history_export_format")
+    with col3:
+        include_responses = st.checkbox("Include full responses", key="history_export_responses")
+    kind = kinds[scope]
+
+    total = sum(history_store.count(owner, k) for k in ([kind] if kind else [KIND_CHAT, KIND_TPP]))
+    if not total:
+        st.info("No history to export yet.")
+        return
+    st.caption(
+        f"{total} entries, one row each: agent, confidence, sources, conflicts, latency and error flag"
+        + (", plus the full response." if include_responses else ". Responses are left out unless included.")
+        + ("" if len(FORMATS) > 1 else " Install `pyarrow` for Parquet and Arrow.")
+    )
+    st.download_button(
+        label=f"📥 Download {total} entries",
+        data=deferred_download(lambda: b"".join(export_history(history_store, fmt, owner, kind, include_responses))),
+        file_name=f"socratiq_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{FILE_EXTENSIONS[fmt]}",
+        mime=MIME_TYPES[fmt],
+        key="history_export_download"
+    )
+
+    summary = history_analytics(owner, kind, history_store.version(owner))
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Agent Chats", summary['chats'])
+    with col2:
+        st.metric("TPP Reports", summary['tpps'])
+    with col3:
+        st.metric("Error Rate", f"{summary['error_rate']:.1%}")
+
+    def pct(value):
+        return f"{value:.0%}" if value is not None else "-"
+
+    def ms(value):
+        return round(value) if value is not None else None
+
+    st.dataframe(
+        [{
+            "Agent": row['agent'],
+            "Entries": row['entries'],
+            "Confidence p10": pct(row['confidence_p10']),
+            "Confidence p50": pct(row['confidence_p50']),
+            "Confidence p90": pct(row['confidence_p90']),
+            "Sources (mean)": round(row['sources_mean'], 1),
+            "With Conflicts": f"{row['conflict_rate']:.0%}",
+            "Conflicts (mean)": round(row['conflicts_mean'], 1),
+            "Latency p50 (ms)": ms(row['latency_p50_ms']),
+            "Latency p95 (ms)": ms(row['latency_p95_ms']),
+            "Error Rate": f"{row['error_rate']:.1%}"
+        } for row in summary['by_agent']],
+        hide_index=True,
+        use_container_width=True
+    )
+    if any(bin_['entries'] for bin_ in summary['confidence_histogram']):
+        st.caption("Confidence distribution")
+        st.bar_chart(
+            {
+                "Confidence": [bin_['bin'] for bin_ in summary['confidence_histogram']],
+                "Entries": [bin_['entries'] for bin_ in summary['confidence_histogram']]
+            },
+            x="Confidence",
+            y="Entries"
+        )
+
+def show_admission_queue():
+    """Concurrency caps, queue depth and queue wait per function and priority class"""
+    stats = admission_controller.stats()
+    if not any(function['admitted'] or function['queued'] for function in stats['functions'].values()):
+        return
+
+    st.markdown("### Admission Queue")
+    st.caption(
+        f"Invocations wait here for a free slot on their function. TPP and batch calls also need a token from their "
+        f"browser's budget ({USER_INVOKE_RATE:g}/s, bursts of {USER_INVOKE_BURST:g}). Chat goes ahead of TPP generation, "
+        f"and TPP goes ahead of batch items."
+    )
+    st.dataframe(
+        [{
+            "Agent": agent,
+            "Limit": function['limit'],
+            "In Flight": function['in_flight'],
+            "Queued Now": function['queued'],
+            "Admitted": function['admitted'],
+            "Had to Wait": function['queued_calls'],
+            "Timed Out": function['timed_out'],
+            "Mean Call (s)": round(function['service_s'], 1)
+        } for agent, function in stats['functions'].items()],
+        hide_index=True,
+        use_container_width=True
+    )
+    st.dataframe(
+        [{
+            "Priority": name,
+            "Queued Now": priority['queued'],
+            "Calls (window)": priority['calls'],
+            "Wait p50 (ms)": round(priority['wait_p50_ms']),
+            "Wait p95 (ms)": round(priority['wait_p95_ms']),
+            "Wait p99 (ms)": round(priority['wait_p99_ms'])
+        } for name, priority in stats['priorities'].items()],
+        hide_index=True,
+        use_container_width=True
+    )
+
+def show_session_memory():
+    """Session state memory, the heaviest sessions and the server's memory trend"""
+    stats = session_memory.stats()
+    st.markdown("### Session Memory")
+    st.caption(
+        "Recent queries kept in session state, estimated when stored; responses stay in the history store. "
+        f"Sessions idle for {SESSION_IDLE_TIMEOUT / 60:.0f} min are evicted."
+    )
+    samples = stats['samples']
+    rss = samples[-1]['rss_bytes'] if samples else None
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Sessions", stats['sessions'])
+    with col2:
+        st.metric("Session State", f"{stats['state_bytes'] / 1024:,.0f} KB")
+    with col3:
+        st.metric("Entries Tracked", stats['tracked'])
+    with col4:
+        st.metric("Sessions Evicted", stats['evicted_sessions'], help=f"{stats['evicted_bytes'] / 1024:,.0f} KB freed")
+
+    heaviest = session_memory.heaviest()
+    if heaviest:
+        st.dataframe(
+            [{
+                "Session": row['session'][:8],
+                "Browser": row['label'],
+                "Entries": row['entries'],
+                "Size (KB)": round(row['bytes'] / 1024, 1),
+                "Idle (s)": round(row['idle_s'])
+            } for row in heaviest],
+            hide_index=True,
+            use_container_width=True
+        )
+
+    if len(samples) > 1:
+        st.caption(f"Server memory (MB), sampled every {session_memory.sample_interval:.0f} s" + (f"; RSS now {rss / 2**20:,.0f} MB" if rss else ""))
+        st.line_chart(
+            {
+                "time": [datetime.fromtimestamp(sample['time']) for sample in samples],
+                "RSS": [(sample['rss_bytes'] or 0) / 2**20 for sample in samples],
+                "Session state": [sample['state_bytes'] / 2**20 for sample in samples],
+                **({"Traced": [(sample['traced_bytes'] or 0) / 2**20 for sample in samples]} if stats['tracing'] else {})
+            },
+            x="time"
+        )
+    if stats['top_allocations']:
+        with st.expander("🧮 Top allocation sites (tracemalloc)"):
+            st.dataframe(
+                [{
+                    "Location": site['location'],
+                    "Size (KB)": round(site['bytes'] / 1024, 1),
+                    "Blocks": site['blocks']
+                } for site in stats['top_allocations']],
+                hide_index=True,
+                use_container_width=True
+            )
+
+def show_warmup_latency():
+    """Cold versus warm round trips per function, from real calls and keep-warm pings"""
+    warm_states = warmup_scheduler.stats()
+    if not any(stats['pings'] or stats['cold_calls'] or stats['warm_calls'] for stats in warm_states.values()):
+        return
+
+    def ms(value: Optional[float]) -> Optional[int]:
+        return None if value is None else round(value)
+
+    st.markdown("### Cold vs Warm Latency")
+    st.caption(
+        f"Calls and pings more than {COLD_AFTER:.0f} s after a function's last activity count as cold. "
+        + (f"Keep-warm pings run every {KEEP_WARM_INTERVAL:.0f} s while sessions are active."
+           if warmup_scheduler.enabled else "Keep-warm pings are disabled (SOCRATIQ_KEEP_WARM_INTERVAL=0).")
+    )
+    st.dataframe(
+        [{
+            "Agent": agent,
+            "State": {STATE_WARM: "🟢 warm", STATE_COLD: "🔵 cold"}.get(stats['state'], "⚪ unknown"),
+            "Idle (s)": ms(stats['idle_s']),
+            "Cold Calls": stats['cold_calls'],
+            "Cold p50 (ms)": ms(stats['cold_call_p50_ms']),
+            "Warm Calls": stats['warm_calls'],
+            "Warm p50 (ms)": ms(stats['warm_call_p50_ms']),
+            "Pings": stats['pings'],
+            "Failed Pings": stats['ping_failures'],
+            "Cold Ping p50 (ms)": ms(stats['cold_ping_p50_ms']),
+            "Warm Ping p50 (ms)": ms(stats['warm_ping_p50_ms'])
+        } for agent, stats in warm_states.items()],
+        hide_index=True,
+        use_container_width=True
+    )
+
+def show_panel_timings():
+    """Run-time percentiles for full page runs and fragment reruns"""
+    panels = call_metrics.panel_summary()
+    if not panels:
+        return
+    st.markdown("### UI Rerun Times")
+    st.caption(
+        "Page rows time a full script run of the page body; other rows time fragment reruns. "
+        "Percentiles leave out time spent waiting on agent calls; the last column includes it"
+    )
+    st.dataframe(
+        [{
+            "Panel": panel,
+            "Runs (window)": stats['runs'],
+            "p50 (ms)": round(stats['p50_ms'], 1),
+            "p95 (ms)": round(stats['p95_ms'], 1),
+            "p99 (ms)": round(stats['p99_ms'], 1),
+            "p95 with Calls (ms)": round(stats['with_calls_p95_ms'], 1)
+        } for panel, stats in panels.items()],
+        hide_index=True,
+        use_container_width=True
+    )
+
+def show_performance():
+    """Client-side latency, error and cache metrics for agent calls"""
+    st.markdown("## 📈 Performance")
+    st.markdown("Client-observed timings for agent calls made by this app server across all sessions (recent window)")
+
+    summary = call_metrics.summary()
+    if not summary:
+        st.info("No agent calls recorded yet. Ask an agent or generate a TPP to collect timings.")
+        show_warmup_latency()
+        show_panel_timings()
+        show_session_memory()
+        return
+
+    # Overview
+    cache_stats = response_cache.stats()
+    inflight_stats = inflight_requests.stats()
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Calls Recorded", sum(stats['counters'].get('calls', 0) for stats in summary.values()))
+    with col2:
+        st.metric("Errors", sum(stats['counters'].get('errors', 0) for stats in summary.values()))
+    with col3:
+        st.metric("Cache Hit Rate", f"{cache_stats['hit_rate']:.1%}")
+    with col4:
+        st.metric("Calls Coalesced", inflight_stats['coalesced'])
+
+    # Per-agent latency percentiles
+    st.markdown("### Latency by Agent")
+    st.dataframe(
+        [{
+            "Agent": agent,
+            "Calls (window)": stats['window'],
+            "p50 (ms)": round(stats['p50_ms']),
+            "p95 (ms)": round(stats['p95_ms']),
+            "p99 (ms)": round(stats['p99_ms']),
+            "Error Rate": f"{stats['error_rate']:.1%}",
+            "Cache Hit Rate": f"{stats['cache_hit_rate']:.1%}",
+            "Coalesced": f"{stats['coalesced_rate']:.1%}"
+        } for agent, stats in summary.items()],
+        hide_index=True,
+        use_container_width=True
+    )
+
+    # Per-phase breakdown
+    st.markdown("### Phase Breakdown")
+    st.caption("queue (admission) → serialize → round_trip (Lambda) → parse (incl. API Gateway body decode) → render; first_byte applies to streamed calls")
+    st.dataframe(
+        [{
+            "Agent": agent,
+            "Phase": phase,
+            "p50 (ms)": round(stats['phases'][phase]['p50'], 2),
+            "p95 (ms)": round(stats['phases'][phase]['p95'], 2),
+            "p99 (ms)": round(stats['phases'][phase]['p99'], 2)
+        } for agent, stats in summary.items() for phase in PHASES if phase in stats['phases']],
+        hide_index=True,
+        use_container_width=True
+    )
+
+    # Retries, hedging and circuit breakers
+    breakers = resilient_invoker.snapshot()
+    if breakers:
+        st.markdown("### Resilience")
+        st.dataframe(
+            [{
+                "Agent": agent,
+                "Circuit": breaker['state'],
+                "Consecutive Failures": breaker['failures'],
+                "Trips": breaker['trips'],
+                "Attempts": breaker.get('attempts', 0),
+                "Retries": breaker.get('retries', 0),
+                "Hedges": breaker.get('hedges', 0),
+                "Hedge Wins": breaker.get('hedge_wins', 0),
+                "Hedge After (ms)": round(breaker['hedge_delay_ms']) if breaker['hedge_delay_ms'] is not None else None
+            } for agent, breaker in breakers.items()],
+            hide_index=True,
+            use_container_width=True
+        )
+
+    show_admission_queue()
+
+    # Local routing of Home questions
+    routing_stats = query_router.stats()
+    if routing_stats['decisions']:
+        st.markdown("### Sophie Routing")
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("Questions Classified", routing_stats['decisions'])
+        with col2:
+            st.metric("Routed to One Agent", routing_stats['routed'], help=", ".join(
+                f"{agent}: {count}" for agent, count in sorted(routing_stats['by_agent'].items())
+            ) or None)
+        with col3:
+            st.metric("Sent on to Sophie", routing_stats['overridden'])
+        with col4:
+            st.metric("Round Trips Avoided", routing_stats['round_trips_avoided'])
+
+    show_warmup_latency()
+    show_panel_timings()
+    show_session_memory()
+
+    # Individual traces
+    with st.expander("🔎 Recent Calls"):
+        st.dataframe(
+            [{
+                "Trace ID": trace['trace_id'],
+                "Agent": trace['agent'],
+                "Started": datetime.fromtimestamp(trace['started_at']).strftime("%H:%M:%S"),
+                "Total (ms)": round(trace['total_ms'] or 0),
+                **{f"{phase} (ms)": round(trace[f"{phase}_ms"], 1) if trace[f"{phase}_ms"] is not None else None for phase in PHASES},
+                "Retries": trace['retries'],
+                "Hedged": trace['hedged'],
+                "Outcome": (
+                    "circuit open" if trace['circuit_open'] else "error" if trace['error']
+                    else "cache hit" if trace['cache_hit'] else "coalesced" if trace['coalesced'] else "ok"
+                )
+            } for trace in call_metrics.recent(50)],
+            hide_index=True,
+            use_container_width=True
+        )
+
+    # Export
+    st.markdown("### Export")
+    prometheus_text = call_metrics.to_prometheus() + admission_controller.to_prometheus() + session_memory.to_prometheus()
+    st.download_button(
+        label="📥 Download Prometheus metrics",
+        data=prometheus_text,
+        file_name="socratiq_metrics.prom",
+        mime="text/plain"
+    )
+    with st.expander("Prometheus text format"):
+        st.code(prometheus_text, language="text")
+
 if __name__ == "__main__":
     main()